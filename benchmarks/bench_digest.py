@@ -0,0 +1,29 @@
+"""
+Compare the per-token verification cost of the digest schemes.
+
+    python -m benchmarks.bench_digest --iterations 200000
+"""
+import argparse
+import timeit
+
+from benchmarks import setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=100000)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from knightauth import crypto
+
+    token = crypto.create_token_string()
+    print('%-12s %12s %8s' % ('scheme', 'ns/token', 'digest'))
+    for name, scheme in crypto.DIGEST_SCHEME_NAMES.items():
+        seconds = timeit.timeit(lambda: crypto.hash_token(token, scheme), number=args.iterations)
+        print('%-12s %12.0f %8d' % (name, seconds / args.iterations * 1e9, len(crypto.hash_token(token, scheme))))
+
+
+if __name__ == '__main__':
+    main()
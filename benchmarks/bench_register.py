@@ -0,0 +1,140 @@
+"""
+Measure register throughput: the validation pipeline on its own, against
+the per-request validation it replaced, and the whole endpoint.
+
+    python -m benchmarks.bench_register --iterations 2000
+    python -m benchmarks.bench_register --mmap-path /tmp/common-passwords.txt
+"""
+import argparse
+import json
+import time
+from collections import namedtuple
+
+from benchmarks import setup_django, test_database
+
+SCENARIOS = ('validate', 'validate-uncached', 'register')
+PASSWORD = 'Correct-Horse-42'
+
+Result = namedtuple('Result', ['scenario', 'ops_per_s', 'mean_us'])
+
+
+def payload(index):
+    from knightauth.schemas import UserRegisterSchema
+
+    return UserRegisterSchema(
+        username='bench-%d' % index,
+        email='bench-%d@example.com' % index,
+        password=PASSWORD,
+        password_confirm=PASSWORD,
+    )
+
+
+def validate_uncached(payload):
+    """What register did before the pipeline, validators built per request."""
+    from django.conf import settings
+    from django.contrib.auth.password_validation import get_password_validators, validate_password
+    from django.core.exceptions import ValidationError
+    from django.core.validators import EmailValidator
+
+    try:
+        validate_password(payload.password, password_validators=get_password_validators(
+            settings.AUTH_PASSWORD_VALIDATORS
+        ))
+    except ValidationError as e:
+        return e.messages
+    if payload.password != payload.password_confirm:
+        return "Password does not match"
+    try:
+        EmailValidator()(payload.email)
+    except ValidationError as e:
+        return e.messages
+    return None
+
+
+def run_scenarios(iterations, scenarios=SCENARIOS):
+    from django.test import Client
+    from django.urls import reverse
+
+    from knightauth.validation import get_registration_validator
+
+    client = Client()
+    url = reverse('api-1.0.0:register_user')
+    counter = iter(range(10 ** 9))
+
+    def register(_):
+        index = next(counter)
+        response = client.post(url, data={
+            'username': 'bench-%d' % index,
+            'email': 'bench-%d@example.com' % index,
+            'password': PASSWORD,
+            'password_confirm': PASSWORD,
+        }, content_type='application/json')
+        assert response.status_code == 201, (response.status_code, response.content)
+
+    def validate(payload):
+        assert get_registration_validator().validate(payload) is None
+
+    def uncached(payload):
+        assert validate_uncached(payload) is None
+
+    runners = {'validate': validate, 'validate-uncached': uncached, 'register': register}
+    payloads = [payload(index) for index in range(iterations)]
+
+    results = []
+    for scenario in scenarios:
+        run = runners[scenario]
+        run(payloads[0])
+        start = time.perf_counter()
+        for item in payloads:
+            run(item)
+        elapsed = time.perf_counter() - start
+        results.append(Result(scenario, iterations / elapsed, elapsed / iterations * 1e6))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=1000)
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS, help='Defaults to every scenario.')
+    parser.add_argument(
+        '--mmap-path',
+        default=None,
+        help='Use CompactCommonPasswordValidator with this memory-mapped snapshot.'
+    )
+    parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.conf import settings
+    from django.test import override_settings
+
+    validators = [
+        {
+            'NAME': 'knightauth.validation.CompactCommonPasswordValidator',
+            'OPTIONS': {'mmap_path': args.mmap_path},
+        } if args.mmap_path and validator['NAME'].endswith('.CommonPasswordValidator') else validator
+        for validator in settings.AUTH_PASSWORD_VALIDATORS
+    ]
+
+    # Password hashing would dominate register, which is not what this suite measures.
+    with test_database(), override_settings(
+            AUTH_PASSWORD_VALIDATORS=validators,
+            PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher']
+    ):
+        results = run_scenarios(args.iterations, args.scenario or SCENARIOS)
+
+    if args.json:
+        print(json.dumps({
+            'iterations': args.iterations,
+            'results': [result._asdict() for result in results],
+        }, indent=2))
+    else:
+        print('%d iterations' % args.iterations)
+        print('%-18s %12s %10s' % ('scenario', 'ops/s', 'mean us'))
+        for result in results:
+            print('%-18s %12.0f %10.1f' % result)
+
+
+if __name__ == '__main__':
+    main()
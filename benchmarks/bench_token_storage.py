@@ -0,0 +1,67 @@
+"""
+Compare table size and lookup latency of AuthToken and CompactAuthToken.
+
+    python -m benchmarks.bench_token_storage --tokens 50000 --lookups 2000
+"""
+import argparse
+import random
+import time
+
+from benchmarks import relation_size, setup_django, test_database
+
+
+def populate(token_model, user, count):
+    tokens = []
+    batch = []
+    for _ in range(count):
+        fields, token = token_model.objects._generate_token(user, None, '')
+        batch.append(token_model(**fields))
+        tokens.append(token)
+        if len(batch) == 1000:
+            token_model.objects.bulk_create(batch)
+            batch = []
+    token_model.objects.bulk_create(batch)
+    return tokens
+
+
+def measure_lookups(tokens, lookups):
+    from knightauth.auth import TokenAuthentication
+
+    authentication = TokenAuthentication()
+    sample = random.sample(tokens, min(lookups, len(tokens)))
+    start = time.perf_counter()
+    for token in sample:
+        user, _ = authentication.authenticate_credentials(token)
+        assert user is not None
+    return (time.perf_counter() - start) / len(sample)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tokens', type=int, default=20000)
+    parser.add_argument('--lookups', type=int, default=1000)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.contrib.auth import get_user_model
+    from django.test import override_settings
+
+    from knightauth.models import AuthToken, CompactAuthToken
+
+    with test_database() as connection:
+        user = get_user_model().objects.create_user(username='bench', password='bench')
+        print('%-18s %12s %14s %14s' % ('model', 'tokens', 'bytes/token', 'us/lookup'))
+        for token_model in (AuthToken, CompactAuthToken):
+            label = token_model._meta.label
+            with override_settings(KNIGHT_AUTH={'TOKEN_MODEL': label}):
+                tokens = populate(token_model, user, args.tokens)
+                size = relation_size(connection, token_model)
+                latency = measure_lookups(tokens, args.lookups)
+            print('%-18s %12d %14.1f %14.1f' % (
+                token_model.__name__, args.tokens, size / args.tokens, latency * 1e6
+            ))
+
+
+if __name__ == '__main__':
+    main()
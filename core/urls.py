@@ -1,14 +1,14 @@
 from django.contrib import admin
 from django.urls import path
 from ninja import NinjaAPI
-from ninja.security import django_auth
 
+from knightauth import async_api
 from knightauth.api import token_auth_router, register_router, session_auth_router
-from knightauth.auth import TokenAuthentication
+from knightauth.auth import AsyncTokenAuthentication, TokenAuthentication, session_fallback_auth
 
 api = NinjaAPI(
     title='KnightAuth',
-    auth=[TokenAuthentication(), django_auth],
+    auth=[TokenAuthentication(), session_fallback_auth],
 )
 api.add_router('auth/', token_auth_router)
 api.add_router('auth/session/', session_auth_router)
@@ -20,7 +20,22 @@ def token_test(request):
     return {'message': 'Hello, world!', 'user': request.auth.username}
 
 
+async_api_v1 = NinjaAPI(
+    title='KnightAuth (async)',
+    urls_namespace='async-api',
+    auth=AsyncTokenAuthentication(),
+)
+async_api_v1.add_router('auth/', async_api.token_auth_router)
+async_api_v1.add_router('auth/', async_api.register_router)
+
+
+@async_api_v1.get('/test', url_name='test')
+async def async_token_test(request):
+    return {'message': 'Hello, world!', 'user': request.auth.username}
+
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/v1/', api.urls),
+    path('api/v1/async/', async_api_v1.urls),
 ]
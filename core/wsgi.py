@@ -10,7 +10,15 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/wsgi/
 import os
 
 from django.core.wsgi import get_wsgi_application
+from django.db import connections
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_wsgi_application()
+
+# Build the token filter now rather than on the first request. Close the
+# connection the scan used, the server may fork workers from this process.
+from knightauth.token_filter import warm_up_token_filter  # noqa: E402
+
+warm_up_token_filter()
+connections.close_all()
@@ -1,10 +1,63 @@
 from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList
 
 from knightauth import models
+from knightauth.pagination import InvalidCursor, KeysetPaginator
+
+CURSOR_VAR = 'cursor'
+
+
+class CursorChangeList(ChangeList):
+    """
+    Changelist paged with a keyset cursor over the creation time, with the
+    primary key breaking ties, so token tables with millions of rows are
+    listed without COUNT(*) or OFFSET.
+    """
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_results(self, request):
+        paginator = KeysetPaginator(self.queryset, fields=('created', 'pk'), per_page=self.list_per_page)
+        try:
+            result_list, next_cursor = paginator.page(request.GET.get(CURSOR_VAR))
+        except InvalidCursor:
+            raise IncorrectLookupParameters
+
+        self.result_count = len(result_list)
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.result_list = result_list
+        self.can_show_all = False
+        self.multi_page = next_cursor is not None
+        self.paginator = paginator
+        self.next_page_url = self.get_query_string({CURSOR_VAR: next_cursor}) if next_cursor else None
+        self.first_page_url = self.get_query_string(remove=[CURSOR_VAR]) if CURSOR_VAR in request.GET else None
+
+
+class CursorPaginationMixin:
+    change_list_template = 'admin/knightauth/cursor_change_list.html'
+    show_full_result_count = False
+    # The cursor fixes the order, newest token first.
+    sortable_by = ()
+
+    def get_changelist(self, request, **kwargs):
+        return CursorChangeList
 
 
 @admin.register(models.AuthToken)
-class AuthTokenAdmin(admin.ModelAdmin):
+class AuthTokenAdmin(CursorPaginationMixin, admin.ModelAdmin):
     list_display = ('digest', 'user', 'created',)
     fields = ()
     raw_id_fields = ('user',)
+
+
+@admin.register(models.CompactAuthToken)
+class CompactAuthTokenAdmin(CursorPaginationMixin, admin.ModelAdmin):
+    list_display = ('id', 'user', 'created', 'expiry',)
+    fields = ()
+    raw_id_fields = ('user',)
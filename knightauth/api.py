@@ -1,16 +1,25 @@
+from typing import Optional
+
 from django.contrib.auth import authenticate, login as django_login, logout as django_logout, get_user_model
-from django.contrib.auth.password_validation import validate_password
-from django.core.validators import EmailValidator
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.signals import user_logged_in, user_logged_out
-from django.utils import timezone
-from django.core.exceptions import ValidationError
+from django.db import IntegrityError
 from django.views.decorators.csrf import ensure_csrf_cookie
-from ninja import Router
+from ninja import Query, Router
 from ninja.responses import Response
 
-from knightauth.models import get_token_model
-from knightauth.schemas import LoginIn, ErrorOut, LoginSuccessOut, UserRegisterSchema
-from knightauth.settings import knight_auth_settings
+from knightauth import metrics
+from knightauth.cache import invalidate_tokens
+from knightauth.executor import HashingOverloaded, overloaded_response, run_hashing
+from knightauth.introspection import deferred_token_fields, describe_token, request_user_id, token_paginator
+from knightauth.pagination import InvalidCursor
+from knightauth.quota import issue_login_token, release_token_slots
+from knightauth.registration import create_user, duplicate_user_message, email_taken
+from knightauth.revocation import revoke_all_tokens
+from knightauth.schemas import LoginIn, ErrorOut, LoginSuccessOut, TokenOut, TokenPageOut, UserRegisterSchema
+from knightauth.signing import load_signed_token, revoke_tokens
+from knightauth.throttling import throttle_login
+from knightauth.validation import get_registration_validator
 
 token_auth_router = Router()
 
@@ -18,40 +27,36 @@ token_auth_router = Router()
 @token_auth_router.post(
     "login",
     auth=None,
-    response={200: LoginSuccessOut, frozenset({401, 403}): ErrorOut},
+    response={200: LoginSuccessOut, frozenset({401, 403, 429, 503}): ErrorOut},
     url_name="token_login"
 )
 def token_login(request, payload: LoginIn):
-    if knight_auth_settings.TOKEN_LIMIT_PER_USER is not None:
-        now = timezone.now()
-        token_count = (
-            request
-            .user
-            .auth_token_set
-            .filter(created__gte=now)
-            .count()
-        )
+    throttled = throttle_login(request, payload.username)
+    if throttled is not None:
+        metrics.logins.inc('throttled')
+        return throttled
 
-        if token_count >= knight_auth_settings.TOKEN_LIMIT_PER_USER:
-            return 403, {"message": "Maximum amount of tokens allowed per user exceeded."}
-
-    user = authenticate(request, **payload.dict())
+    try:
+        with metrics.password_hash_seconds.time():
+            user = authenticate(request, **payload.dict())
+    except HashingOverloaded:
+        metrics.logins.inc('overloaded')
+        return overloaded_response()
 
     if user is None:
+        metrics.logins.inc('invalid')
         return 401, {"message": "Invalid credentials"}
 
-    instance, token = (
-        get_token_model()
-        .objects
-        .create(
-            user=user,
-            prefix=knight_auth_settings.TOKEN_PREFIX,
-            expiry=knight_auth_settings.TOKEN_TTL
-        )
-    )
+    issued = issue_login_token(user)
+    if issued is None:
+        metrics.logins.inc('limited')
+        return 403, {"message": "Maximum amount of tokens allowed per user exceeded."}
+
+    instance, token = issued
 
     user_logged_in.send(sender=user.__class__, request=request, user=user)
 
+    metrics.logins.inc('success')
     return 200, {
         "token": token,
         "expiry": instance.expiry
@@ -68,15 +73,22 @@ def token_logout(request):
                        ""
         }
 
-    request._auth.delete()
-    user_logged_out.send(sender=request.user.__class__, request=request, user=request.user)
+    if request._auth.is_signed:
+        revoke_tokens([request._auth])
+    else:
+        invalidate_tokens([request._auth.hexdigest])
+    if not request._auth.is_signed or load_signed_token(request._auth):
+        request._auth.delete()
+    release_token_slots([request._auth.user_id])
+    # request.user is the session's user, loading it would read the session.
+    user_logged_out.send(sender=get_user_model(), request=request, user=request.auth)
 
     return 204, None
 
 
 @token_auth_router.post("logoutall", response={204: None, 400: ErrorOut}, url_name="token_logoutall")
 def token_logout_all(request):
-    if not request.auth.auth_token_set.exists():
+    if not revoke_all_tokens(request.auth):
         return 400, {
             "message": ""
                        "Attempting to log out using an authentication method different from the one used for login."
@@ -84,15 +96,50 @@ def token_logout_all(request):
                        ""
         }
 
-    request.auth.auth_token_set.all().delete()
-    user_logged_out.send(sender=request.user.__class__, request=request, user=request.user)
+    user_logged_out.send(sender=get_user_model(), request=request, user=request.auth)
     return 204, None
 
 
+@token_auth_router.get("token", response={200: TokenOut, 400: ErrorOut}, url_name="token_introspect")
+def token_introspect(request):
+    if not getattr(request, "_auth", None):
+        return 400, {"message": "The request was not authenticated with a token."}
+
+    if request._auth.is_signed and not load_signed_token(request._auth):
+        return 400, {"message": "The token was revoked."}
+
+    deferred = deferred_token_fields(request._auth)
+    if deferred:
+        request._auth.refresh_from_db(fields=deferred)
+    return 200, describe_token(request._auth, current_pk=request._auth.pk)
+
+
+@token_auth_router.get("tokens", response={200: TokenPageOut, 400: ErrorOut}, url_name="token_list")
+def token_list(request, cursor: Optional[str] = None, limit: int = Query(20, ge=1, le=100)):
+    auth_token = getattr(request, "_auth", None)
+    try:
+        auth_tokens, next_cursor = token_paginator(request_user_id(request), limit).page(cursor)
+    except InvalidCursor as e:
+        return 400, {"message": str(e)}
+
+    if auth_token and auth_token.is_signed:
+        load_signed_token(auth_token)
+    current_pk = auth_token.pk if auth_token else None
+    return 200, {
+        "items": [describe_token(token, current_pk) for token in auth_tokens],
+        "next_cursor": next_cursor,
+    }
+
+
 session_auth_router = Router()
 
 
-@session_auth_router.post("login", auth=None, response={200: None, 400: ErrorOut}, url_name="session_login")
+@session_auth_router.post(
+    "login",
+    auth=None,
+    response={200: None, frozenset({400, 429, 503}): ErrorOut},
+    url_name="session_login"
+)
 def session_login(request, payload: LoginIn):
     username = payload.username
     password = payload.password
@@ -100,7 +147,14 @@ def session_login(request, payload: LoginIn):
     if username is None or password is None:
         return 400, {"message": "Please provide username and password."}
 
-    user = authenticate(username=username, password=password)
+    throttled = throttle_login(request, username)
+    if throttled is not None:
+        return throttled
+
+    try:
+        user = authenticate(username=username, password=password)
+    except HashingOverloaded:
+        return overloaded_response()
 
     if user is None:
         return 400, {"message": "Invalid credentials."}
@@ -128,36 +182,35 @@ def verify_session(request):
 register_router = Router()
 
 
-@register_router.post("register", auth=None, response={201: None, 400: ErrorOut}, url_name="register_user")
+@register_router.post(
+    "register",
+    auth=None,
+    response={201: None, frozenset({400, 503}): ErrorOut},
+    url_name="register_user"
+)
 def register(request, user_payload: UserRegisterSchema):
-    try:
-        validate_password(user_payload.password)
-    except ValidationError as e:
-        return 400, {"message": e.messages}
-
-    if user_payload.password != user_payload.password_confirm:
-        return 400, {"message": "Password does not match"}
-
-    email_validator = EmailValidator()
-    try:
-        email_validator(user_payload.email)
-    except ValidationError as e:
-        return 400, {"message": e.messages}
+    message = get_registration_validator().validate(user_payload)
+    if message is not None:
+        return 400, {"message": message}
 
     User = get_user_model()
 
-    email_exist = User.objects.filter(email=user_payload.email).exists()
-    if email_exist:
+    if email_taken(User, user_payload.email):
         return 400, {"message": "Email already exist"}
 
-    username_exist = User.objects.filter(username=user_payload.username).exists()
-    if username_exist:
-        return 400, {"message": "Username already exist"}
-
-    User.objects.create_user(
-        username=user_payload.username,
-        email=user_payload.email,
-        password=user_payload.password
-    )
+    try:
+        create_user(
+            User,
+            username=user_payload.username,
+            email=user_payload.email,
+            password=run_hashing(make_password, user_payload.password)
+        )
+    except HashingOverloaded:
+        return overloaded_response()
+    except IntegrityError:
+        message = duplicate_user_message(User, user_payload.username, user_payload.email)
+        if message is None:
+            raise
+        return 400, {"message": message}
 
     return 201, None
@@ -1,6 +1,42 @@
 from django.apps import AppConfig
+from django.contrib.auth import get_user_model
+from django.core.signals import request_finished, request_started
+from django.db.models.signals import post_save
 
 
 class BaseConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'knightauth'
+
+    def ready(self):
+        from knightauth.cache import invalidate_user_tokens
+        from knightauth.expiry import start_scheduler
+        from knightauth.hashers import check_hasher_settings
+        from knightauth.metrics import count_expired_token, count_expired_tokens, export_metrics_if_due
+        from knightauth.refresh import flush_refresh_buffer_if_due
+        from knightauth.revocation import revoke_tokens_on_password_change
+        from knightauth.settings import knight_auth_settings
+        from knightauth.signals import token_expired, tokens_expired
+        from knightauth.signing import revoke_user_tokens
+        from knightauth.token_filter import add_saved_token
+        from knightauth.validation import get_registration_validator
+
+        post_save.connect(invalidate_user_tokens, sender=get_user_model(), dispatch_uid='knightauth_invalidate_user_tokens')
+        post_save.connect(revoke_user_tokens, sender=get_user_model(), dispatch_uid='knightauth_revoke_user_tokens')
+        post_save.connect(
+            revoke_tokens_on_password_change,
+            sender=get_user_model(),
+            dispatch_uid='knightauth_revoke_tokens_on_password_change'
+        )
+        post_save.connect(add_saved_token, dispatch_uid='knightauth_add_saved_token')
+        request_finished.connect(flush_refresh_buffer_if_due, dispatch_uid='knightauth_flush_refresh_buffer')
+        request_finished.connect(export_metrics_if_due, dispatch_uid='knightauth_export_metrics')
+        token_expired.connect(count_expired_token, dispatch_uid='knightauth_count_expired_token')
+        tokens_expired.connect(count_expired_tokens, dispatch_uid='knightauth_count_expired_tokens')
+
+        check_hasher_settings()
+        # Load the password validators, and the common password list, before the first signup.
+        get_registration_validator()
+
+        if knight_auth_settings.EXPIRY_CLEANUP_INTERVAL is not None:
+            request_started.connect(start_scheduler, dispatch_uid='knightauth_expiry_scheduler')
@@ -0,0 +1,168 @@
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import aauthenticate, get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.db import IntegrityError
+from ninja import Query, Router
+
+from knightauth import metrics
+from knightauth.cache import ainvalidate_tokens
+from knightauth.executor import HashingOverloaded, arun_hashing, overloaded_response
+from knightauth.introspection import deferred_token_fields, describe_token, token_paginator
+from knightauth.pagination import InvalidCursor
+from knightauth.quota import arelease_token_slots, issue_login_token
+from knightauth.registration import aduplicate_user_message, aemail_taken, create_user
+from knightauth.revocation import arevoke_all_tokens
+from knightauth.schemas import LoginIn, ErrorOut, LoginSuccessOut, TokenOut, TokenPageOut, UserRegisterSchema
+from knightauth.signing import aload_signed_token, arevoke_tokens
+from knightauth.throttling import throttle_login
+from knightauth.validation import get_registration_validator
+
+AUTH_METHOD_MISMATCH = (
+    "Attempting to log out using an authentication method different from the one used for login."
+    "Consider using session authentication instead"
+)
+
+token_auth_router = Router()
+
+
+@token_auth_router.post(
+    "login",
+    auth=None,
+    response={200: LoginSuccessOut, frozenset({401, 403, 429, 503}): ErrorOut},
+    url_name="token_login"
+)
+async def token_login(request, payload: LoginIn):
+    throttled = await sync_to_async(throttle_login)(request, payload.username)
+    if throttled is not None:
+        metrics.logins.inc('throttled')
+        return throttled
+
+    try:
+        with metrics.password_hash_seconds.time():
+            user = await aauthenticate(request, **payload.dict())
+    except HashingOverloaded:
+        metrics.logins.inc('overloaded')
+        return overloaded_response()
+
+    if user is None:
+        metrics.logins.inc('invalid')
+        return 401, {"message": "Invalid credentials"}
+
+    # The slot and the token are written in one transaction, as in the sync API.
+    issued = await sync_to_async(issue_login_token)(user)
+    if issued is None:
+        metrics.logins.inc('limited')
+        return 403, {"message": "Maximum amount of tokens allowed per user exceeded."}
+
+    instance, token = issued
+
+    await sync_to_async(user_logged_in.send)(sender=user.__class__, request=request, user=user)
+
+    metrics.logins.inc('success')
+    return 200, {
+        "token": token,
+        "expiry": instance.expiry
+    }
+
+
+@token_auth_router.post("logout", response={204: None, 400: ErrorOut}, url_name="token_logout")
+async def token_logout(request):
+    if not getattr(request, "_auth", None):
+        return 400, {"message": AUTH_METHOD_MISMATCH}
+
+    if request._auth.is_signed:
+        await arevoke_tokens([request._auth])
+    else:
+        await ainvalidate_tokens([request._auth.hexdigest])
+    if not request._auth.is_signed or await aload_signed_token(request._auth):
+        await request._auth.adelete()
+    await arelease_token_slots([request._auth.user_id])
+    await sync_to_async(user_logged_out.send)(sender=get_user_model(), request=request, user=request.auth)
+
+    return 204, None
+
+
+@token_auth_router.post("logoutall", response={204: None, 400: ErrorOut}, url_name="token_logoutall")
+async def token_logout_all(request):
+    if not getattr(request, "_auth", None):
+        return 400, {"message": AUTH_METHOD_MISMATCH}
+
+    if not await arevoke_all_tokens(request._auth.user_id):
+        return 400, {"message": AUTH_METHOD_MISMATCH}
+
+    await sync_to_async(user_logged_out.send)(sender=get_user_model(), request=request, user=request.auth)
+
+    return 204, None
+
+
+@token_auth_router.get("token", response={200: TokenOut, 400: ErrorOut}, url_name="token_introspect")
+async def token_introspect(request):
+    if not getattr(request, "_auth", None):
+        return 400, {"message": "The request was not authenticated with a token."}
+
+    if request._auth.is_signed and not await aload_signed_token(request._auth):
+        return 400, {"message": "The token was revoked."}
+
+    deferred = deferred_token_fields(request._auth)
+    if deferred:
+        await request._auth.arefresh_from_db(fields=deferred)
+    return 200, describe_token(request._auth, current_pk=request._auth.pk)
+
+
+@token_auth_router.get("tokens", response={200: TokenPageOut, 400: ErrorOut}, url_name="token_list")
+async def token_list(request, cursor: Optional[str] = None, limit: int = Query(20, ge=1, le=100)):
+    if not getattr(request, "_auth", None):
+        return 400, {"message": "The request was not authenticated with a token."}
+
+    try:
+        auth_tokens, next_cursor = await token_paginator(request._auth.user_id, limit).apage(cursor)
+    except InvalidCursor as e:
+        return 400, {"message": str(e)}
+
+    if request._auth.is_signed:
+        await aload_signed_token(request._auth)
+    return 200, {
+        "items": [describe_token(token, request._auth.pk) for token in auth_tokens],
+        "next_cursor": next_cursor,
+    }
+
+
+register_router = Router()
+
+
+@register_router.post(
+    "register",
+    auth=None,
+    response={201: None, frozenset({400, 503}): ErrorOut},
+    url_name="register_user"
+)
+async def register(request, user_payload: UserRegisterSchema):
+    message = get_registration_validator().validate(user_payload)
+    if message is not None:
+        return 400, {"message": message}
+
+    User = get_user_model()
+
+    if await aemail_taken(User, user_payload.email):
+        return 400, {"message": "Email already exist"}
+
+    try:
+        # Password hashing is CPU bound, keep it off the event loop.
+        await sync_to_async(create_user)(
+            User,
+            username=user_payload.username,
+            email=user_payload.email,
+            password=await arun_hashing(make_password, user_payload.password)
+        )
+    except HashingOverloaded:
+        return overloaded_response()
+    except IntegrityError:
+        message = await aduplicate_user_message(User, user_payload.username, user_payload.email)
+        if message is None:
+            raise
+        return 400, {"message": message}
+
+    return 201, None
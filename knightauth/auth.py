@@ -1,13 +1,33 @@
-import binascii
 from hmac import compare_digest
 
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.db.models import F
 from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
 from ninja.security import APIKeyHeader
+from ninja.security.session import SessionAuth
 
-from knightauth.crypto import hash_token
+from knightauth import metrics
+from knightauth.cache import (
+    CachedToken, ainvalidate_tokens, get_negative_token_cache, get_token_cache, invalidate_tokens
+)
+from knightauth.crypto import get_digest_scheme, hash_token
 from knightauth.models import get_token_model
-from knightauth.settings import CONSTANTS, knight_auth_settings
+from knightauth.quota import arelease_token_slots, release_token_slots, with_user_generation
+from knightauth.refresh import refresh_buffer
+from knightauth.settings import knight_auth_settings
 from knightauth.signals import token_expired
+from knightauth.signing import (
+    denylist, is_signed_token, payload_expired, signed_tokens_enabled, token_from_payload, unsign_token
+)
+from knightauth.token_filter import aget_token_filter, get_token_filter
+
+
+class LazyUser(SimpleLazyObject):
+    # Authentication backends are judged by truthiness, which must not load the user.
+    def __bool__(self):
+        return True
 
 
 class TokenAuthentication(APIKeyHeader):
@@ -23,60 +43,182 @@ class TokenAuthentication(APIKeyHeader):
         if not token:
             return None, None
 
-        auth_tokens = (
-            get_token_model()
-            .objects
-            .filter(token_key=token[:CONSTANTS.TOKEN_KEY_LENGTH])
-        )
+        if signed_tokens_enabled() and is_signed_token(token):
+            return self.authenticate_signed(token)
+
+        digests = {}
+
+        token_cache = get_token_cache()
+        if token_cache is not None:
+            # Only tokens of the configured scheme are cached, other schemes
+            # are left to the database lookup.
+            digest = self._get_digest(token, get_digest_scheme(), digests)
+            cached = token_cache.get(digest)
+            if cached is not None:
+                metrics.token_cache_lookups.inc('hit')
+                return self.authenticate_cached(token_cache, digest, cached)
+            metrics.token_cache_lookups.inc('miss')
+
+        token_key = get_token_model().get_token_key(token)
+        negative_cache = get_negative_token_cache()
+        if negative_cache is not None and negative_cache.contains(token_key):
+            # Other processes may have issued a token with this key since it
+            # was remembered. The live token filter knows about those.
+            token_filter = get_token_filter()
+            if token_filter is None or not token_filter.might_exist(token_key):
+                metrics.authentications.inc('rejected')
+                return None, None
 
+        # Rows sharing the key are few; all of them are needed to tell whether
+        # the key is safe to remember.
+        auth_tokens = list(self.get_token_queryset(token))
         for auth_token in auth_tokens:
-            if self._cleanup_token(auth_token):
+            digest = self._get_digest(token, auth_token.digest_scheme, digests)
+            if not compare_digest(digest, auth_token.hexdigest):
                 continue
 
-            try:
-                digest = hash_token(token)
-            except (TypeError, binascii.Error):
+            revoked = self._is_revoked(auth_token)
+            if revoked or self._cleanup_token(auth_token):
+                metrics.authentications.inc('revoked' if revoked else 'expired')
+                if negative_cache is not None and len(auth_tokens) == 1:
+                    negative_cache.add(token_key)
                 return None, None
 
-            if compare_digest(digest, auth_token.digest):
-                if knight_auth_settings.AUTO_REFRESH and auth_token.expiry:
-                    self.renew_token(auth_token)
+            if knight_auth_settings.AUTO_REFRESH and auth_token.expiry:
+                self.renew_token(auth_token)
+
+            user, auth_token = self.validate_user(auth_token)
+            metrics.authentications.inc('inactive' if user is None else 'success')
+            if user is not None and self._cacheable(token_cache, auth_token):
+                token_cache.set(digest, self.make_cache_entry(auth_token))
 
-                return self.validate_user(auth_token)
+            return user, auth_token
 
+        metrics.authentications.inc('unknown')
+        # A key held by any other token is never remembered, whatever the digest.
+        if not auth_tokens and negative_cache is not None:
+            negative_cache.add(token_key)
         return None, None
 
+    def authenticate_signed(self, token):
+        # Verified with the signature and the in-process denylist only.
+        payload = unsign_token(token)
+        if payload is None or payload_expired(payload) or denylist.is_denied(payload['j']):
+            metrics.authentications.inc('rejected')
+            return None, None
+
+        metrics.authentications.inc('success')
+        auth_token = token_from_payload(payload)
+        return LazyUser(lambda: auth_token.user), auth_token
+
+    def get_token_queryset(self, token):
+        # Resolve the token, its user and the active flag in a single query.
+        token_model = get_token_model()
+        auth_tokens = token_model.objects.filter(token_key=token_model.get_token_key(token))
+
+        # The user's current generation comes along with the same query.
+        auth_tokens = with_user_generation(auth_tokens)
+        fields = ('digest', 'digest_scheme', 'user', 'expiry', 'generation')
+
+        if knight_auth_settings.DEFER_USER:
+            return auth_tokens.only(*fields).annotate(user_is_active=F('user__is_active'))
+
+        return auth_tokens.select_related('user').only(*fields)
+
+    def _is_revoked(self, auth_token):
+        # Bumping the user's generation revokes older tokens before they are deleted.
+        return auth_token.generation != auth_token.user_generation
+
+    def _cacheable(self, token_cache, auth_token):
+        # Cache lookups only compute the digest of the configured scheme.
+        return token_cache is not None and auth_token.digest_scheme == get_digest_scheme()
+
+    def _get_digest(self, token, scheme, digests):
+        # Tokens keep the digest scheme they were issued with.
+        if scheme not in digests:
+            digests[scheme] = hash_token(token, scheme)
+        return digests[scheme]
+
+    def authenticate_cached(self, token_cache, digest, cached):
+        if not cached.is_active:
+            metrics.authentications.inc('inactive')
+            return None, None
+
+        auth_token = self.token_from_cache(digest, cached)
+        if self._cleanup_token(auth_token):
+            metrics.authentications.inc('expired')
+            return None, None
+
+        if knight_auth_settings.AUTO_REFRESH and auth_token.expiry:
+            if self.renew_token(auth_token):
+                token_cache.set(digest, self.make_cache_entry(auth_token))
+
+        metrics.authentications.inc('success')
+        return LazyUser(lambda: auth_token.user), auth_token
+
+    def make_cache_entry(self, auth_token):
+        return CachedToken(
+            pk=auth_token.pk,
+            user_id=auth_token.user_id,
+            expiry=auth_token.expiry,
+            is_active=self._user_is_active(auth_token)
+        )
+
+    def token_from_cache(self, digest, cached):
+        token_model = get_token_model()
+        return token_model.from_values(
+            cached.pk,
+            digest=token_model.encode_digest(digest),
+            user_id=cached.user_id,
+            expiry=cached.expiry
+        )
+
     def renew_token(self, auth_token):
         current_expiry = auth_token.expiry
         new_expiry = timezone.now() + knight_auth_settings.TOKEN_TTL
-        auth_token.expiry = new_expiry
         # Throttle refreshing of token to avoid db writes
         delta = (new_expiry - current_expiry).total_seconds()
         if delta > knight_auth_settings.MIN_REFRESH_INTERVAL:
-            auth_token.save(update_fields=('expiry',))
+            auth_token.expiry = new_expiry
+            if knight_auth_settings.REFRESH_WRITE_BEHIND:
+                refresh_buffer.add(auth_token.pk, new_expiry)
+                metrics.token_refreshes.inc('buffered')
+            else:
+                auth_token.save(update_fields=('expiry',))
+                metrics.token_refreshes.inc('write')
+            return True
+
+        return False
 
     def validate_user(self, auth_token):
-        if not auth_token.user.is_active:
+        if not self._user_is_active(auth_token):
             return None, None
 
+        if knight_auth_settings.DEFER_USER:
+            return LazyUser(lambda: auth_token.user), auth_token
+
         return auth_token.user, auth_token
 
-    def _cleanup_token(self, auth_token):
-        for other_token in auth_token.user.auth_token_set.all():
-            if other_token.digest != auth_token.digest and other_token.expiry:
-                if other_token.expiry < timezone.now():
-                    other_token.delete()
-                    username = other_token.user.get_username()
-                    token_expired.send(
-                        sender=self.__class__,
-                        username=username,
-                        source="other_token"
-                    )
+    def _apply_pending_refresh(self, auth_token):
+        # The stored expiry lags behind refreshes that are not flushed yet.
+        pending_expiry = refresh_buffer.pending(auth_token.pk)
+        if pending_expiry is not None:
+            auth_token.expiry = pending_expiry
+
+    def _user_is_active(self, auth_token):
+        is_active = getattr(auth_token, 'user_is_active', None)
+        if is_active is None:
+            is_active = auth_token.user.is_active
+        return is_active
 
+    def _cleanup_token(self, auth_token):
+        self._apply_pending_refresh(auth_token)
         if auth_token.expiry is not None:
             if auth_token.expiry < timezone.now():
                 username = auth_token.user.get_username()
+                invalidate_tokens([auth_token.hexdigest])
                 auth_token.delete()
+                release_token_slots([auth_token.user_id])
                 token_expired.send(
                     sender=self.__class__,
                     username=username,
@@ -87,3 +229,169 @@ class TokenAuthentication(APIKeyHeader):
         return False
 
 
+class SessionFallbackAuth(SessionAuth):
+    """
+    Session authentication for use after ``TokenAuthentication``, as in
+    ``auth=[TokenAuthentication(), SessionFallbackAuth()]``.
+
+    Requests that carry a token never fall back to the session: a missing
+    or invalid token fails with 401 without loading the session or its
+    user, and without a CSRF check.
+    """
+
+    token_header = 'HTTP_%s' % TokenAuthentication.param_name.upper().replace('-', '_')
+
+    def __call__(self, request):
+        if request.META.get(self.token_header):
+            return None
+        return super().__call__(request)
+
+    def authenticate(self, request, key):
+        # Without a session cookie there is no session user to load.
+        if key is None:
+            return None
+        return super().authenticate(request, key)
+
+
+session_fallback_auth = SessionFallbackAuth()
+
+
+class AsyncTokenAuthentication(TokenAuthentication):
+    async def authenticate(self, request, token):
+        user, auth_token = await self.authenticate_credentials(token)
+        request._auth = auth_token
+
+        return user
+
+    async def authenticate_credentials(self, token):
+        if not token:
+            return None, None
+
+        if signed_tokens_enabled() and is_signed_token(token):
+            return await self.authenticate_signed(token)
+
+        digests = {}
+
+        token_cache = get_token_cache()
+        if token_cache is not None:
+            digest = self._get_digest(token, get_digest_scheme(), digests)
+            cached = await token_cache.aget(digest)
+            if cached is not None:
+                metrics.token_cache_lookups.inc('hit')
+                return await self.authenticate_cached(token_cache, digest, cached)
+            metrics.token_cache_lookups.inc('miss')
+
+        token_key = get_token_model().get_token_key(token)
+        negative_cache = get_negative_token_cache()
+        if negative_cache is not None and await negative_cache.acontains(token_key):
+            token_filter = await aget_token_filter()
+            if token_filter is None or not await token_filter.amight_exist(token_key):
+                metrics.authentications.inc('rejected')
+                return None, None
+
+        auth_tokens = [auth_token async for auth_token in self.get_token_queryset(token)]
+        for auth_token in auth_tokens:
+            digest = self._get_digest(token, auth_token.digest_scheme, digests)
+            if not compare_digest(digest, auth_token.hexdigest):
+                continue
+
+            revoked = self._is_revoked(auth_token)
+            if revoked or await self._cleanup_token(auth_token):
+                metrics.authentications.inc('revoked' if revoked else 'expired')
+                if negative_cache is not None and len(auth_tokens) == 1:
+                    await negative_cache.aadd(token_key)
+                return None, None
+
+            if knight_auth_settings.AUTO_REFRESH and auth_token.expiry:
+                await self.renew_token(auth_token)
+
+            user, auth_token = await self.validate_user(auth_token)
+            metrics.authentications.inc('inactive' if user is None else 'success')
+            if user is not None and self._cacheable(token_cache, auth_token):
+                await token_cache.aset(digest, self.make_cache_entry(auth_token))
+
+            return user, auth_token
+
+        metrics.authentications.inc('unknown')
+        if not auth_tokens and negative_cache is not None:
+            await negative_cache.aadd(token_key)
+        return None, None
+
+    async def authenticate_signed(self, token):
+        payload = unsign_token(token)
+        if payload is None or payload_expired(payload) or await denylist.ais_denied(payload['j']):
+            metrics.authentications.inc('rejected')
+            return None, None
+
+        metrics.authentications.inc('success')
+
+        return await self.validate_user(token_from_payload(payload), is_active=True)
+
+    async def authenticate_cached(self, token_cache, digest, cached):
+        if not cached.is_active:
+            metrics.authentications.inc('inactive')
+            return None, None
+
+        auth_token = self.token_from_cache(digest, cached)
+        if await self._cleanup_token(auth_token):
+            metrics.authentications.inc('expired')
+            return None, None
+
+        if knight_auth_settings.AUTO_REFRESH and auth_token.expiry:
+            if await self.renew_token(auth_token):
+                await token_cache.aset(digest, self.make_cache_entry(auth_token))
+
+        metrics.authentications.inc('success')
+        return await self.validate_user(auth_token, is_active=True)
+
+    async def renew_token(self, auth_token):
+        current_expiry = auth_token.expiry
+        new_expiry = timezone.now() + knight_auth_settings.TOKEN_TTL
+        # Throttle refreshing of token to avoid db writes
+        delta = (new_expiry - current_expiry).total_seconds()
+        if delta > knight_auth_settings.MIN_REFRESH_INTERVAL:
+            auth_token.expiry = new_expiry
+            if knight_auth_settings.REFRESH_WRITE_BEHIND:
+                refresh_buffer.add(auth_token.pk, new_expiry)
+                metrics.token_refreshes.inc('buffered')
+            else:
+                await auth_token.asave(update_fields=('expiry',))
+                metrics.token_refreshes.inc('write')
+            return True
+
+        return False
+
+    async def validate_user(self, auth_token, is_active=None):
+        if is_active is None:
+            is_active = self._user_is_active(auth_token)
+        if not is_active:
+            return None, None
+
+        # Lazy users cannot be loaded from async code, so the user is only
+        # deferred when DEFER_USER asks for it explicitly.
+        if knight_auth_settings.DEFER_USER:
+            return LazyUser(lambda: auth_token.user), auth_token
+
+        return await self._get_user(auth_token), auth_token
+
+    async def _get_user(self, auth_token):
+        if not auth_token._meta.get_field('user').is_cached(auth_token):
+            auth_token.user = await get_user_model()._default_manager.aget(pk=auth_token.user_id)
+        return auth_token.user
+
+    async def _cleanup_token(self, auth_token):
+        self._apply_pending_refresh(auth_token)
+        if auth_token.expiry is not None:
+            if auth_token.expiry < timezone.now():
+                user = await self._get_user(auth_token)
+                await ainvalidate_tokens([auth_token.hexdigest])
+                await auth_token.adelete()
+                await arelease_token_slots([auth_token.user_id])
+                await sync_to_async(token_expired.send)(
+                    sender=self.__class__,
+                    username=user.get_username(),
+                    source="auth_token"
+                )
+                return True
+
+        return False
@@ -0,0 +1,54 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import make_password, verify_password
+
+from knightauth.executor import arun_hashing, run_hashing
+
+UserModel = get_user_model()
+
+
+class HashingPoolBackend(ModelBackend):
+    """
+    ``ModelBackend`` that hashes on the ``PASSWORD_HASHING_WORKERS`` pool.
+
+    Only the hasher runs on the pool. The user lookup and the save of a
+    rehashed password stay on the calling thread, so they take part in its
+    transaction. Raises ``HashingOverloaded`` when the pool is full.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # Hash once anyway, so unknown usernames take as long as wrong passwords.
+            run_hashing(make_password, password)
+            return
+
+        is_correct, must_update = run_hashing(verify_password, password, user.password)
+        if is_correct and must_update:
+            user.password = run_hashing(make_password, password)
+            user.save(update_fields=['password'])
+        if is_correct and self.user_can_authenticate(user):
+            return user
+
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return
+        try:
+            user = await UserModel._default_manager.aget_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            await arun_hashing(make_password, password)
+            return
+
+        is_correct, must_update = await arun_hashing(verify_password, password, user.password)
+        if is_correct and must_update:
+            user.password = await arun_hashing(make_password, password)
+            await user.asave(update_fields=['password'])
+        if is_correct and self.user_can_authenticate(user):
+            return user
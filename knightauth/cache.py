@@ -0,0 +1,429 @@
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict, namedtuple
+
+from django.core.cache import caches
+from django.test.signals import setting_changed
+
+from knightauth.crypto import digest_to_hex
+from knightauth.settings import knight_auth_settings
+
+CachedToken = namedtuple('CachedToken', ('pk', 'user_id', 'expiry', 'is_active', 'generation'), defaults=(None,))
+
+
+class LocalTokenCache:
+    """Per-process LRU cache whose entries expire after ``timeout`` seconds."""
+
+    def __init__(self, max_size, timeout):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.timeout)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def memory_usage(self):
+        """Approximate bytes held by the entries, shared objects excluded."""
+        with self._lock:
+            items = list(self._entries.items())
+        return sys.getsizeof(self._entries) + sum(
+            sys.getsizeof(key) + sys.getsizeof(item) + sys.getsizeof(item[1]) for key, item in items
+        )
+
+
+class SharedTokenCache:
+    """Token cache tier stored in one of the Django ``CACHES`` backends."""
+
+    key_prefix = 'knightauth:token:'
+    generation_prefix = 'knightauth:generation:'
+
+    def __init__(self, alias, timeout):
+        self.alias = alias
+        self.timeout = timeout
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def make_key(self, key):
+        return self.key_prefix + key
+
+    def get(self, key):
+        return self.backend.get(self.make_key(key))
+
+    def set(self, key, value):
+        self.backend.set(self.make_key(key), value, self.timeout)
+
+    def delete_many(self, keys):
+        self.backend.delete_many([self.make_key(key) for key in keys])
+
+    async def aget(self, key):
+        return await self.backend.aget(self.make_key(key))
+
+    async def aset(self, key, value):
+        await self.backend.aset(self.make_key(key), value, self.timeout)
+
+    async def adelete_many(self, keys):
+        await self.backend.adelete_many([self.make_key(key) for key in keys])
+
+    def get_generation(self, user_id):
+        return self.backend.get('%s%s' % (self.generation_prefix, user_id))
+
+    def set_generation(self, user_id, generation):
+        self.backend.set('%s%s' % (self.generation_prefix, user_id), generation, self.timeout)
+
+    async def aget_generation(self, user_id):
+        return await self.backend.aget('%s%s' % (self.generation_prefix, user_id))
+
+    async def aset_generation(self, user_id, generation):
+        await self.backend.aset('%s%s' % (self.generation_prefix, user_id), generation, self.timeout)
+
+
+class TokenVerificationCache:
+    """
+    Two-tier cache of verified tokens keyed on their digest.
+
+    Lookups hit the local LRU first and fall back to the shared tier, when
+    ``TOKEN_CACHE_ALIAS`` is configured. Invalidation clears both tiers of
+    this process; local tiers of other processes expire after
+    ``TOKEN_CACHE_TTL`` seconds.
+
+    Entries are stamped with their user's generation. Bumping the generation
+    invalidates every cached token of that user at once.
+    """
+
+    def __init__(self, max_size=None, timeout=None, alias=None):
+        timeout = timeout or knight_auth_settings.TOKEN_CACHE_TTL
+        alias = alias or knight_auth_settings.TOKEN_CACHE_ALIAS
+
+        self.timeout = timeout
+        self.local = LocalTokenCache(max_size or knight_auth_settings.TOKEN_CACHE_SIZE, timeout)
+        self.shared = SharedTokenCache(alias, timeout) if alias else None
+        # Bumped generations only matter while entries stamped before the
+        # bump can still be cached, so they are kept for ``timeout`` seconds.
+        self._generations = {}
+        self._generations_lock = threading.Lock()
+
+    def get(self, digest):
+        entry = self.local.get(digest)
+        if entry is not None:
+            return self._current(digest, entry, self._local_generation(entry.user_id))
+        if self.shared is not None:
+            entry = self.shared.get(digest)
+            if entry is not None and self._current(digest, entry, self.generation(entry.user_id)):
+                self.local.set(digest, entry)
+                return entry
+        return None
+
+    def set(self, digest, entry):
+        entry = entry._replace(generation=self.generation(entry.user_id))
+        self.local.set(digest, entry)
+        if self.shared is not None:
+            self.shared.set(digest, entry)
+
+    def generation(self, user_id):
+        generation = self._local_generation(user_id)
+        if generation is None and self.shared is not None:
+            generation = self.shared.get_generation(user_id)
+            if generation is not None:
+                self._set_local_generation(user_id, generation)
+        return generation
+
+    def bump_generation(self, user_id):
+        generation = uuid.uuid4().hex
+        self._set_local_generation(user_id, generation)
+        if self.shared is not None:
+            self.shared.set_generation(user_id, generation)
+
+    def delete_many(self, digests):
+        digests = list(digests)
+        if not digests:
+            return
+        self.local.delete_many(digests)
+        if self.shared is not None:
+            self.shared.delete_many(digests)
+
+    async def aget(self, digest):
+        entry = self.local.get(digest)
+        if entry is not None:
+            return self._current(digest, entry, self._local_generation(entry.user_id))
+        if self.shared is not None:
+            entry = await self.shared.aget(digest)
+            if entry is not None and self._current(digest, entry, await self.ageneration(entry.user_id)):
+                self.local.set(digest, entry)
+                return entry
+        return None
+
+    async def aset(self, digest, entry):
+        entry = entry._replace(generation=await self.ageneration(entry.user_id))
+        self.local.set(digest, entry)
+        if self.shared is not None:
+            await self.shared.aset(digest, entry)
+
+    async def ageneration(self, user_id):
+        generation = self._local_generation(user_id)
+        if generation is None and self.shared is not None:
+            generation = await self.shared.aget_generation(user_id)
+            if generation is not None:
+                self._set_local_generation(user_id, generation)
+        return generation
+
+    async def abump_generation(self, user_id):
+        generation = uuid.uuid4().hex
+        self._set_local_generation(user_id, generation)
+        if self.shared is not None:
+            await self.shared.aset_generation(user_id, generation)
+
+    async def adelete_many(self, digests):
+        digests = list(digests)
+        if not digests:
+            return
+        self.local.delete_many(digests)
+        if self.shared is not None:
+            await self.shared.adelete_many(digests)
+
+    def clear(self):
+        self.local.clear()
+        with self._generations_lock:
+            self._generations.clear()
+
+    def _current(self, digest, entry, generation):
+        if entry.generation != generation:
+            self.local.delete_many([digest])
+            return None
+        return entry
+
+    def _local_generation(self, user_id):
+        item = self._generations.get(user_id)
+        if item is None or item[1] <= time.monotonic():
+            return None
+        return item[0]
+
+    def _set_local_generation(self, user_id, generation):
+        now = time.monotonic()
+        with self._generations_lock:
+            if len(self._generations) >= self.local.max_size:
+                self._generations = {
+                    key: item for key, item in self._generations.items() if item[1] > now
+                }
+            self._generations[user_id] = (generation, now + self.timeout)
+
+
+class SharedNegativeTokenCache(SharedTokenCache):
+    key_prefix = 'knightauth:miss:'
+
+    def make_key(self, key):
+        # Keys come straight from client input, hex keeps them valid for memcached.
+        return self.key_prefix + key.encode().hex()
+
+
+class NegativeTokenCache:
+    """
+    Bounded cache of token keys known to authenticate nothing.
+
+    A key is only remembered when no token row has it, or when the only
+    token holding it is revoked or expired, never after a digest mismatch, so a
+    client guessing keys cannot lock out a live token. Issuing a token
+    forgets its key in both tiers of this process; local tiers of other
+    processes forget it after ``NEGATIVE_TOKEN_CACHE_TTL`` seconds.
+    """
+
+    def __init__(self, max_size=None, timeout=None, alias=None):
+        timeout = timeout or knight_auth_settings.NEGATIVE_TOKEN_CACHE_TTL
+        alias = alias or knight_auth_settings.NEGATIVE_TOKEN_CACHE_ALIAS
+
+        self.local = LocalTokenCache(max_size or knight_auth_settings.NEGATIVE_TOKEN_CACHE_SIZE, timeout)
+        self.shared = SharedNegativeTokenCache(alias, timeout) if alias else None
+        # Plain counters: a lost increment under contention is cheaper than a lock.
+        self.hits = 0
+        self.misses = 0
+
+    def contains(self, token_key):
+        token_key = str(token_key)
+        found = self.local.get(token_key) is not None
+        if not found and self.shared is not None and self.shared.get(token_key) is not None:
+            self.local.set(token_key, True)
+            found = True
+        self._count(found)
+        return found
+
+    def add(self, token_key):
+        token_key = str(token_key)
+        self.local.set(token_key, True)
+        if self.shared is not None:
+            self.shared.set(token_key, True)
+
+    def delete_many(self, token_keys):
+        token_keys = [str(token_key) for token_key in token_keys]
+        if not token_keys:
+            return
+        self.local.delete_many(token_keys)
+        if self.shared is not None:
+            self.shared.delete_many(token_keys)
+
+    async def acontains(self, token_key):
+        token_key = str(token_key)
+        found = self.local.get(token_key) is not None
+        if not found and self.shared is not None and await self.shared.aget(token_key) is not None:
+            self.local.set(token_key, True)
+            found = True
+        self._count(found)
+        return found
+
+    async def aadd(self, token_key):
+        token_key = str(token_key)
+        self.local.set(token_key, True)
+        if self.shared is not None:
+            await self.shared.aset(token_key, True)
+
+    async def adelete_many(self, token_keys):
+        token_keys = [str(token_key) for token_key in token_keys]
+        if not token_keys:
+            return
+        self.local.delete_many(token_keys)
+        if self.shared is not None:
+            await self.shared.adelete_many(token_keys)
+
+    def clear(self):
+        self.local.clear()
+        self.hits = self.misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'size': len(self.local),
+            'max_size': self.local.max_size,
+            'memory_bytes': self.local.memory_usage(),
+        }
+
+    def _count(self, found):
+        if found:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+
+_token_cache = None
+_token_cache_lock = threading.Lock()
+_negative_token_cache = None
+
+
+def get_token_cache():
+    global _token_cache
+    cache_class = knight_auth_settings.TOKEN_CACHE
+    if cache_class is None:
+        return None
+
+    if _token_cache is None:
+        with _token_cache_lock:
+            if _token_cache is None:
+                _token_cache = cache_class()
+
+    return _token_cache
+
+
+def get_negative_token_cache():
+    global _negative_token_cache
+    cache_class = knight_auth_settings.NEGATIVE_TOKEN_CACHE
+    if cache_class is None:
+        return None
+
+    if _negative_token_cache is None:
+        with _token_cache_lock:
+            if _negative_token_cache is None:
+                _negative_token_cache = cache_class()
+
+    return _negative_token_cache
+
+
+def forget_missing_tokens(token_keys):
+    """Drop issued token keys from the negative cache."""
+    negative_cache = get_negative_token_cache()
+    if negative_cache is not None:
+        negative_cache.delete_many(token_keys)
+
+
+async def aforget_missing_tokens(token_keys):
+    negative_cache = get_negative_token_cache()
+    if negative_cache is not None:
+        await negative_cache.adelete_many(token_keys)
+
+
+def invalidate_tokens(digests):
+    token_cache = get_token_cache()
+    if token_cache is not None:
+        token_cache.delete_many(digest_to_hex(digest) for digest in digests)
+
+
+async def ainvalidate_tokens(digests):
+    token_cache = get_token_cache()
+    if token_cache is not None:
+        await token_cache.adelete_many(digest_to_hex(digest) for digest in digests)
+
+
+def invalidate_user(user_id):
+    """Invalidate every cached token of a user without looking the tokens up."""
+    token_cache = get_token_cache()
+    if token_cache is not None:
+        token_cache.bump_generation(user_id)
+
+
+async def ainvalidate_user(user_id):
+    token_cache = get_token_cache()
+    if token_cache is not None:
+        await token_cache.abump_generation(user_id)
+
+
+def invalidate_user_tokens(sender, instance, update_fields=None, **kwargs):
+    if instance.is_active:
+        return
+    if update_fields is not None and 'is_active' not in update_fields:
+        return
+
+    invalidate_user(instance.pk)
+
+
+def reset_token_cache(*args, **kwargs):
+    global _token_cache, _negative_token_cache
+    if kwargs['setting'] == 'KNIGHT_AUTH':
+        _token_cache = None
+        _negative_token_cache = None
+
+
+setting_changed.connect(reset_token_cache)
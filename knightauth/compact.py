@@ -0,0 +1,54 @@
+from itertools import islice
+
+from django.db import DEFAULT_DB_ALIAS
+
+from knightauth.crypto import compact_token_key
+
+COPY_BATCH_SIZE = 2000
+
+
+def copy_tokens_to_compact(token_model, compact_model, using=DEFAULT_DB_ALIAS, batch_size=COPY_BATCH_SIZE):
+    """
+    Copy the rows of ``token_model`` that ``compact_model`` does not hold yet
+    and return how many were copied.
+
+    The models are passed in so that migrations can hand over their
+    historical models.
+    """
+    compact_fields = {field.attname for field in compact_model._meta.concrete_fields}
+    # Added by later migrations, copied when both models have them.
+    optional_fields = [name for name in ('generation', 'jti') if name in compact_fields]
+
+    # Keep the original creation time instead of stamping the copy time.
+    created_field = compact_model._meta.get_field('created')
+    auto_now_add, created_field.auto_now_add = created_field.auto_now_add, False
+    try:
+        copied = 0
+        tokens = token_model.objects.using(using).order_by().iterator(chunk_size=batch_size)
+        while True:
+            batch = list(islice(tokens, batch_size))
+            if not batch:
+                return copied
+
+            digests = [bytes.fromhex(token.digest) for token in batch]
+            existing = {
+                bytes(digest) for digest in
+                compact_model.objects.using(using).filter(digest__in=digests).values_list('digest', flat=True)
+            }
+            copies = [
+                compact_model(
+                    digest=digest,
+                    digest_scheme=token.digest_scheme,
+                    token_key=compact_token_key(token.token_key),
+                    user_id=token.user_id,
+                    created=token.created,
+                    expiry=token.expiry,
+                    **{name: getattr(token, name) for name in optional_fields}
+                )
+                for token, digest in zip(batch, digests)
+                if digest not in existing
+            ]
+            compact_model.objects.using(using).bulk_create(copies)
+            copied += len(copies)
+    finally:
+        created_field.auto_now_add = auto_now_add
@@ -0,0 +1,119 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.test.signals import setting_changed
+from ninja.responses import Response
+
+from knightauth.settings import knight_auth_settings
+
+
+class HashingOverloaded(Exception):
+    pass
+
+
+class PasswordHashingExecutor:
+    """
+    Bounded thread pool for calls that hash passwords.
+
+    At most ``max_workers`` calls run at once and at most ``max_queue`` wait
+    for a worker; further calls raise ``HashingOverloaded`` right away.
+    Password hashers release the GIL, so the pool runs them in parallel
+    without holding up the request workers.
+    """
+
+    def __init__(self, max_workers, max_queue):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='knightauth-hashing')
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                raise HashingOverloaded()
+            self._pending += 1
+
+        future = self._pool.submit(self._call, fn, *args, **kwargs)
+        future.add_done_callback(self._done)
+        return future
+
+    def run(self, fn, *args, **kwargs):
+        return self.submit(fn, *args, **kwargs).result()
+
+    async def arun(self, fn, *args, **kwargs):
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
+
+    def _call(self, fn, *args, **kwargs):
+        # Workers outlive requests, so their connections are recycled like a request's.
+        close_old_connections()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    def _done(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    def __len__(self):
+        return self._pending
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_hashing_executor():
+    """Return the shared executor, or None when PASSWORD_HASHING_WORKERS is not set."""
+    global _executor
+    if knight_auth_settings.PASSWORD_HASHING_WORKERS is None:
+        return None
+
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = PasswordHashingExecutor(
+                    knight_auth_settings.PASSWORD_HASHING_WORKERS,
+                    knight_auth_settings.PASSWORD_HASHING_QUEUE_SIZE
+                )
+    return _executor
+
+
+def run_hashing(fn, *args, **kwargs):
+    executor = get_hashing_executor()
+    if executor is None:
+        return fn(*args, **kwargs)
+    return executor.run(fn, *args, **kwargs)
+
+
+async def arun_hashing(fn, *args, **kwargs):
+    executor = get_hashing_executor()
+    if executor is None:
+        # Without a pool, keep the hashing off the event loop as before.
+        return await sync_to_async(fn)(*args, **kwargs)
+    return await executor.arun(fn, *args, **kwargs)
+
+
+def overloaded_response():
+    return Response(
+        {"message": "Server is busy. Try again later."},
+        status=503,
+        headers={'Retry-After': '1'}
+    )
+
+
+def reset_hashing_executor(*args, **kwargs):
+    global _executor
+    if kwargs['setting'] == 'KNIGHT_AUTH' and _executor is not None:
+        _executor.shutdown()
+        _executor = None
+
+
+setting_changed.connect(reset_hashing_executor)
@@ -0,0 +1,131 @@
+import logging
+import threading
+
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError, connections
+from django.db.models import F
+from django.utils import timezone
+
+from knightauth.cache import invalidate_tokens
+from knightauth.models import DeniedToken, get_token_model
+from knightauth.quota import counted_user_ids, release_token_slots, with_user_generation
+from knightauth.refresh import refresh_buffer
+from knightauth.settings import knight_auth_settings
+from knightauth.signals import tokens_expired
+
+logger = logging.getLogger(__name__)
+
+
+def delete_expired_tokens(batch_size=None, now=None):
+    """
+    Delete expired tokens in batches of at most ``batch_size`` rows.
+
+    Each batch is removed with a single DELETE and announced with one
+    ``tokens_expired`` signal. Returns the number of deleted tokens.
+    """
+    batch_size = batch_size or knight_auth_settings.EXPIRY_BATCH_SIZE
+    now = now or timezone.now()
+
+    # Persist pending refreshes first so that refreshed tokens survive.
+    refresh_buffer.flush()
+
+    token_model = get_token_model()
+    username_field = 'user__%s' % get_user_model().USERNAME_FIELD
+    deleted = 0
+
+    while True:
+        batch = list(
+            with_user_generation(token_model.objects.filter(expiry__lt=now))
+            .values_list('pk', 'digest', username_field, 'user_id', 'generation', 'user_generation')[:batch_size]
+        )
+        if not batch:
+            break
+
+        pks, digests, usernames = list(zip(*batch))[:3]
+        token_model.objects.filter(pk__in=pks).delete()
+        invalidate_tokens(digests)
+        release_token_slots(counted_user_ids(row[3:] for row in batch))
+        deleted += len(pks)
+
+        tokens_expired.send(
+            sender=token_model,
+            usernames=list(usernames),
+            count=len(pks)
+        )
+
+        if len(batch) < batch_size:
+            break
+
+    # Signed tokens past their expiry are rejected without the denylist.
+    DeniedToken.objects.filter(expiry__lt=now).delete()
+    delete_revoked_tokens(batch_size)
+
+    return deleted
+
+
+def delete_revoked_tokens(batch_size=None):
+    """
+    Delete tokens left behind by a bump of their user's generation.
+
+    They were already revoked and taken off the token counters, so no
+    signal is sent and no slot is released. Returns the number of deleted tokens.
+    """
+    batch_size = batch_size or knight_auth_settings.EXPIRY_BATCH_SIZE
+    token_model = get_token_model()
+    deleted = 0
+
+    while True:
+        pks = list(
+            token_model
+            .objects
+            .filter(generation__lt=F('user__knight_auth_state__generation'))
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not pks:
+            break
+
+        token_model.objects.filter(pk__in=pks).delete()
+        deleted += len(pks)
+
+        if len(pks) < batch_size:
+            break
+
+    return deleted
+
+
+class ExpiryScheduler(threading.Thread):
+    def __init__(self, interval, batch_size=None):
+        super().__init__(name='knightauth-expiry', daemon=True)
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                delete_expired_tokens(batch_size=self.batch_size)
+            except DatabaseError:
+                logger.exception("Expired token cleanup failed")
+            finally:
+                connections.close_all()
+
+    def stop(self):
+        self._stopped.set()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def start_scheduler(**kwargs):
+    global _scheduler
+    interval = knight_auth_settings.EXPIRY_CLEANUP_INTERVAL
+    if interval is None or _scheduler is not None:
+        return _scheduler
+
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = ExpiryScheduler(interval)
+            _scheduler.start()
+
+    return _scheduler
@@ -0,0 +1,259 @@
+import hashlib
+import logging
+import time
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.contrib.auth.hashers import (
+    UNUSABLE_PASSWORD_PREFIX,
+    Argon2PasswordHasher,
+    PBKDF2PasswordHasher,
+    PBKDF2SHA1PasswordHasher,
+    ScryptPasswordHasher,
+    get_hasher,
+    identify_hasher,
+)
+from django.test.signals import setting_changed
+
+from knightauth.settings import knight_auth_settings
+
+logger = logging.getLogger(__name__)
+
+CALIBRATION_PASSWORD = 'knightauth-calibration'
+CALIBRATION_SALT = 'knightauthcalibrationsalt'
+CALIBRATION_KEY_PREFIX = 'knightauth:hasher_calibration:'
+
+PER_PROCESS_CACHES = (LocMemCache, DummyCache)
+
+_calibrated = {}
+
+
+def get_hasher_parameters(algorithm):
+    """Parameters for ``algorithm``: PASSWORD_HASH_PARAMETERS first, then calibration."""
+    parameters = knight_auth_settings.PASSWORD_HASH_PARAMETERS.get(algorithm)
+    if parameters is not None:
+        return parameters
+
+    if knight_auth_settings.PASSWORD_HASH_TARGET_MS is None:
+        return {}
+
+    if algorithm not in _calibrated:
+        _calibrated[algorithm] = load_or_calibrate(algorithm)
+    return _calibrated[algorithm]
+
+
+def calibration_cache():
+    alias = knight_auth_settings.PASSWORD_HASH_CALIBRATION_CACHE_ALIAS
+    return caches[alias] if alias else None
+
+
+def calibration_key(algorithm):
+    return '%s%s:%s' % (CALIBRATION_KEY_PREFIX, algorithm, knight_auth_settings.PASSWORD_HASH_TARGET_MS)
+
+
+def load_or_calibrate(algorithm):
+    """
+    Parameters stored by an earlier calibration for the current target, or
+    a fresh calibration, stored unless another process got there first.
+    """
+    cache = calibration_cache()
+    key = calibration_key(algorithm)
+    parameters = cache.get(key) if cache is not None else None
+    if parameters is not None:
+        return parameters
+
+    parameters = calibrate(get_hasher(algorithm), knight_auth_settings.PASSWORD_HASH_TARGET_MS / 1000)
+    logger.info("Calibrated %s for %sms: %s", algorithm, knight_auth_settings.PASSWORD_HASH_TARGET_MS, parameters)
+    if cache is not None:
+        # Processes sharing the cache settle on the first stored result, so a
+        # password hashed on one host is not rehashed on the next. A per-process
+        # cache such as LocMemCache only saves this process from measuring again.
+        cache.add(key, parameters, timeout=None)
+        parameters = cache.get(key, parameters)
+    return parameters
+
+
+def save_calibration(algorithm, parameters):
+    """Store ``parameters`` as the calibration of ``algorithm`` for the current target."""
+    cache = calibration_cache()
+    if cache is None:
+        raise ValueError("PASSWORD_HASH_CALIBRATION_CACHE_ALIAS is not set")
+    cache.set(calibration_key(algorithm), parameters, timeout=None)
+    _calibrated.pop(algorithm, None)
+
+
+# The tuned hashers keep Django's algorithm names, so existing hashes keep
+# verifying. Django rehashes a password on the next successful login once its
+# stored cost differs from the configured one, in either direction.
+class TunedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return get_hasher_parameters(self.algorithm).get('iterations', PBKDF2PasswordHasher.iterations)
+
+
+class TunedPBKDF2SHA1PasswordHasher(PBKDF2SHA1PasswordHasher):
+    @property
+    def iterations(self):
+        return get_hasher_parameters(self.algorithm).get('iterations', PBKDF2SHA1PasswordHasher.iterations)
+
+
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+    @property
+    def work_factor(self):
+        return get_hasher_parameters(self.algorithm).get('work_factor', ScryptPasswordHasher.work_factor)
+
+    @property
+    def maxmem(self):
+        # OpenSSL refuses more than 32 MiB unless told otherwise.
+        return 2 * 128 * self.block_size * self.work_factor * self.parallelism
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    @property
+    def time_cost(self):
+        return get_hasher_parameters(self.algorithm).get('time_cost', Argon2PasswordHasher.time_cost)
+
+
+def measure(hasher, **parameters):
+    """Seconds one ``encode()`` takes with the given parameters."""
+    if isinstance(hasher, PBKDF2PasswordHasher):
+        run = lambda: hasher.encode(CALIBRATION_PASSWORD, CALIBRATION_SALT, iterations=parameters['iterations'])  # noqa: E731
+    elif isinstance(hasher, ScryptPasswordHasher):
+        n, r, p = parameters['work_factor'], ScryptPasswordHasher.block_size, ScryptPasswordHasher.parallelism
+        run = lambda: hashlib.scrypt(  # noqa: E731
+            CALIBRATION_PASSWORD.encode(),
+            salt=CALIBRATION_SALT.encode(),
+            n=n,
+            r=r,
+            p=p,
+            maxmem=2 * 128 * r * n * p,
+            dklen=64,
+        )
+    elif isinstance(hasher, Argon2PasswordHasher):
+        argon2 = hasher._load_library()
+        run = lambda: argon2.low_level.hash_secret(  # noqa: E731
+            CALIBRATION_PASSWORD.encode(),
+            CALIBRATION_SALT.encode(),
+            time_cost=parameters['time_cost'],
+            memory_cost=hasher.memory_cost,
+            parallelism=hasher.parallelism,
+            hash_len=argon2.DEFAULT_HASH_LENGTH,
+            type=argon2.low_level.Type.ID,
+        )
+    else:
+        raise ValueError("Cannot tune the '%s' password hasher" % hasher.algorithm)
+
+    # The best of three runs filters out scheduling noise.
+    timings = []
+    for _ in range(3):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def django_hasher(hasher):
+    """The Django hasher class ``hasher`` derives from, which carries Django's recommended cost."""
+    return next(cls for cls in type(hasher).__mro__ if cls.__module__ == 'django.contrib.auth.hashers')
+
+
+def weaker_parameters(hasher, parameters):
+    """Names of the ``parameters`` that fall below Django's defaults for ``hasher``."""
+    defaults = django_hasher(hasher)
+    return [name for name, value in parameters.items() if value < getattr(defaults, name, value)]
+
+
+def calibrate(hasher, target):
+    """
+    Pick the parameters of ``hasher`` whose cost comes closest to ``target``
+    seconds, never below Django's defaults.
+    """
+    if isinstance(hasher, PBKDF2PasswordHasher):
+        probe = 50_000
+        elapsed = measure(hasher, iterations=probe)
+        # PBKDF2 is linear in its iterations.
+        parameters = {'iterations': int(probe * target / elapsed) // 10_000 * 10_000}
+    elif isinstance(hasher, ScryptPasswordHasher):
+        work_factor = 2 ** 14
+        elapsed = measure(hasher, work_factor=work_factor)
+        # scrypt needs a power of two and is roughly linear in it.
+        while elapsed * 2 <= target:
+            work_factor *= 2
+            elapsed *= 2
+        parameters = {'work_factor': work_factor}
+    elif isinstance(hasher, Argon2PasswordHasher):
+        elapsed = measure(hasher, time_cost=1)
+        parameters = {'time_cost': int(target / elapsed)}
+    else:
+        raise ValueError("Cannot tune the '%s' password hasher" % hasher.algorithm)
+
+    defaults = django_hasher(hasher)
+    return {name: max(value, getattr(defaults, name)) for name, value in parameters.items()}
+
+
+def check_hasher_settings(**kwargs):
+    """
+    Warn about configured parameters below Django's defaults, and about a
+    calibration cache that each process keeps to itself. Hashes nothing, the
+    calibration runs on the first hash that needs it.
+    """
+    for algorithm, parameters in knight_auth_settings.PASSWORD_HASH_PARAMETERS.items():
+        try:
+            hasher = get_hasher(algorithm)
+        except ValueError:
+            continue
+        weaker = weaker_parameters(hasher, parameters)
+        if weaker:
+            logger.warning(
+                "PASSWORD_HASH_PARAMETERS: %s is below the Django default for %s.", ', '.join(weaker), algorithm
+            )
+
+    if knight_auth_settings.PASSWORD_HASH_TARGET_MS is not None:
+        cache = calibration_cache()
+        if cache is None or isinstance(cache, PER_PROCESS_CACHES):
+            logger.warning(
+                "PASSWORD_HASH_TARGET_MS: calibrations are not shared between processes. Each one measures "
+                "the hasher on its own and may settle on a different cost, rehashing the passwords of the others. "
+                "Point PASSWORD_HASH_CALIBRATION_CACHE_ALIAS at a shared cache, or set PASSWORD_HASH_PARAMETERS."
+            )
+
+
+def describe_hash(encoded):
+    """Return ``(scheme, current)`` for a stored password."""
+    if encoded is None or encoded.startswith(UNUSABLE_PASSWORD_PREFIX):
+        return 'unusable', True
+
+    try:
+        hasher = identify_hasher(encoded)
+        decoded = hasher.decode(encoded)
+    except (ValueError, ImportError):
+        return 'unknown', False
+
+    parameters = ', '.join(
+        '%s=%s' % (name, decoded[name])
+        for name in ('iterations', 'work_factor', 'block_size', 'parallelism', 'time_cost', 'memory_cost')
+        if name in decoded
+    )
+    scheme = '%s (%s)' % (hasher.algorithm, parameters) if parameters else hasher.algorithm
+    current = hasher.algorithm == get_hasher().algorithm and not hasher.must_update(encoded)
+    return scheme, current
+
+
+def hash_distribution(chunk_size=2000):
+    """Count users per password scheme, as ``{(scheme, current): count}``."""
+    distribution = Counter()
+    passwords = get_user_model()._default_manager.values_list('password', flat=True)
+    for encoded in passwords.iterator(chunk_size=chunk_size):
+        distribution[describe_hash(encoded)] += 1
+    return distribution
+
+
+def reset_calibration(*args, **kwargs):
+    if kwargs['setting'] in ('KNIGHT_AUTH', 'PASSWORD_HASHERS'):
+        _calibrated.clear()
+
+
+setting_changed.connect(reset_calibration)
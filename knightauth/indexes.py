@@ -0,0 +1,82 @@
+from django.db import migrations
+from django.db.models import Index
+
+COVERED_TOKEN_FIELDS = ('digest', 'digest_scheme', 'user', 'expiry', 'generation')
+
+
+class AutoNamedIndex(Index):
+    """
+    ``Index`` named by Django even when it has a ``condition``.
+
+    Django only generates names, derived from the table name and hence
+    distinct across apps and models, for indexes without a condition. An
+    explicit name template cannot hold the app label and the class name of
+    a model such as ``CompactAuthToken`` in the 30 characters allowed.
+    """
+
+    def __init__(self, *expressions, condition=None, **kwargs):
+        super().__init__(*expressions, **kwargs)
+        self.condition = condition
+
+
+class AddPartialIndex(migrations.AddIndex):
+    """
+    ``AddIndex`` for an index with a ``condition`` that creates the index
+    without the condition on backends lacking partial indexes, instead of
+    skipping it as ``AddIndex`` does.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            index = self.index
+            if index.condition is not None and not schema_editor.connection.features.supports_partial_indexes:
+                _, args, kwargs = index.deconstruct()
+                del kwargs['condition']
+                index = Index(*args, **kwargs)
+            schema_editor.add_index(model, index)
+
+
+def token_key_covering_index(name):
+    return Index(fields=['token_key'], include=list(COVERED_TOKEN_FIELDS), name=name)
+
+
+class AddTokenKeyCoveringIndex(migrations.operations.base.Operation):
+    """
+    Migration operation adding a covering index for the token lookup of
+    ``TokenAuthentication``, so the token row is read from the index alone.
+
+    Only PostgreSQL supports covering indexes, elsewhere this does nothing.
+    The index is not part of the model state.
+    """
+
+    reversible = True
+
+    def __init__(self, model='knightauth.AuthToken', name=None):
+        self.model = model
+        self.name = name or '%s_key_cover' % model.rpartition('.')[2].lower()
+
+    def deconstruct(self):
+        return self.__class__.__name__, [], {'model': self.model, 'name': self.name}
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(self.model)
+        if self._applies(schema_editor, model):
+            schema_editor.add_index(model, token_key_covering_index(self.name))
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = from_state.apps.get_model(self.model)
+        if self._applies(schema_editor, model):
+            schema_editor.remove_index(model, token_key_covering_index(self.name))
+
+    def _applies(self, schema_editor, model):
+        return (
+            schema_editor.connection.features.supports_covering_indexes
+            and self.allow_migrate_model(schema_editor.connection.alias, model)
+        )
+
+    def describe(self):
+        return 'Add covering index %s on %s.token_key' % (self.name, self.model)
@@ -0,0 +1,30 @@
+from knightauth.models import get_token_model
+from knightauth.pagination import KeysetPaginator
+
+
+def token_paginator(user_id, per_page):
+    """Active tokens of the user, newest first, backed by the (user, created) index."""
+    auth_tokens = get_token_model().objects.active(user_id).only('pk', 'created', 'expiry', 'token_key')
+    return KeysetPaginator(auth_tokens, fields=('created', 'pk'), per_page=per_page)
+
+
+def deferred_token_fields(auth_token):
+    # Authentication only loads the fields it verifies with.
+    return sorted(auth_token.get_deferred_fields() & {'created', 'token_key'})
+
+
+def describe_token(auth_token, current_pk=None):
+    return {
+        "created": auth_token.created,
+        "expiry": auth_token.expiry,
+        "token_key": auth_token.display_key,
+        "current": auth_token.pk == current_pk,
+    }
+
+
+def request_user_id(request):
+    # Token authentication knows the user id without loading the user.
+    auth_token = getattr(request, '_auth', None)
+    if auth_token is not None:
+        return auth_token.user_id
+    return request.auth.pk
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from knightauth.settings import knight_auth_settings
+from knightauth.token_filter import LiveTokenFilter
+
+
+class Command(BaseCommand):
+    help = 'Builds the live token filter from the token table and writes its snapshot for workers to map.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            default=knight_auth_settings.TOKEN_FILTER_SNAPSHOT,
+            help='Snapshot file. Defaults to TOKEN_FILTER_SNAPSHOT.'
+        )
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Token keys loaded per query.')
+
+    def handle(self, *args, **options):
+        if not options['output']:
+            raise CommandError('Set TOKEN_FILTER_SNAPSHOT or pass --output.')
+
+        token_filter = LiveTokenFilter(snapshot_path=options['output'])
+        token_filter.build(chunk_size=options['chunk_size'])
+        token_filter.save()
+
+        stats = token_filter.stats()
+        self.stdout.write('Wrote %d token key(s) to %s (%d bytes, %s false positive rate at %d keys).' % (
+            stats['keys'], options['output'], stats['bytes'], stats['error_rate'], stats['capacity']
+        ))
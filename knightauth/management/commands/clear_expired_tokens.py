@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from knightauth.expiry import delete_expired_tokens
+from knightauth.settings import knight_auth_settings
+
+
+class Command(BaseCommand):
+    help = 'Deletes expired authentication tokens in bounded batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=knight_auth_settings.EXPIRY_BATCH_SIZE,
+            help='Maximum number of tokens deleted per statement.'
+        )
+
+    def handle(self, *args, **options):
+        deleted = delete_expired_tokens(batch_size=options['batch_size'])
+        self.stdout.write('Deleted %d expired token(s).' % deleted)
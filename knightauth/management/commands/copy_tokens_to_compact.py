@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from knightauth.compact import COPY_BATCH_SIZE, copy_tokens_to_compact
+from knightauth.models import AuthToken, CompactAuthToken
+
+
+class Command(BaseCommand):
+    help = 'Copies AuthToken rows to CompactAuthToken, skipping tokens copied before.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database to copy the tokens in.')
+        parser.add_argument('--batch-size', type=int, default=COPY_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        copied = copy_tokens_to_compact(
+            AuthToken, CompactAuthToken, using=options['database'], batch_size=options['batch_size']
+        )
+        self.stdout.write('Copied %d token(s).' % copied)
@@ -0,0 +1,69 @@
+import sys
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from knightauth.models import get_token_model
+from knightauth.settings import knight_auth_settings
+
+
+class Command(BaseCommand):
+    help = 'Issues tokens in bulk and writes them to a file, one token per line.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='+', help='Users to issue tokens for.')
+        parser.add_argument('--count', type=int, default=1, help='Number of tokens per user.')
+        parser.add_argument(
+            '--expiry',
+            type=int,
+            default=None,
+            help='Token lifetime in seconds. Defaults to TOKEN_TTL, 0 issues tokens that never expire.'
+        )
+        parser.add_argument('--prefix', default=knight_auth_settings.TOKEN_PREFIX)
+        parser.add_argument('--batch-size', type=int, default=knight_auth_settings.BULK_ISSUE_BATCH_SIZE)
+        parser.add_argument('--output', default='-', help="File to write the tokens to, '-' for stdout.")
+        parser.add_argument(
+            '--with-username',
+            action='store_true',
+            help='Prefix each token with the username and a tab.'
+        )
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        usernames = options['usernames']
+        users = {
+            user.get_username(): user
+            for user in User._default_manager.filter(**{'%s__in' % User.USERNAME_FIELD: usernames})
+        }
+        missing = set(usernames) - set(users)
+        if missing:
+            raise CommandError('Unknown user(s): %s' % ', '.join(sorted(missing)))
+
+        if options['expiry'] is None:
+            expiry = knight_auth_settings.TOKEN_TTL
+        else:
+            expiry = timedelta(seconds=options['expiry']) if options['expiry'] else None
+
+        issued = get_token_model().objects.bulk_issue(
+            [users[username] for username in dict.fromkeys(usernames)],
+            options['count'],
+            expiry=expiry,
+            prefix=options['prefix'],
+            batch_size=options['batch_size']
+        )
+
+        output = sys.stdout if options['output'] == '-' else open(options['output'], 'w')
+        try:
+            total = 0
+            for instance, token in issued:
+                if options['with_username']:
+                    output.write('%s\t%s\n' % (instance.user.get_username(), token))
+                else:
+                    output.write('%s\n' % token)
+                total += 1
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+        self.stderr.write('Issued %d token(s).' % total)
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from knightauth.hashers import hash_distribution
+
+
+class Command(BaseCommand):
+    help = 'Reports how many users have their password stored with each hasher and its parameters.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Users loaded per query.')
+
+    def handle(self, *args, **options):
+        distribution = hash_distribution(chunk_size=options['chunk_size'])
+        total = sum(distribution.values())
+        if not total:
+            self.stdout.write('No users.')
+            return
+
+        self.stdout.write('%8s %7s  %-9s %s' % ('users', '%', 'status', 'scheme'))
+        for (scheme, current), count in distribution.most_common():
+            self.stdout.write('%8d %6.1f%%  %-9s %s' % (
+                count, count * 100 / total, 'current' if current else 'outdated', scheme
+            ))
+        outdated = sum(count for (_, current), count in distribution.items() if not current)
+        self.stdout.write('%d of %d user(s) will be rehashed on their next login.' % (outdated, total))
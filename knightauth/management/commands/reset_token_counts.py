@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from knightauth.quota import recount_token_slots
+
+
+class Command(BaseCommand):
+    help = 'Recounts the per-user token counters from the token table.'
+
+    def handle(self, *args, **options):
+        updated = recount_token_slots()
+        self.stdout.write('Recounted %d token counter(s).' % updated)
@@ -0,0 +1,54 @@
+from django.contrib.auth.hashers import get_hasher
+from django.core.management.base import BaseCommand, CommandError
+
+from knightauth.hashers import calibrate, measure, save_calibration
+from knightauth.settings import knight_auth_settings
+
+
+class Command(BaseCommand):
+    help = 'Measures the password hasher on this host and suggests parameters for a target login latency.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--target-ms',
+            type=float,
+            default=knight_auth_settings.PASSWORD_HASH_TARGET_MS or 100,
+            help='Time one password hash should take, in milliseconds.'
+        )
+        parser.add_argument('--algorithm', default='default', help='Defaults to the preferred hasher.')
+        parser.add_argument(
+            '--save',
+            action='store_true',
+            help='Store the parameters as the calibration every process uses for PASSWORD_HASH_TARGET_MS.'
+        )
+
+    def handle(self, *args, **options):
+        if options['save'] and options['target_ms'] != knight_auth_settings.PASSWORD_HASH_TARGET_MS:
+            raise CommandError('--save requires --target-ms to match PASSWORD_HASH_TARGET_MS.')
+
+        try:
+            hasher = get_hasher(options['algorithm'])
+            parameters = calibrate(hasher, options['target_ms'] / 1000)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        elapsed = measure(hasher, **parameters)
+        self.stdout.write('%s: %s takes %.1fms' % (
+            hasher.algorithm,
+            ', '.join('%s=%s' % item for item in parameters.items()),
+            elapsed * 1e3
+        ))
+        self.stdout.write("KNIGHT_AUTH['PASSWORD_HASH_PARAMETERS'] = {%r: %r}" % (hasher.algorithm, parameters))
+
+        # Calibration never goes below Django's defaults, which may cost more than the target.
+        if elapsed * 1e3 > options['target_ms'] * 1.5:
+            self.stderr.write(
+                'Warning: the Django default for %s takes longer than the target.' % hasher.algorithm
+            )
+
+        if options['save']:
+            try:
+                save_calibration(hasher.algorithm, parameters)
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write('Saved the calibration of %s.' % hasher.algorithm)
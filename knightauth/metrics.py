@@ -0,0 +1,249 @@
+import bisect
+import threading
+import time
+import weakref
+from collections import namedtuple
+from contextlib import contextmanager
+
+from django.http import HttpResponse
+
+from knightauth.settings import knight_auth_settings
+
+MetricFamily = namedtuple('MetricFamily', ('name', 'kind', 'help', 'samples'))
+Sample = namedtuple('Sample', ('name', 'labels', 'value'))
+
+EXPOSITION_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class _ShardOwner:
+    """Stored in a thread's locals, collected when the thread ends."""
+
+
+class ThreadShards:
+    """
+    Per-thread dicts of values, summed when read.
+
+    Each thread only ever writes its own dict, so recording takes no lock.
+    The lock is taken once per thread, to register its dict, on reads, and
+    when the thread ends and its values are folded into a shared base dict
+    with ``merge``.
+    """
+
+    def __init__(self, merge):
+        self._merge = merge
+        self._local = threading.local()
+        self._base = {}
+        self._shards = []
+        self._lock = threading.Lock()
+
+    def shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            self._local.owner = _ShardOwner()
+            with self._lock:
+                self._shards.append(shard)
+            finalizer = weakref.finalize(self._local.owner, self._retire, shard)
+            finalizer.atexit = False
+        return shard
+
+    def _retire(self, shard):
+        with self._lock:
+            self._shards = [other for other in self._shards if other is not shard]
+            for key, value in shard.items():
+                self._base[key] = self._merge(self._base[key], value) if key in self._base else value
+
+    def snapshots(self):
+        with self._lock:
+            base = self._base.copy()
+            shards = list(self._shards)
+        # dict.copy() is atomic under the GIL.
+        return [base] + [shard.copy() for shard in shards]
+
+    def clear(self):
+        with self._lock:
+            self._base.clear()
+            for shard in self._shards:
+                shard.clear()
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._shards = ThreadShards(merge=lambda total, value: total + value)
+
+    def inc(self, *labelvalues, amount=1):
+        if not knight_auth_settings.METRICS:
+            return
+        shard = self._shards.shard()
+        shard[labelvalues] = shard.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues):
+        return sum(shard.get(labelvalues, 0) for shard in self._shards.snapshots())
+
+    def collect(self):
+        totals = {}
+        for shard in self._shards.snapshots():
+            for labelvalues, value in shard.items():
+                totals[labelvalues] = totals.get(labelvalues, 0) + value
+        return MetricFamily(self.name, 'counter', self.help, [
+            Sample(self.name, dict(zip(self.labelnames, labelvalues)), value)
+            for labelvalues, value in sorted(totals.items())
+        ])
+
+    def clear(self):
+        self._shards.clear()
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._shards = ThreadShards(merge=lambda total, values: [a + b for a, b in zip(total, values)])
+
+    def observe(self, value, *labelvalues):
+        if not knight_auth_settings.METRICS:
+            return
+        shard = self._shards.shard()
+        # One count per bucket, then the count above the last bucket and the sum.
+        values = shard.get(labelvalues)
+        if values is None:
+            values = shard[labelvalues] = [0] * (len(self.buckets) + 2)
+        values[bisect.bisect_left(self.buckets, value)] += 1
+        values[-1] += value
+
+    @contextmanager
+    def time(self, *labelvalues):
+        if not knight_auth_settings.METRICS:
+            yield
+            return
+        start = time.perf_counter()
+        yield
+        # Calls that raise, such as a rejected hashing job, are not timed.
+        self.observe(time.perf_counter() - start, *labelvalues)
+
+    def collect(self):
+        totals = {}
+        for shard in self._shards.snapshots():
+            for labelvalues, values in shard.items():
+                total = totals.setdefault(labelvalues, [0] * len(values))
+                for index, value in enumerate(values):
+                    total[index] += value
+
+        samples = []
+        for labelvalues, values in sorted(totals.items()):
+            labels = dict(zip(self.labelnames, labelvalues))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), values):
+                cumulative += count
+                samples.append(Sample(self.name + '_bucket', {**labels, 'le': _format_value(bound)}, cumulative))
+            samples.append(Sample(self.name + '_sum', labels, values[-1]))
+            samples.append(Sample(self.name + '_count', labels, cumulative))
+        return MetricFamily(self.name, 'histogram', self.help, samples)
+
+    def clear(self):
+        self._shards.clear()
+
+
+authentications = Counter(
+    'knightauth_authentications_total',
+    'Token authentications by result. Rejected ones were refused before any token lookup.',
+    ('result',)
+)
+token_cache_lookups = Counter(
+    'knightauth_token_cache_lookups_total',
+    'Token verification cache lookups by result.',
+    ('result',)
+)
+token_digests = Counter('knightauth_token_digests_total', 'Token digests computed, by scheme.', ('scheme',))
+token_refreshes = Counter(
+    'knightauth_token_refreshes_total',
+    'Token expiry refreshes, written right away or buffered for a write-behind flush.',
+    ('mode',)
+)
+tokens_expired = Counter('knightauth_tokens_expired_total', 'Expired tokens deleted, by source.', ('source',))
+logins = Counter('knightauth_logins_total', 'Token logins by result.', ('result',))
+password_hash_seconds = Histogram(
+    'knightauth_password_hash_seconds',
+    'Time token_login spends checking credentials, password hashing included.'
+)
+
+REGISTRY = [
+    authentications,
+    token_cache_lookups,
+    token_digests,
+    token_refreshes,
+    tokens_expired,
+    logins,
+    password_hash_seconds,
+]
+
+
+def collect():
+    return [metric.collect() for metric in REGISTRY]
+
+
+def clear():
+    for metric in REGISTRY:
+        metric.clear()
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def render(families=None):
+    """Render ``families``, by default every metric of this process, in the Prometheus text format."""
+    lines = []
+    for family in collect() if families is None else families:
+        lines.append('# HELP %s %s' % (family.name, family.help))
+        lines.append('# TYPE %s %s' % (family.name, family.kind))
+        for sample in family.samples:
+            labels = ','.join('%s="%s"' % (name, _escape(value)) for name, value in sample.labels.items())
+            lines.append('%s%s %s' % (sample.name, '{%s}' % labels if labels else '', _format_value(sample.value)))
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """Metrics of the process serving the request, for a Prometheus scraper."""
+    return HttpResponse(render(), content_type=EXPOSITION_CONTENT_TYPE)
+
+
+_next_export = 0
+_export_lock = threading.Lock()
+
+
+def export_metrics_if_due(**kwargs):
+    """Hand the metrics to ``METRICS_EXPORTER`` at most every ``METRICS_EXPORT_INTERVAL`` seconds."""
+    global _next_export
+    exporter = knight_auth_settings.METRICS_EXPORTER
+    if exporter is None or not knight_auth_settings.METRICS or time.monotonic() < _next_export:
+        return
+    # Another thread is exporting already.
+    if not _export_lock.acquire(blocking=False):
+        return
+    try:
+        _next_export = time.monotonic() + knight_auth_settings.METRICS_EXPORT_INTERVAL
+        exporter(collect())
+    finally:
+        _export_lock.release()
+
+
+def count_expired_token(sender, source=None, **kwargs):
+    tokens_expired.inc(source or 'unknown')
+
+
+def count_expired_tokens(sender, count=0, **kwargs):
+    tokens_expired.inc('expiry_sweep', amount=count)
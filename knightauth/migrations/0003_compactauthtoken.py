@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from knightauth.compact import copy_tokens_to_compact as copy_tokens
+from knightauth.settings import knight_auth_settings
+
+
+def copy_tokens_to_compact(apps, schema_editor):
+    # Projects switching later copy their tokens with the copy_tokens_to_compact command.
+    if knight_auth_settings.TOKEN_MODEL != 'knightauth.CompactAuthToken':
+        return
+
+    copy_tokens(
+        apps.get_model('knightauth', 'AuthToken'),
+        apps.get_model('knightauth', 'CompactAuthToken'),
+        using=schema_editor.connection.alias
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knightauth', '0002_digest_scheme'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompactAuthToken',
+            fields=[
+                ('digest_scheme', models.PositiveSmallIntegerField(default=0)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('expiry', models.DateTimeField(blank=True, null=True)),
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('digest', models.BinaryField(max_length=64)),
+                ('token_key', models.BigIntegerField(db_index=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='compact_auth_token_set', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.RunPython(copy_tokens_to_compact, migrations.RunPython.noop),
+    ]
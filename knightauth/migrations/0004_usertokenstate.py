@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:28
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('knightauth', '0003_compactauthtoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserTokenState',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='knight_auth_state', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('token_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knightauth', '0004_usertokenstate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeniedToken',
+            fields=[
+                ('jti', models.CharField(max_length=128, primary_key=True, serialize=False)),
+                ('expiry', models.DateTimeField(blank=True, db_index=True, null=True)),
+            ],
+        ),
+    ]
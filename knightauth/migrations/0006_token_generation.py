@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knightauth', '0005_deniedtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authtoken',
+            name='generation',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='compactauthtoken',
+            name='generation',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='usertokenstate',
+            name='generation',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knightauth', '0006_token_generation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='authtoken',
+            index=models.Index(fields=['user', 'created'], name='authtoken_user_created'),
+        ),
+        migrations.AddIndex(
+            model_name='compactauthtoken',
+            index=models.Index(fields=['user', 'created'], name='compactauthtoken_user_created'),
+        ),
+    ]
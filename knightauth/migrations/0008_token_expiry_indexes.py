@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+import knightauth.indexes
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knightauth', '0007_token_user_created'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='authtoken',
+            index=models.Index(fields=['user', 'expiry'], name='authtoken_user_expiry'),
+        ),
+        knightauth.indexes.AddPartialIndex(
+            model_name='authtoken',
+            index=models.Index(condition=models.Q(('expiry__isnull', False)), fields=['expiry'], name='authtoken_expiry'),
+        ),
+        migrations.AddIndex(
+            model_name='compactauthtoken',
+            index=models.Index(fields=['user', 'expiry'], name='compactauthtoken_user_expiry'),
+        ),
+        knightauth.indexes.AddPartialIndex(
+            model_name='compactauthtoken',
+            index=models.Index(condition=models.Q(('expiry__isnull', False)), fields=['expiry'], name='compactauthtoken_expiry'),
+        ),
+    ]
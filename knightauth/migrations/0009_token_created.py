@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knightauth', '0008_token_expiry_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='authtoken',
+            index=models.Index(fields=['created'], name='authtoken_created'),
+        ),
+        migrations.AddIndex(
+            model_name='compactauthtoken',
+            index=models.Index(fields=['created'], name='compactauthtoken_created'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knightauth', '0010_token_user_no_fk_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authtoken',
+            name='jti',
+            field=models.CharField(blank=True, max_length=32, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='compactauthtoken',
+            name='jti',
+            field=models.CharField(blank=True, max_length=32, null=True, unique=True),
+        ),
+    ]
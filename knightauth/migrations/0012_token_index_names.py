@@ -0,0 +1,86 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:57
+
+import knightauth.indexes
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knightauth', '0011_token_jti'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RenameIndex(
+            model_name='authtoken',
+            new_name='knightauth__user_id_56ddf6_idx',
+            old_name='authtoken_user_created',
+        ),
+        migrations.RenameIndex(
+            model_name='authtoken',
+            new_name='knightauth__user_id_5908de_idx',
+            old_name='authtoken_user_expiry',
+        ),
+        migrations.RenameIndex(
+            model_name='authtoken',
+            new_name='knightauth__created_a7c453_idx',
+            old_name='authtoken_created',
+        ),
+        migrations.RenameIndex(
+            model_name='compactauthtoken',
+            new_name='knightauth__user_id_d3c0b4_idx',
+            old_name='compactauthtoken_user_created',
+        ),
+        migrations.RenameIndex(
+            model_name='compactauthtoken',
+            new_name='knightauth__user_id_2bd410_idx',
+            old_name='compactauthtoken_user_expiry',
+        ),
+        migrations.RenameIndex(
+            model_name='compactauthtoken',
+            new_name='knightauth__created_8a8e39_idx',
+            old_name='compactauthtoken_created',
+        ),
+        # The partial index keeps its definition, only its class changes in the state.
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RenameIndex(
+                    model_name='authtoken',
+                    new_name='knightauth__expiry_2d37f7_idx',
+                    old_name='authtoken_expiry',
+                ),
+            ],
+            state_operations=[
+                migrations.RemoveIndex(
+                    model_name='authtoken',
+                    name='authtoken_expiry',
+                ),
+                migrations.AddIndex(
+                    model_name='authtoken',
+                    index=knightauth.indexes.AutoNamedIndex(condition=models.Q(('expiry__isnull', False)), fields=['expiry'], name='knightauth__expiry_2d37f7_idx'),
+                ),
+            ],
+        ),
+        # The partial index keeps its definition, only its class changes in the state.
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RenameIndex(
+                    model_name='compactauthtoken',
+                    new_name='knightauth__expiry_9c0861_idx',
+                    old_name='compactauthtoken_expiry',
+                ),
+            ],
+            state_operations=[
+                migrations.RemoveIndex(
+                    model_name='compactauthtoken',
+                    name='compactauthtoken_expiry',
+                ),
+                migrations.AddIndex(
+                    model_name='compactauthtoken',
+                    index=knightauth.indexes.AutoNamedIndex(condition=models.Q(('expiry__isnull', False)), fields=['expiry'], name='knightauth__expiry_9c0861_idx'),
+                ),
+            ],
+        ),
+    ]
@@ -1,14 +1,16 @@
 from django.apps import apps
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ImproperlyConfigured
-from django.db import models
+from django.db import models, router
+from django.db.models import Q, Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
-from knightauth import crypto
+from knightauth import crypto, signing
+from knightauth.cache import aforget_missing_tokens, forget_missing_tokens
+from knightauth.indexes import AutoNamedIndex
 from knightauth.settings import CONSTANTS, knight_auth_settings
 
-sha = knight_auth_settings.SECURE_HASH_ALGORITHM
-
 User = get_user_model()
 
 
@@ -19,23 +21,125 @@ class AuthTokenManager(models.Manager):
             expiry=knight_auth_settings.TOKEN_TTL,
             prefix=knight_auth_settings.TOKEN_PREFIX
     ):
+        fields, token = self._generate_token(user, expiry, prefix, self._token_generation(user.pk))
+        instance = super(AuthTokenManager, self).create(**fields)
+        forget_missing_tokens([instance.token_key])
+        return instance, self._issued_token(instance, token, prefix)
+
+    async def acreate(
+            self,
+            user,
+            expiry=knight_auth_settings.TOKEN_TTL,
+            prefix=knight_auth_settings.TOKEN_PREFIX
+    ):
+        fields, token = self._generate_token(user, expiry, prefix, await self._atoken_generation(user.pk))
+        instance = await super(AuthTokenManager, self).acreate(**fields)
+        await aforget_missing_tokens([instance.token_key])
+        return instance, self._issued_token(instance, token, prefix)
+
+    def bulk_issue(
+            self,
+            user_or_users,
+            count,
+            expiry=knight_auth_settings.TOKEN_TTL,
+            prefix=knight_auth_settings.TOKEN_PREFIX,
+            batch_size=None
+    ):
+        """
+        Issue ``count`` tokens for each given user.
+
+        Tokens are inserted with ``bulk_create`` in chunks of ``batch_size``
+        and yielded as ``(instance, token)`` pairs once their chunk is stored.
+        """
+        from knightauth.quota import add_token_slots
+        from knightauth.token_filter import add_token_keys
+
+        users = [user_or_users] if isinstance(user_or_users, models.Model) else list(user_or_users)
+        batch_size = batch_size or knight_auth_settings.BULK_ISSUE_BATCH_SIZE
+        digest_scheme = crypto.get_digest_scheme()
+        if expiry is not None:
+            expiry = timezone.now() + expiry
+
+        for user in users:
+            generation = self._token_generation(user.pk)
+            remaining = count
+            while remaining > 0:
+                chunk_size = min(batch_size, remaining)
+                remaining -= chunk_size
+
+                tokens = [prefix + token for token in crypto.create_token_strings(chunk_size)]
+                instances = self.bulk_create(
+                    [
+                        self.model(**self._token_fields(user, token, digest_scheme, expiry, generation))
+                        for token in tokens
+                    ],
+                    batch_size=batch_size
+                )
+                add_token_slots({user.pk: chunk_size})
+                # bulk_create sends no post_save.
+                token_keys = [instance.token_key for instance in instances]
+                add_token_keys(token_keys)
+                forget_missing_tokens(token_keys)
+
+                for instance, token in zip(instances, tokens):
+                    yield instance, self._issued_token(instance, token, prefix)
+
+    def active(self, user_id):
+        """Tokens of the user that still verify: not expired and issued in the current generation."""
+        return self.filter(
+            Q(expiry__isnull=True) | Q(expiry__gt=timezone.now()),
+            user_id=user_id,
+            generation=Coalesce(
+                UserTokenState.objects.filter(user_id=user_id).values('generation')[:1],
+                Value(0)
+            )
+        )
+
+    def _generate_token(self, user, expiry, prefix, generation=0):
         token = prefix + crypto.create_token_string()
-        digest = crypto.hash_token(token)
         if expiry is not None:
             expiry = timezone.now() + expiry
-        instance = super(AuthTokenManager, self).create(
-            token_key=token[:CONSTANTS.TOKEN_KEY_LENGTH], digest=digest,
-            user=user, expiry=expiry)
-        return instance, token
+        return self._token_fields(user, token, crypto.get_digest_scheme(), expiry, generation), token
+
+    def _token_generation(self, user_id):
+        # Tokens are only valid while their generation matches the user's.
+        return UserTokenState.objects.filter(user_id=user_id).values_list('generation', flat=True).first() or 0
+
+    async def _atoken_generation(self, user_id):
+        return await UserTokenState.objects.filter(user_id=user_id).values_list('generation', flat=True).afirst() or 0
+
+    def _issued_token(self, instance, token, prefix):
+        # With SIGNED_TOKENS the row is kept for listing and revocation, but
+        # clients receive a signed token that verifies without a query.
+        if signing.signed_tokens_enabled():
+            return signing.sign_token(instance, prefix)
+        return token
+
+    def _token_fields(self, user, token, digest_scheme, expiry, generation):
+        digest = crypto.hash_token(token, digest_scheme)
+        return {
+            'token_key': self.model.get_token_key(token),
+            'digest': self.model.encode_digest(digest),
+            'digest_scheme': digest_scheme,
+            'user': user,
+            'expiry': expiry,
+            'generation': generation,
+            'jti': signing.new_jti() if signing.signed_tokens_enabled() else None,
+        }
 
 
 class AbstractAuthToken(models.Model):
     objects = AuthTokenManager()
 
+    # Set on instances rebuilt from a signed token, which carry their jti
+    # but no digest or primary key.
+    is_signed = False
+
     digest = models.CharField(
         max_length=CONSTANTS.DIGEST_LENGTH,
         primary_key=True
     )
+    digest_scheme = models.PositiveSmallIntegerField(default=crypto.DIGEST_SCHEME_LEGACY)
     token_key = models.CharField(
         max_length=CONSTANTS.MAXIMUM_TOKEN_PREFIX_LENGTH + CONSTANTS.TOKEN_KEY_LENGTH,
         db_index=True
@@ -45,23 +149,129 @@ class AbstractAuthToken(models.Model):
         null=False,
         blank=False,
         related_name='auth_token_set',
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        # The (user, created) and (user, expiry) indexes serve lookups by user.
+        db_index=False
     )
     created = models.DateTimeField(auto_now_add=True)
     expiry = models.DateTimeField(null=True, blank=True)
+    generation = models.PositiveIntegerField(default=0)
+    # Random id that signed tokens refer to, so they do not reveal the primary key.
+    jti = models.CharField(max_length=CONSTANTS.JTI_LENGTH, null=True, blank=True, unique=True)
 
     class Meta:
         abstract = True
+        # Unnamed, so Django generates names that are distinct across apps and models.
+        indexes = [
+            # Keyset pagination of a user's tokens, newest first.
+            models.Index(fields=['user', 'created']),
+            # Expired tokens of one user, for the token limit.
+            models.Index(fields=['user', 'expiry']),
+            # Expiry sweeps; tokens that never expire are left out where the backend allows.
+            AutoNamedIndex(fields=['expiry'], condition=Q(expiry__isnull=False)),
+            # Tokens created since the live token filter last caught up.
+            models.Index(fields=['created']),
+        ]
 
     def __str__(self):
-        return '%s : %s' % (self.digest, self.user)
+        return '%s : %s' % (self.hexdigest, self.user)
+
+    @property
+    def hexdigest(self):
+        return self.digest
+
+    @property
+    def display_key(self):
+        """The leading characters of the token, safe to show to its owner."""
+        return self.token_key
+
+    @classmethod
+    def get_token_key(cls, token):
+        return token[:CONSTANTS.TOKEN_KEY_LENGTH]
+
+    @classmethod
+    def encode_digest(cls, digest):
+        return digest
+
+    @classmethod
+    def from_values(cls, pk, **values):
+        """An instance holding only ``pk`` and ``values``, as if they were loaded from the database."""
+        values[cls._meta.pk.attname] = pk
+        # from_db() expects the loaded values in concrete field order.
+        field_names = [field.attname for field in cls._meta.concrete_fields if field.attname in values]
+        return cls.from_db(router.db_for_read(cls), field_names, [values[name] for name in field_names])
 
 
 class AuthToken(AbstractAuthToken):
-    class Meta:
+    class Meta(AbstractAuthToken.Meta):
         swappable = 'KNIGHT_AUTH_TOKEN_MODEL'
 
 
+class AbstractCompactAuthToken(AbstractAuthToken):
+    """
+    Token model storing the digest as raw bytes and the lookup key as a
+    64-bit integer, behind an integer primary key.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    digest = models.BinaryField(max_length=CONSTANTS.DIGEST_LENGTH // 2)
+    token_key = models.BigIntegerField(db_index=True)
+    user = models.ForeignKey(
+        User,
+        null=False,
+        blank=False,
+        related_name='compact_auth_token_set',
+        on_delete=models.CASCADE,
+        db_index=False
+    )
+
+    class Meta(AbstractAuthToken.Meta):
+        abstract = True
+
+    @property
+    def hexdigest(self):
+        return bytes(self.digest).hex()
+
+    @property
+    def display_key(self):
+        # Only a hash of the leading characters is stored.
+        return None
+
+    @classmethod
+    def get_token_key(cls, token):
+        return crypto.compact_token_key(super().get_token_key(token))
+
+    @classmethod
+    def encode_digest(cls, digest):
+        return bytes.fromhex(digest)
+
+
+class CompactAuthToken(AbstractCompactAuthToken):
+    pass
+
+
+class UserTokenState(models.Model):
+    user = models.OneToOneField(
+        User,
+        primary_key=True,
+        related_name='knight_auth_state',
+        on_delete=models.CASCADE
+    )
+    token_count = models.PositiveIntegerField(default=0)
+    generation = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return '%s : %s' % (self.user, self.token_count)
+
+
+class DeniedToken(models.Model):
+    jti = models.CharField(max_length=CONSTANTS.DIGEST_LENGTH, primary_key=True)
+    expiry = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    def __str__(self):
+        return self.jti
+
+
 def get_token_model():
     try:
         return apps.get_model(knight_auth_settings.TOKEN_MODEL, require_ready=False)
@@ -0,0 +1,83 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _json_default(value):
+    # Full precision: a cursor rounded to milliseconds would skip rows.
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+class KeysetPaginator:
+    """
+    Pages through a queryset in descending order of ``fields`` without
+    OFFSET or COUNT(*).
+
+    The cursor records the ordering values of the last row of a page and
+    the next page starts right after them, so every page costs the same
+    index range scan however deep it is. ``fields`` must end with a unique
+    field, usually ``pk``, to break ties.
+    """
+
+    def __init__(self, queryset, fields=('created', 'pk'), per_page=20):
+        self.fields = tuple(fields)
+        self.queryset = queryset.order_by(*('-%s' % field for field in self.fields))
+        self.per_page = per_page
+
+    def page(self, cursor=None):
+        """Return the rows after ``cursor`` and the cursor of the next page, or None on the last page."""
+        return self._paginate(list(self._page_queryset(cursor)))
+
+    async def apage(self, cursor=None):
+        return self._paginate([row async for row in self._page_queryset(cursor)])
+
+    def _page_queryset(self, cursor):
+        queryset = self.queryset
+        if cursor:
+            queryset = queryset.filter(self._after(self.decode_cursor(cursor)))
+        # One extra row tells whether there is a next page.
+        return queryset[:self.per_page + 1]
+
+    def _paginate(self, rows):
+        if len(rows) <= self.per_page:
+            return rows, None
+        rows = rows[:self.per_page]
+        return rows, self.encode_cursor(rows[-1])
+
+    def _after(self, values):
+        # (a, b) < (x, y) is a < x OR (a = x AND b < y).
+        condition = Q()
+        for index, field in enumerate(self.fields):
+            equal = dict(zip(self.fields[:index], values[:index]))
+            condition |= Q(**equal, **{'%s__lt' % field: values[index]})
+        return condition
+
+    def encode_cursor(self, row):
+        values = [getattr(row, field) for field in self.fields]
+        return base64.urlsafe_b64encode(json.dumps(values, default=_json_default).encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise InvalidCursor("Invalid cursor")
+        if not isinstance(values, list) or len(values) != len(self.fields):
+            raise InvalidCursor("Invalid cursor")
+
+        opts = self.queryset.model._meta
+        try:
+            return [
+                (opts.pk if field == 'pk' else opts.get_field(field)).to_python(value)
+                for field, value in zip(self.fields, values)
+            ]
+        except ValidationError:
+            raise InvalidCursor("Invalid cursor")
@@ -0,0 +1,180 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from knightauth.cache import invalidate_tokens
+from knightauth.models import UserTokenState, get_token_model
+from knightauth.settings import knight_auth_settings
+from knightauth.signing import denylist, signed_token_expiry, signed_tokens_enabled
+
+
+def quota_enabled():
+    return knight_auth_settings.TOKEN_LIMIT_PER_USER is not None
+
+
+def acquire_token_slot(user):
+    """
+    Reserve room for one more token of ``user``.
+
+    Returns False when the user already holds ``TOKEN_LIMIT_PER_USER``
+    tokens and none could be freed.
+    """
+    if not quota_enabled():
+        return True
+
+    if _increment(user):
+        return True
+
+    _, created = UserTokenState.objects.get_or_create(
+        user=user,
+        defaults={'token_count': get_token_model().objects.filter(user=user).count()}
+    )
+    if created and _increment(user):
+        return True
+
+    if _delete_tokens(user, get_token_model().objects.filter(user=user, expiry__lt=timezone.now())):
+        if _increment(user):
+            return True
+
+    if knight_auth_settings.TOKEN_LIMIT_EVICT_OLDEST:
+        state = UserTokenState.objects.get(user=user)
+        excess = state.token_count - knight_auth_settings.TOKEN_LIMIT_PER_USER + 1
+        # Revoked tokens are not counted, evicting them would free nothing.
+        oldest = get_token_model().objects.filter(user=user, generation=state.generation).order_by('created')[:excess]
+        if _delete_tokens(user, oldest):
+            return _increment(user)
+
+    return False
+
+
+def issue_login_token(user):
+    """
+    Reserve a slot and create a token for ``user`` in one transaction.
+
+    Returns ``(instance, token)``, or None when the user is at the limit.
+    """
+    with transaction.atomic():
+        if not acquire_token_slot(user):
+            return None
+
+        return get_token_model().objects.create(
+            user=user,
+            prefix=knight_auth_settings.TOKEN_PREFIX,
+            expiry=knight_auth_settings.TOKEN_TTL
+        )
+
+
+def with_user_generation(auth_tokens):
+    """Annotate tokens with their user's current generation, to tell counted tokens from revoked ones."""
+    return auth_tokens.annotate(user_generation=Coalesce(F('user__knight_auth_state__generation'), Value(0)))
+
+
+def counted_user_ids(rows):
+    """
+    User ids of the ``(user_id, generation, user_generation)`` rows still
+    counted towards the limit. Bumping a generation already took the
+    revoked tokens off their user's counter.
+    """
+    return [user_id for user_id, generation, user_generation in rows if generation == user_generation]
+
+
+def release_token_slots(user_ids):
+    """Give back one slot for every occurrence of a user id in ``user_ids``."""
+    if not quota_enabled():
+        return
+
+    counts = Counter(user_ids)
+    if not counts:
+        return
+
+    _adjust(counts, -1)
+
+
+async def arelease_token_slots(user_ids):
+    if not quota_enabled():
+        return
+
+    counts = Counter(user_ids)
+    if not counts:
+        return
+
+    await UserTokenState.objects.filter(user_id__in=counts).aupdate(token_count=_adjusted(counts, -1))
+
+
+def add_token_slots(counts):
+    """Account for tokens issued without going through the limit."""
+    if quota_enabled() and counts:
+        _adjust(counts, 1)
+
+
+def reset_token_slots(user):
+    if quota_enabled():
+        UserTokenState.objects.filter(user=user).update(token_count=0)
+
+
+async def areset_token_slots(user_id):
+    if quota_enabled():
+        await UserTokenState.objects.filter(user_id=user_id).aupdate(token_count=0)
+
+
+def recount_token_slots():
+    """
+    Recompute every token counter from the tokens of its user's current
+    generation, and return how many counters were updated.
+
+    The counters are updated in place, so the generations stored next to
+    them, and with them every revocation, are kept.
+    """
+    counted = (
+        get_token_model().objects
+        .filter(user=OuterRef('user'), generation=OuterRef('generation'))
+        .order_by()
+        .values('user')
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    return UserTokenState.objects.update(token_count=Coalesce(Subquery(counted), Value(0)))
+
+
+def _increment(user):
+    return UserTokenState.objects.filter(
+        user=user,
+        token_count__lt=knight_auth_settings.TOKEN_LIMIT_PER_USER
+    ).update(token_count=F('token_count') + 1)
+
+
+def _adjust(counts, sign):
+    UserTokenState.objects.filter(user_id__in=counts).update(token_count=_adjusted(counts, sign))
+
+
+def _adjusted(counts, sign):
+    return Greatest(
+        Case(
+            *[When(user_id=user_id, then=F('token_count') + sign * count) for user_id, count in counts.items()],
+            default=F('token_count'),
+            output_field=IntegerField()
+        ),
+        Value(0)
+    )
+
+
+def _delete_tokens(user, auth_tokens):
+    token_model = get_token_model()
+    rows = list(with_user_generation(auth_tokens).values_list(
+        'pk', 'digest', 'jti', 'created', 'expiry', 'user_id', 'generation', 'user_generation'
+    ))
+    if not rows:
+        return 0
+
+    pks, digests = list(zip(*rows))[:2]
+    invalidate_tokens(digests)
+    if signed_tokens_enabled():
+        denylist.deny(
+            (jti, signed_token_expiry(created, expiry)) for _, _, jti, created, expiry, *_ in rows if jti is not None
+        )
+    token_model.objects.filter(pk__in=pks).delete()
+    release_token_slots(counted_user_ids(row[5:] for row in rows))
+    return len(pks)
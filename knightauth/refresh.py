@@ -0,0 +1,69 @@
+import atexit
+import threading
+import time
+
+from knightauth.models import get_token_model
+from knightauth.settings import knight_auth_settings
+
+
+class RefreshBuffer:
+    """
+    Collects token expiry refreshes in memory and writes them in bulk.
+
+    Pending refreshes are flushed with a single ``bulk_update`` once the
+    oldest of them has waited ``REFRESH_MAX_STALENESS`` seconds.
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._oldest = None
+        self._lock = threading.Lock()
+
+    def add(self, pk, expiry):
+        with self._lock:
+            self._pending[pk] = expiry
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+
+    def pending(self, pk):
+        return self._pending.get(pk)
+
+    def is_due(self):
+        oldest = self._oldest
+        if oldest is None:
+            return False
+        return time.monotonic() - oldest >= knight_auth_settings.REFRESH_MAX_STALENESS
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._oldest = None
+
+        if not pending:
+            return 0
+
+        token_model = get_token_model()
+        pk_name = token_model._meta.pk.attname
+        token_model.objects.bulk_update(
+            [token_model(**{pk_name: pk, 'expiry': expiry}) for pk, expiry in pending.items()],
+            ['expiry']
+        )
+        return len(pending)
+
+    def __len__(self):
+        return len(self._pending)
+
+
+refresh_buffer = RefreshBuffer()
+
+
+def flush_refresh_buffer(**kwargs):
+    return refresh_buffer.flush()
+
+
+def flush_refresh_buffer_if_due(**kwargs):
+    if refresh_buffer.is_due():
+        refresh_buffer.flush()
+
+
+atexit.register(flush_refresh_buffer)
@@ -0,0 +1,116 @@
+from django.conf import settings
+from django.db import router, transaction
+from django.db.migrations.operations.base import Operation
+from django.db.models import Q, UniqueConstraint
+from django.db.models.functions import Lower
+
+from knightauth.settings import knight_auth_settings
+
+UNIQUE_EMAIL_CONSTRAINT_NAME = 'knightauth_unique_email_ci'
+
+
+def unique_email_constraint(field='email', name=UNIQUE_EMAIL_CONSTRAINT_NAME):
+    """
+    Case-insensitive unique constraint on the email of a user model, for the
+    ``Meta.constraints`` of a custom user model. Empty emails are exempt.
+    """
+    return UniqueConstraint(Lower(field), name=name, condition=~Q(**{field: ''}))
+
+
+class AddUniqueEmailIndex(Operation):
+    """
+    Migration operation adding ``unique_email_constraint()`` to a user model
+    owned by another app, such as ``auth.User``.
+
+    The index is not part of the model state, so ``makemigrations`` for the
+    owning app never tries to drop it.
+    """
+
+    reversible = True
+
+    def __init__(self, model=None, field='email', name=UNIQUE_EMAIL_CONSTRAINT_NAME):
+        self.model = model or settings.AUTH_USER_MODEL
+        self.field = field
+        self.name = name
+
+    def deconstruct(self):
+        return self.__class__.__name__, [], {'model': self.model, 'field': self.field, 'name': self.name}
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(self.model)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.add_constraint(model, unique_email_constraint(self.field, self.name))
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = from_state.apps.get_model(self.model)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.remove_constraint(model, unique_email_constraint(self.field, self.name))
+
+    def describe(self):
+        return 'Add case-insensitive unique index %s on %s.%s' % (self.name, self.model, self.field)
+
+
+def create_user(User, username, email, password):
+    """
+    Create a user with a single INSERT, leaving uniqueness to the database.
+
+    ``password`` is already encoded by ``make_password()``, so the hashing
+    can run on the hashing pool while the INSERT stays in the request's
+    transaction. Fields are normalized as ``UserManager.create_user()`` does.
+
+    Raises ``IntegrityError`` when the username, or the email with
+    ``UNIQUE_EMAIL_CONSTRAINT``, is taken. The savepoint keeps an enclosing
+    transaction usable after a failed INSERT.
+    """
+    user = User(**{
+        User.USERNAME_FIELD: User.normalize_username(username),
+        User.get_email_field_name(): User.objects.normalize_email(email),
+        'password': password,
+    })
+    using = router.db_for_write(User)
+    with transaction.atomic(using=using):
+        user.save(using=using)
+    return user
+
+
+def _email_lookup():
+    # The constraint compares lowercased emails, the pre-check compares them as given.
+    return 'email__iexact' if knight_auth_settings.UNIQUE_EMAIL_CONSTRAINT else 'email'
+
+
+def email_taken(User, email):
+    """Pre-check for deployments without ``UNIQUE_EMAIL_CONSTRAINT``."""
+    if knight_auth_settings.UNIQUE_EMAIL_CONSTRAINT:
+        return False
+    return User.objects.filter(email=email).exists()
+
+
+async def aemail_taken(User, email):
+    if knight_auth_settings.UNIQUE_EMAIL_CONSTRAINT:
+        return False
+    return await User.objects.filter(email=email).aexists()
+
+
+def duplicate_user_message(User, username, email):
+    """
+    Explain which unique field a failed ``create_user`` collided with.
+
+    Only runs after an ``IntegrityError``, so signups that succeed do not pay
+    for the lookups. Returns None when neither field is taken.
+    """
+    if User.objects.filter(**{_email_lookup(): email}).exists():
+        return "Email already exist"
+    if User.objects.filter(**{User.USERNAME_FIELD: username}).exists():
+        return "Username already exist"
+    return None
+
+
+async def aduplicate_user_message(User, username, email):
+    if await User.objects.filter(**{_email_lookup(): email}).aexists():
+        return "Email already exist"
+    if await User.objects.filter(**{User.USERNAME_FIELD: username}).aexists():
+        return "Username already exist"
+    return None
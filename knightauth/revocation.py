@@ -0,0 +1,82 @@
+from asgiref.sync import sync_to_async
+from django.db.models import F
+
+from knightauth.cache import ainvalidate_user, invalidate_user
+from knightauth.models import UserTokenState, get_token_model
+from knightauth.signals import tokens_revoked
+from knightauth.signing import DENIED_TOKEN_FIELDS, arevoke_tokens, revoke_tokens, signed_tokens_enabled
+
+
+def invalidate_all_tokens(user):
+    """
+    Revoke every token of ``user`` by bumping its token generation.
+
+    Tokens issued before the bump stop verifying at once, while their rows
+    are left for ``delete_expired_tokens`` to remove. ``tokens_revoked`` is
+    sent with a ``count`` of None, since nothing is deleted yet.
+    """
+    token_model = get_token_model()
+
+    bump_token_generation(user.pk)
+    revoke_tokens(token_model.objects.filter(user=user).only(*DENIED_TOKEN_FIELDS))
+    tokens_revoked.send(sender=token_model, user_id=user.pk, count=None)
+
+
+def revoke_all_tokens(user):
+    """
+    Delete every token of ``user`` and return how many were deleted.
+
+    The tokens are removed with a single DELETE that skips Django's deletion
+    collector, so no per-token ``pre_delete``/``post_delete`` signals are
+    sent. A single ``tokens_revoked`` signal is sent instead, and cached
+    verifications of the user are dropped by bumping its generation.
+    """
+    token_model = get_token_model()
+    auth_tokens = token_model.objects.filter(user=user)
+
+    bump_token_generation(user.pk)
+    revoke_tokens(auth_tokens.only(*DENIED_TOKEN_FIELDS))
+    count = auth_tokens._raw_delete(auth_tokens.db)
+
+    if count:
+        tokens_revoked.send(sender=token_model, user_id=user.pk, count=count)
+    return count
+
+
+async def arevoke_all_tokens(user_id):
+    token_model = get_token_model()
+    auth_tokens = token_model.objects.filter(user_id=user_id)
+
+    await abump_token_generation(user_id)
+    if signed_tokens_enabled():
+        await arevoke_tokens([auth_token async for auth_token in auth_tokens.only(*DENIED_TOKEN_FIELDS)])
+    count = await sync_to_async(auth_tokens._raw_delete)(auth_tokens.db)
+
+    if count:
+        await sync_to_async(tokens_revoked.send)(sender=token_model, user_id=user_id, count=count)
+    return count
+
+
+def bump_token_generation(user_id):
+    # Revoked tokens no longer count towards TOKEN_LIMIT_PER_USER.
+    states = UserTokenState.objects.filter(user_id=user_id)
+    if not states.update(generation=F('generation') + 1, token_count=0):
+        _, created = UserTokenState.objects.get_or_create(user_id=user_id, defaults={'generation': 1})
+        if not created:
+            states.update(generation=F('generation') + 1, token_count=0)
+    invalidate_user(user_id)
+
+
+async def abump_token_generation(user_id):
+    states = UserTokenState.objects.filter(user_id=user_id)
+    if not await states.aupdate(generation=F('generation') + 1, token_count=0):
+        _, created = await UserTokenState.objects.aget_or_create(user_id=user_id, defaults={'generation': 1})
+        if not created:
+            await states.aupdate(generation=F('generation') + 1, token_count=0)
+    await ainvalidate_user(user_id)
+
+
+def revoke_tokens_on_password_change(sender, instance, created=False, **kwargs):
+    # set_password() keeps the raw password around until the user is saved.
+    if not created and getattr(instance, '_password', None) is not None:
+        invalidate_all_tokens(instance)
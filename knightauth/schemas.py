@@ -1,4 +1,4 @@
-from typing import Union
+from typing import List, Optional, Union
 
 from ninja import Schema
 from datetime import datetime
@@ -23,3 +23,15 @@ class UserRegisterSchema(Schema):
     email: str
     password: str
     password_confirm: str
+
+
+class TokenOut(Schema):
+    created: datetime
+    expiry: Optional[datetime]
+    token_key: Optional[str]
+    current: bool
+
+
+class TokenPageOut(Schema):
+    items: List[TokenOut]
+    next_cursor: Optional[str]
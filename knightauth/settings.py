@@ -10,6 +10,9 @@ USER_SETTINGS = getattr(settings, 'KNIGHT_AUTH', {})
 IMPORT_STRINGS = [
     'SECURE_HASH_ALGORITHM',
     'USER_SERIALIZER',
+    'TOKEN_CACHE',
+    'NEGATIVE_TOKEN_CACHE',
+    'METRICS_EXPORTER',
 ]
 
 ISO_8601 = 'iso-8601'
@@ -20,12 +23,50 @@ DEFAULTS = {
     'TOKEN_TTL': timedelta(hours=10),
     'USER_SERIALIZER': None,
     'TOKEN_LIMIT_PER_USER': None,
+    'TOKEN_LIMIT_EVICT_OLDEST': False,
     'AUTO_REFRESH': False,
     'MIN_REFRESH_INTERVAL': 60,
     'AUTH_HEADER_PREFIX': 'Token',
     'EXPIRY_DATETIME_FORMAT': ISO_8601,
     'TOKEN_MODEL': getattr(settings, 'KNIGHT_AUTH_MODEL', 'knightauth.AuthToken'),
     'TOKEN_PREFIX': '',
+    'EXPIRY_BATCH_SIZE': 1000,
+    'EXPIRY_CLEANUP_INTERVAL': None,
+    'TOKEN_CACHE': None,
+    'TOKEN_CACHE_SIZE': 10000,
+    'TOKEN_CACHE_TTL': 60,
+    'TOKEN_CACHE_ALIAS': None,
+    'NEGATIVE_TOKEN_CACHE': None,
+    'NEGATIVE_TOKEN_CACHE_SIZE': 100000,
+    'NEGATIVE_TOKEN_CACHE_TTL': 300,
+    'NEGATIVE_TOKEN_CACHE_ALIAS': None,
+    'TOKEN_FILTER': False,
+    'TOKEN_FILTER_CAPACITY': 1000000,
+    'TOKEN_FILTER_ERROR_RATE': 0.001,
+    'TOKEN_FILTER_SNAPSHOT': None,
+    'TOKEN_FILTER_SYNC_INTERVAL': 1,
+    'DEFER_USER': False,
+    'REFRESH_WRITE_BEHIND': False,
+    'REFRESH_MAX_STALENESS': 60,
+    'DIGEST_SCHEME': 'blake2b',
+    'DIGEST_KEY': None,
+    'BULK_ISSUE_BATCH_SIZE': 1000,
+    'SIGNED_TOKENS': False,
+    'SIGNED_TOKEN_DENYLIST_TTL': 30,
+    'SIGNED_TOKEN_MAX_AGE': timedelta(days=30),
+    'LOGIN_THROTTLE_RATES': {},
+    'LOGIN_THROTTLE_CACHE_ALIAS': None,
+    'LOGIN_THROTTLE_IP_META': 'REMOTE_ADDR',
+    'LOGIN_THROTTLE_TRUSTED_PROXIES': 1,
+    'PASSWORD_HASHING_WORKERS': None,
+    'PASSWORD_HASHING_QUEUE_SIZE': 16,
+    'PASSWORD_HASH_TARGET_MS': None,
+    'PASSWORD_HASH_PARAMETERS': {},
+    'PASSWORD_HASH_CALIBRATION_CACHE_ALIAS': 'default',
+    'UNIQUE_EMAIL_CONSTRAINT': False,
+    'METRICS': False,
+    'METRICS_EXPORTER': None,
+    'METRICS_EXPORT_INTERVAL': 60,
 }
 
 
@@ -88,10 +129,9 @@ knight_auth_settings = APISettings(USER_SETTINGS, DEFAULTS, IMPORT_STRINGS)
 
 
 def reload_api_settings(*args, **kwargs):
-    global knight_auth_settings
-    setting, value = kwargs['setting'], kwargs['value']
+    setting = kwargs['setting']
     if setting == 'KNIGHT_AUTH':
-        knight_auth_settings = APISettings(**value)
+        knight_auth_settings.reload()
         if len(knight_auth_settings.TOKEN_PREFIX) > CONSTANTS.MAXIMUM_TOKEN_PREFIX_LENGTH:
             raise ValueError("Illegal TOKEN_PREFIX length")
 
@@ -103,6 +143,7 @@ class CONSTANTS:
     TOKEN_KEY_LENGTH = 15
     DIGEST_LENGTH = 128
     MAXIMUM_TOKEN_PREFIX_LENGTH = 10
+    JTI_LENGTH = 32
 
     def __setattr__(self, *args, **kwargs):
         raise Exception('''
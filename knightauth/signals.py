@@ -1,3 +1,5 @@
 import django.dispatch
 
 token_expired = django.dispatch.Signal()
+tokens_expired = django.dispatch.Signal()
+tokens_revoked = django.dispatch.Signal()
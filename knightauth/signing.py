@@ -0,0 +1,252 @@
+import secrets
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.db.models import Q
+from django.test.signals import setting_changed
+from django.utils import timezone
+
+from knightauth.settings import CONSTANTS, knight_auth_settings
+
+# Versioned with the payload format: tokens of an older format stop verifying.
+SIGNED_TOKEN_SALT = 'knightauth.signing.signed_token.v2'
+
+_signer = None
+
+
+def signed_tokens_enabled():
+    return knight_auth_settings.SIGNED_TOKENS
+
+
+def get_signer():
+    global _signer
+    if _signer is None:
+        _signer = signing.Signer(
+            key=knight_auth_settings.DIGEST_KEY,
+            salt=SIGNED_TOKEN_SALT,
+            algorithm='sha256'
+        )
+    return _signer
+
+
+def reset_signer(*args, **kwargs):
+    global _signer
+    if kwargs['setting'] in ('KNIGHT_AUTH', 'SECRET_KEY'):
+        _signer = None
+
+
+setting_changed.connect(reset_signer)
+
+
+def is_signed_token(token: str) -> bool:
+    # Stateful tokens are hex, the signer separates payload and signature with ':'.
+    return ':' in token
+
+
+def new_jti():
+    return secrets.token_hex(CONSTANTS.JTI_LENGTH // 2)
+
+
+def signed_token_expiry(created, expiry):
+    """
+    Expiry of the signed form of a token. It never outlives
+    ``SIGNED_TOKEN_MAX_AGE``, so the denylist entries of revoked signed
+    tokens can always be purged.
+    """
+    max_expiry = created + knight_auth_settings.SIGNED_TOKEN_MAX_AGE
+    return max_expiry if expiry is None else min(expiry, max_expiry)
+
+
+def sign_token(auth_token, prefix=None) -> str:
+    """Encode a stored token as a self-contained signed token."""
+    if prefix is None:
+        prefix = knight_auth_settings.TOKEN_PREFIX
+    payload = {
+        'u': auth_token.user_id if isinstance(auth_token.user_id, int) else str(auth_token.user_id),
+        'j': auth_token.jti,
+        'e': int(signed_token_expiry(auth_token.created, auth_token.expiry).timestamp()),
+    }
+    return prefix + get_signer().sign_object(payload)
+
+
+def unsign_token(token: str):
+    """Return the payload of a signed token, or None when the signature does not match."""
+    prefix = knight_auth_settings.TOKEN_PREFIX
+    if prefix and token.startswith(prefix):
+        token = token[len(prefix):]
+    try:
+        return get_signer().unsign_object(token)
+    except (signing.BadSignature, ValueError):
+        return None
+
+
+def token_from_payload(payload):
+    """Rebuild the stored token a payload refers to, without a query."""
+    from knightauth.models import get_token_model
+
+    auth_token = get_token_model().from_values(
+        None,
+        jti=payload['j'],
+        user_id=get_user_model()._meta.pk.to_python(payload['u']),
+        expiry=payload_expiry(payload)
+    )
+    auth_token.is_signed = True
+    return auth_token
+
+
+def load_signed_token(auth_token):
+    """
+    Look up the primary key of a token rebuilt from a signed payload.
+    Returns False when the token is no longer stored.
+    """
+    if auth_token.pk is None:
+        auth_token.pk = type(auth_token).objects.filter(jti=auth_token.jti).values_list('pk', flat=True).first()
+    return auth_token.pk is not None
+
+
+async def aload_signed_token(auth_token):
+    if auth_token.pk is None:
+        auth_token.pk = await type(auth_token).objects.filter(jti=auth_token.jti).values_list('pk', flat=True).afirst()
+    return auth_token.pk is not None
+
+
+def payload_expiry(payload):
+    if payload['e'] is None:
+        return None
+    return datetime.fromtimestamp(payload['e'], tz=dt_timezone.utc)
+
+
+def payload_expired(payload):
+    return payload['e'] is not None and payload['e'] < time.time()
+
+
+class TokenDenylist:
+    """
+    Revoked signed tokens, keyed by token id.
+
+    Every process keeps a copy of the denylist and reloads it from the
+    database once it is older than ``SIGNED_TOKEN_DENYLIST_TTL`` seconds, so
+    verifying a signed token does not query the database. Tokens revoked by
+    this process are denied immediately.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jtis = frozenset()
+        self._loaded_at = None
+
+    def is_denied(self, jti):
+        if self._is_stale():
+            self.reload()
+        return jti in self._jtis
+
+    async def ais_denied(self, jti):
+        if self._is_stale():
+            await self.areload()
+        return jti in self._jtis
+
+    def deny(self, auth_tokens):
+        """Deny the given ``(jti, expiry)`` pairs."""
+        from knightauth.models import DeniedToken
+
+        entries = [DeniedToken(jti=str(jti), expiry=expiry) for jti, expiry in auth_tokens]
+        if not entries:
+            return
+        DeniedToken.objects.bulk_create(entries, ignore_conflicts=True)
+        with self._lock:
+            self._jtis = self._jtis.union(entry.jti for entry in entries)
+
+    async def adeny(self, auth_tokens):
+        from knightauth.models import DeniedToken
+
+        entries = [DeniedToken(jti=str(jti), expiry=expiry) for jti, expiry in auth_tokens]
+        if not entries:
+            return
+        await DeniedToken.objects.abulk_create(entries, ignore_conflicts=True)
+        with self._lock:
+            self._jtis = self._jtis.union(entry.jti for entry in entries)
+
+    def reload(self):
+        self._loaded(list(self._queryset()))
+
+    async def areload(self):
+        self._loaded([jti async for jti in self._queryset()])
+
+    def clear(self):
+        with self._lock:
+            self._jtis = frozenset()
+            self._loaded_at = None
+
+    def _is_stale(self):
+        return (
+            self._loaded_at is None
+            or time.monotonic() - self._loaded_at > knight_auth_settings.SIGNED_TOKEN_DENYLIST_TTL
+        )
+
+    def _queryset(self):
+        from knightauth.models import DeniedToken
+
+        return (
+            DeniedToken
+            .objects
+            .filter(Q(expiry__isnull=True) | Q(expiry__gte=timezone.now()))
+            .values_list('jti', flat=True)
+        )
+
+    def _loaded(self, jtis):
+        with self._lock:
+            self._jtis = frozenset(jtis)
+            self._loaded_at = time.monotonic()
+
+    def __len__(self):
+        return len(self._jtis)
+
+
+denylist = TokenDenylist()
+
+
+# Fields revoke_tokens() reads from stored tokens.
+DENIED_TOKEN_FIELDS = ('jti', 'created', 'expiry')
+
+
+def revoke_tokens(auth_tokens):
+    """Deny the signed form of the given stored tokens."""
+    if signed_tokens_enabled():
+        denylist.deny(denied_tokens(auth_tokens))
+
+
+async def arevoke_tokens(auth_tokens):
+    if signed_tokens_enabled():
+        await denylist.adeny(denied_tokens(auth_tokens))
+
+
+def denied_tokens(auth_tokens):
+    # Tokens without a jti were never handed out in signed form.
+    return [
+        (auth_token.jti, auth_token.expiry if auth_token.is_signed else signed_token_expiry(
+            auth_token.created, auth_token.expiry
+        ))
+        for auth_token in auth_tokens if auth_token.jti is not None
+    ]
+
+
+def revoke_user_tokens(sender, instance, update_fields=None, **kwargs):
+    if instance.is_active or not signed_tokens_enabled():
+        return
+    if update_fields is not None and 'is_active' not in update_fields:
+        return
+
+    from knightauth.models import get_token_model
+
+    revoke_tokens(get_token_model().objects.filter(user=instance).only(*DENIED_TOKEN_FIELDS))
+
+
+def reset_denylist(*args, **kwargs):
+    if kwargs['setting'] == 'KNIGHT_AUTH':
+        denylist.clear()
+
+
+setting_changed.connect(reset_denylist)
@@ -0,0 +1,198 @@
+import hashlib
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.test.signals import setting_changed
+from ninja.responses import Response
+
+from knightauth.settings import knight_auth_settings
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+SCOPES = ('global', 'ip', 'username')
+RATE_PATTERN = re.compile(r'(\d+)/(\d*)([smhd])[a-z]*')
+
+
+def parse_rate(rate):
+    """Parse ``'<requests>/<period>'`` into ``(requests, seconds)``, e.g. ``'5/min'`` or ``'100/10s'``."""
+    match = RATE_PATTERN.fullmatch(rate)
+    if match is None:
+        raise ValueError("Invalid throttle rate '%s'" % rate)
+    requests, multiplier, unit = match.groups()
+    return int(requests), int(multiplier or 1) * PERIODS[unit]
+
+
+class LocalThrottleStore:
+    """Per-process counter store, bounded to ``max_size`` keys."""
+
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self._counters = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                key: self._counters[key][0]
+                for key in keys
+                if key in self._counters and self._counters[key][1] > now
+            }
+
+    def incr(self, key, timeout):
+        now = time.monotonic()
+        with self._lock:
+            value, expires_at = self._counters.get(key, (0, 0))
+            if expires_at <= now:
+                value = 0
+            self._counters[key] = (value + 1, now + timeout)
+            self._counters.move_to_end(key)
+            while len(self._counters) > self.max_size:
+                self._counters.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+
+
+class CacheThrottleStore:
+    """Counter store shared through one of the Django ``CACHES`` backends."""
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def get_many(self, keys):
+        return self.backend.get_many(keys)
+
+    def incr(self, key, timeout):
+        # add() is a no-op when the key exists, which keeps incr() atomic.
+        self.backend.add(key, 0, timeout)
+        try:
+            self.backend.incr(key)
+        except ValueError:
+            self.backend.set(key, 1, timeout)
+
+    def clear(self):
+        pass
+
+
+class LoginThrottle:
+    """
+    Sliding window rate limits for login attempts.
+
+    Each scope counts attempts in fixed windows and weighs the previous
+    window by how much of it still overlaps the sliding window, so a limit
+    costs two counters per key. Attempts are limited globally, per client
+    IP and per username; ``LOGIN_THROTTLE_RATES`` sets the rate of each.
+    """
+
+    key_prefix = 'knightauth:throttle:'
+
+    def __init__(self, rates=None, store=None):
+        rates = knight_auth_settings.LOGIN_THROTTLE_RATES if rates is None else rates
+        self.rates = {scope: parse_rate(rates.get(scope)) for scope in SCOPES if rates.get(scope)}
+        if store is None:
+            alias = knight_auth_settings.LOGIN_THROTTLE_CACHE_ALIAS
+            store = CacheThrottleStore(alias) if alias else LocalThrottleStore()
+        self.store = store
+
+    def identities(self, request, username):
+        return {
+            'global': '',
+            'ip': self.client_ip(request),
+            'username': hashlib.blake2b((username or '').lower().encode('utf-8'), digest_size=16).hexdigest(),
+        }
+
+    def client_ip(self, request):
+        """
+        The address the last of ``LOGIN_THROTTLE_TRUSTED_PROXIES`` proxies
+        received the request from.
+
+        Each proxy appends the address it saw to X-Forwarded-For, so entries
+        left of the ones added by trusted proxies are set by the client.
+        """
+        addresses = request.META.get(knight_auth_settings.LOGIN_THROTTLE_IP_META, '').split(',')
+        hops = max(knight_auth_settings.LOGIN_THROTTLE_TRUSTED_PROXIES, 1)
+        return addresses[-min(hops, len(addresses))].strip()
+
+    def allow(self, request, username):
+        """
+        Record a login attempt and return None, or the number of seconds to
+        wait when a limit is exceeded. Rejected attempts are not recorded.
+        """
+        if not self.rates:
+            return None
+
+        now = time.time()
+        identities = self.identities(request, username)
+        windows = {}
+        for scope, (limit, period) in self.rates.items():
+            window = int(now // period)
+            key = '%s%s:%s:' % (self.key_prefix, scope, identities[scope])
+            windows[scope] = (limit, period, window, key + str(window), key + str(window - 1))
+
+        counts = self.store.get_many([key for *_, current, previous in windows.values() for key in (current, previous)])
+
+        wait = 0
+        for limit, period, window, current, previous in windows.values():
+            elapsed = now - window * period
+            wait = max(wait, self._wait(limit, period, elapsed, counts.get(current, 0), counts.get(previous, 0)))
+        if wait:
+            return math.ceil(wait)
+
+        for limit, period, window, current, previous in windows.values():
+            self.store.incr(current, period * 2)
+        return None
+
+    def _wait(self, limit, period, elapsed, current, previous):
+        if previous * (1 - elapsed / period) + current < limit:
+            return 0
+        if current < limit:
+            # Wait for the previous window's weight to drop below what is left.
+            wait = period * (1 - (limit - current) / previous) - elapsed
+        else:
+            # The current window becomes the previous one and has to fade out.
+            wait = period - elapsed + period * (1 - limit / current)
+        return max(wait, 1)
+
+
+_login_throttle = None
+_login_throttle_lock = threading.Lock()
+
+
+def get_login_throttle():
+    global _login_throttle
+    if _login_throttle is None:
+        with _login_throttle_lock:
+            if _login_throttle is None:
+                _login_throttle = LoginThrottle()
+    return _login_throttle
+
+
+def throttle_login(request, username):
+    """Return a 429 response when the login attempt has to be rejected."""
+    wait = get_login_throttle().allow(request, username)
+    if wait is None:
+        return None
+
+    return Response(
+        {"message": "Too many login attempts. Try again later."},
+        status=429,
+        headers={'Retry-After': str(wait)}
+    )
+
+
+def reset_login_throttle(*args, **kwargs):
+    global _login_throttle
+    if kwargs['setting'] == 'KNIGHT_AUTH':
+        _login_throttle = None
+
+
+setting_changed.connect(reset_login_throttle)
@@ -0,0 +1,280 @@
+import hashlib
+import logging
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import F, Q
+from django.test.signals import setting_changed
+from django.utils import timezone
+
+from knightauth.models import get_token_model
+from knightauth.quota import with_user_generation
+from knightauth.settings import knight_auth_settings
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b'KAFILT01'
+# magic, size in bits, hash count, keys added, synced at (POSIX timestamp)
+SNAPSHOT_HEADER = struct.Struct('<8sQQQd')
+# Rows committed late, or stamped by a host with a slower clock, carry a
+# ``created`` before the last sync. Catching up re-reads this much.
+SYNC_OVERLAP = timedelta(seconds=5)
+
+
+class BloomFilter:
+    """
+    Bit array answering "maybe present" or "definitely absent" for keys.
+
+    Positions come from one blake2b digest split into two 64-bit halves
+    (double hashing). Keys cannot be removed.
+    """
+
+    def __init__(self, size, hash_count, bits=None, count=0):
+        self.size = size
+        self.hash_count = hash_count
+        self.count = count
+        self._bits = bits if bits is not None else bytearray((size + 7) // 8)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate):
+        """A filter holding ``capacity`` keys with a false positive rate of ``error_rate``."""
+        size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        return cls(size, max(1, round(size / capacity * math.log(2))))
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(str(key).encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, key):
+        positions = self._positions(key)
+        # Setting a bit is a read-modify-write of its byte.
+        with self._lock:
+            for position in positions:
+                self._bits[position >> 3] |= 1 << (position & 7)
+            self.count += 1
+
+    def __contains__(self, key):
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def nbytes(self):
+        return len(self._bits)
+
+    def save(self, path, synced_at=0.0):
+        """Write the filter to ``path`` atomically, in the format ``load`` maps."""
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, self.size, self.hash_count, self.count, synced_at))
+            with self._lock:
+                f.write(self._bits)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Map a snapshot written by ``save``, returning ``(filter, synced_at)``.
+
+        The mapping is copy-on-write: processes loading the same snapshot
+        share its pages until they add keys of their own.
+        """
+        with open(path, 'rb') as f:
+            snapshot = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        if len(snapshot) < SNAPSHOT_HEADER.size:
+            raise ValueError("'%s' is not a token filter snapshot" % path)
+        magic, size, hash_count, count, synced_at = SNAPSHOT_HEADER.unpack_from(snapshot)
+        if magic != SNAPSHOT_MAGIC or len(snapshot) != SNAPSHOT_HEADER.size + (size + 7) // 8:
+            raise ValueError("'%s' is not a token filter snapshot" % path)
+        return cls(size, hash_count, memoryview(snapshot)[SNAPSHOT_HEADER.size:], count), synced_at
+
+
+class LiveTokenFilter:
+    """
+    Per-process Bloom filter over the ``token_key`` of live tokens.
+
+    A miss does not prove a key unused: another process may have issued a
+    token with it a moment ago, in a transaction that is not even committed
+    yet. The filter therefore never rejects a token on its own. It vetoes
+    entries of the negative token cache instead, for keys issued since they
+    were remembered.
+
+    Tokens saved by this process are added as they are created; tokens
+    created by other processes are picked up by a catch-up query, run on a
+    filter miss at most every ``TOKEN_FILTER_SYNC_INTERVAL`` seconds.
+    """
+
+    def __init__(self, capacity=None, error_rate=None, snapshot_path=None, sync_interval=None):
+        self.capacity = capacity or knight_auth_settings.TOKEN_FILTER_CAPACITY
+        self.error_rate = error_rate or knight_auth_settings.TOKEN_FILTER_ERROR_RATE
+        self.snapshot_path = snapshot_path or knight_auth_settings.TOKEN_FILTER_SNAPSHOT
+        if sync_interval is None:
+            sync_interval = knight_auth_settings.TOKEN_FILTER_SYNC_INTERVAL
+        self.sync_interval = sync_interval
+        self.filter = BloomFilter.for_capacity(self.capacity, self.error_rate)
+        self.synced_at = None
+        self._next_sync = 0
+        self._sync_lock = threading.Lock()
+
+    def build(self, chunk_size=2000):
+        """Fill a fresh filter from a streaming scan of the unexpired tokens of current generations."""
+        token_filter = BloomFilter.for_capacity(self.capacity, self.error_rate)
+        synced_at = timezone.now()
+        token_keys = with_user_generation(get_token_model().objects.filter(
+            Q(expiry__isnull=True) | Q(expiry__gt=synced_at)
+        )).filter(generation=F('user_generation')).values_list('token_key', flat=True)
+        for token_key in token_keys.iterator(chunk_size=chunk_size):
+            token_filter.add(token_key)
+
+        self.filter = token_filter
+        self._synced(synced_at)
+        self._check_capacity()
+
+    def load(self, path=None):
+        """Load a snapshot and catch up with the tokens created since it was written."""
+        token_filter, synced_at = BloomFilter.load(path or self.snapshot_path)
+        self.filter = token_filter
+        self._synced(_from_timestamp(synced_at))
+        self.catch_up()
+        self._check_capacity()
+
+    def load_or_build(self):
+        if self.snapshot_path and os.path.exists(self.snapshot_path):
+            try:
+                return self.load()
+            except (OSError, ValueError) as e:
+                logger.warning("Rebuilding the token filter: %s", e)
+        self.build()
+
+    def save(self, path=None):
+        self.filter.save(path or self.snapshot_path, self.synced_at.timestamp())
+
+    def add(self, token_keys):
+        for token_key in token_keys:
+            self.filter.add(token_key)
+
+    def might_exist(self, token_key):
+        """False when no token this process knows of, as of the last catch-up, has ``token_key``."""
+        if token_key in self.filter:
+            return True
+        if self._sync_due():
+            self.catch_up()
+            return token_key in self.filter
+        return False
+
+    async def amight_exist(self, token_key):
+        if token_key in self.filter:
+            return True
+        if self._sync_due():
+            await sync_to_async(self.catch_up)()
+            return token_key in self.filter
+        return False
+
+    def catch_up(self):
+        with self._sync_lock:
+            synced_at = timezone.now()
+            token_keys = get_token_model().objects.filter(
+                created__gte=self.synced_at - SYNC_OVERLAP
+            ).values_list('token_key', flat=True)
+            self.add(token_keys.iterator())
+            self._synced(synced_at)
+
+    def stats(self):
+        return {
+            'keys': len(self.filter),
+            'capacity': self.capacity,
+            'error_rate': self.error_rate,
+            'bytes': self.filter.nbytes,
+        }
+
+    def _synced(self, synced_at):
+        self.synced_at = synced_at
+        self._next_sync = time.monotonic() + self.sync_interval
+
+    def _sync_due(self):
+        return time.monotonic() >= self._next_sync
+
+    def _check_capacity(self):
+        if len(self.filter) > self.capacity:
+            logger.warning(
+                "The token filter holds %d keys for a capacity of %d, its false positive rate is above %s. "
+                "Raise TOKEN_FILTER_CAPACITY.", len(self.filter), self.capacity, self.error_rate
+            )
+
+
+def _from_timestamp(timestamp):
+    value = datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+    return value if settings.USE_TZ else timezone.make_naive(value)
+
+
+_token_filter = None
+_token_filter_lock = threading.Lock()
+
+
+def get_token_filter():
+    """The live token filter of this process, built on first use, or None when disabled."""
+    global _token_filter
+    if not knight_auth_settings.TOKEN_FILTER:
+        return None
+    if knight_auth_settings.NEGATIVE_TOKEN_CACHE is None:
+        raise ImproperlyConfigured("TOKEN_FILTER requires NEGATIVE_TOKEN_CACHE.")
+
+    if _token_filter is None:
+        with _token_filter_lock:
+            if _token_filter is None:
+                token_filter = LiveTokenFilter()
+                token_filter.load_or_build()
+                _token_filter = token_filter
+
+    return _token_filter
+
+
+def warm_up_token_filter():
+    """
+    Build or load the token filter before the first request needs it.
+
+    Otherwise the first request to consult the filter runs the scan, and
+    requests arriving meanwhile wait for it. Returns None when disabled.
+    """
+    return get_token_filter()
+
+
+async def aget_token_filter():
+    if _token_filter is not None or not knight_auth_settings.TOKEN_FILTER:
+        return get_token_filter()
+    return await sync_to_async(get_token_filter)()
+
+
+def add_token_keys(token_keys):
+    # Before the filter is built there is nothing to update, the scan will see the rows.
+    if _token_filter is not None:
+        _token_filter.add(token_keys)
+
+
+def add_saved_token(sender, instance, created=False, **kwargs):
+    # Connected for every model, the token model is swappable.
+    if created and _token_filter is not None and sender is get_token_model():
+        _token_filter.add([instance.token_key])
+
+
+def reset_token_filter(*args, **kwargs):
+    global _token_filter
+    if kwargs['setting'] == 'KNIGHT_AUTH':
+        _token_filter = None
+
+
+setting_changed.connect(reset_token_filter)
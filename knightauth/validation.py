@@ -0,0 +1,158 @@
+import mmap
+import os
+import tempfile
+import threading
+
+from django.contrib.auth.password_validation import (
+    CommonPasswordValidator,
+    MinimumLengthValidator,
+    NumericPasswordValidator,
+    UserAttributeSimilarityValidator,
+    get_default_password_validators,
+)
+from django.core.exceptions import ValidationError
+from django.core.validators import EmailValidator
+from django.test.signals import setting_changed
+
+# Cheapest first. Validators not listed run after these, in settings order,
+# and before UserAttributeSimilarityValidator.
+VALIDATOR_COST = {
+    MinimumLengthValidator: 0,
+    NumericPasswordValidator: 1,
+    CommonPasswordValidator: 2,
+    UserAttributeSimilarityValidator: 4,
+}
+DEFAULT_VALIDATOR_COST = 3
+
+
+class MappedPasswordList:
+    """
+    Sorted, newline separated password list searched in place.
+
+    The file is memory-mapped read-only, so every worker process on a host
+    shares the same pages instead of holding its own copy of the list.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+    def __contains__(self, password):
+        needle = password.encode('utf-8')
+        # Binary search over lines; lo and hi always sit at the start of a line.
+        lo, hi = 0, len(self._map)
+        while lo < hi:
+            start = self._map.rfind(b'\n', 0, (lo + hi) // 2) + 1
+            end = self._map.find(b'\n', start)
+            if end == -1:
+                end = len(self._map)
+            line = self._map[start:end]
+            if line == needle:
+                return True
+            if line < needle:
+                lo = end + 1
+            else:
+                hi = start
+        return False
+
+    def __len__(self):
+        return self._map[:].count(b'\n')
+
+
+def write_password_list(passwords, path):
+    """Write ``passwords`` in the format ``MappedPasswordList`` reads, replacing ``path`` atomically."""
+    lines = sorted({password.encode('utf-8') for password in passwords if password})
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+    with os.fdopen(fd, 'wb') as f:
+        for line in lines:
+            f.write(line + b'\n')
+    os.replace(tmp_path, path)
+
+
+class CompactCommonPasswordValidator(CommonPasswordValidator):
+    """
+    ``CommonPasswordValidator`` keeping its list in a frozenset, or with
+    ``mmap_path`` in a memory-mapped snapshot.
+
+    The snapshot is written from ``password_list_path`` the first time and
+    read directly afterwards, skipping the gzip decompression. Delete it to
+    pick up a changed list.
+    """
+
+    def __init__(self, password_list_path=CommonPasswordValidator.DEFAULT_PASSWORD_LIST_PATH, mmap_path=None):
+        if mmap_path is not None and os.path.exists(mmap_path):
+            self.passwords = MappedPasswordList(mmap_path)
+            return
+
+        super().__init__(password_list_path)
+        if mmap_path is not None:
+            write_password_list(self.passwords, mmap_path)
+            self.passwords = MappedPasswordList(mmap_path)
+        else:
+            self.passwords = frozenset(self.passwords)
+
+
+def validator_cost(validator):
+    for cls in type(validator).__mro__:
+        if cls in VALIDATOR_COST:
+            return VALIDATOR_COST[cls]
+    return DEFAULT_VALIDATOR_COST
+
+
+class RegistrationValidator:
+    """
+    The checks ``register`` runs before creating a user, built once.
+
+    Checks run from cheapest to most expensive and stop at the first step
+    that fails: password confirmation, email format, then the password
+    validators of ``AUTH_PASSWORD_VALIDATORS`` ordered by cost. Like
+    ``validate_password()``, every password validator still runs so all of
+    their messages are reported together.
+    """
+
+    def __init__(self, password_validators=None):
+        if password_validators is None:
+            password_validators = get_default_password_validators()
+        self.password_validators = sorted(password_validators, key=validator_cost)
+        self.email_validator = EmailValidator()
+
+    def validate(self, payload):
+        """Return the error message for ``payload``, or None when it is valid."""
+        if payload.password != payload.password_confirm:
+            return "Password does not match"
+
+        try:
+            self.email_validator(payload.email)
+        except ValidationError as e:
+            return e.messages
+
+        errors = []
+        for validator in self.password_validators:
+            try:
+                validator.validate(payload.password)
+            except ValidationError as e:
+                errors.extend(e.messages)
+        return errors or None
+
+
+_registration_validator = None
+_registration_validator_lock = threading.Lock()
+
+
+def get_registration_validator():
+    global _registration_validator
+    if _registration_validator is None:
+        with _registration_validator_lock:
+            if _registration_validator is None:
+                _registration_validator = RegistrationValidator()
+    return _registration_validator
+
+
+def reset_registration_validator(*args, **kwargs):
+    global _registration_validator
+    if kwargs['setting'] == 'AUTH_PASSWORD_VALIDATORS':
+        _registration_validator = None
+
+
+setting_changed.connect(reset_registration_validator)
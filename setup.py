@@ -20,7 +20,8 @@ setup(
         'Framework :: Django :: 4.0',
         'Intended Audience :: Developers',
     ],
-    packages=find_packages(exclude=['core']),
+    packages=find_packages(exclude=['core', 'benchmarks']),
+    package_data={'knightauth': ['templates/admin/knightauth/*.html']},
     python_requires='>=3.11.0',
     install_requires=[
         'django>=4.2.4',
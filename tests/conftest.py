@@ -0,0 +1,6 @@
+import pytest
+
+
+@pytest.fixture
+def user(django_user_model):
+    return django_user_model.objects.create_user(username='john.doe', email='john.doe@example.com', password='qwerty1200')
@@ -0,0 +1,7 @@
+from django.test import RequestFactory
+
+from knightauth.auth import TokenAuthentication
+
+
+def authenticate(token):
+    return TokenAuthentication().authenticate(RequestFactory().get('/'), token)
@@ -0,0 +1,107 @@
+from unittest import mock
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.db import IntegrityError
+from django.test import RequestFactory, override_settings
+from django.urls import reverse_lazy
+
+from knightauth.auth import AsyncTokenAuthentication
+from knightauth.models import AuthToken, UserTokenState
+
+
+def login(client, username='john.doe'):
+    return client.post(
+        reverse_lazy('async-api:token_login'),
+        data={'username': username, 'password': 'qwerty1200'},
+        content_type='application/json'
+    )
+
+
+@pytest.mark.django_db
+def test_async_authentication_with_valid_token(user):
+    _, token = AuthToken.objects.create(user=user)
+
+    auth_user = async_to_sync(AsyncTokenAuthentication().authenticate)(RequestFactory().get('/'), token)
+
+    assert auth_user == user
+
+
+@pytest.mark.django_db
+def test_async_authentication_with_invalid_token(user):
+    authenticate = async_to_sync(AsyncTokenAuthentication().authenticate)
+
+    assert authenticate(RequestFactory().get('/'), '') is None
+    assert authenticate(RequestFactory().get('/'), 'This is token') is None
+
+
+@pytest.mark.django_db
+def test_async_login_and_authenticated_request(user, client):
+    response = login(client)
+    assert response.status_code == 200
+
+    response = client.get(reverse_lazy('async-api:test'), HTTP_AUTHORIZATION=response.json()['token'])
+
+    assert response.json()['user'] == 'john.doe'
+
+
+@pytest.mark.django_db
+def test_async_logout_deletes_key(user, client):
+    login(client)
+    token = login(client).json()['token']
+
+    client.post(reverse_lazy('async-api:token_logout'), content_type='application/json', HTTP_AUTHORIZATION=token)
+
+    assert AuthToken.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_async_logout_all_deletes_keys_for_user(user, django_user_model, client):
+    django_user_model.objects.create_user(username='jane.doe', email='jane.doe@example.com', password='qwerty1200')
+    login(client, 'jane.doe')
+    login(client)
+    token = login(client).json()['token']
+
+    client.post(reverse_lazy('async-api:token_logoutall'), content_type='application/json', HTTP_AUTHORIZATION=token)
+
+    assert AuthToken.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_async_logout_all_without_revoked_tokens_is_rejected(user, client):
+    token = login(client).json()['token']
+
+    with mock.patch('knightauth.async_api.arevoke_all_tokens', mock.AsyncMock(return_value=0)):
+        response = client.post(
+            reverse_lazy('async-api:token_logoutall'), content_type='application/json', HTTP_AUTHORIZATION=token
+        )
+
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+@override_settings(KNIGHT_AUTH={'TOKEN_LIMIT_PER_USER': 1})
+def test_async_login_releases_the_slot_when_the_token_is_not_created(user, client):
+    with mock.patch.object(AuthToken.objects, 'create', side_effect=IntegrityError):
+        with pytest.raises(IntegrityError):
+            login(client)
+
+    assert not UserTokenState.objects.filter(user=user, token_count__gt=0).exists()
+    assert login(client).status_code == 200
+
+
+@pytest.mark.django_db
+def test_async_register(client, django_user_model):
+    response = client.post(
+        reverse_lazy('async-api:register_user'),
+        data={
+            'username': 'john.doe',
+            'email': 'john.doe@example.com',
+            'password': 'Correct-Horse-42',
+            'password_confirm': 'Correct-Horse-42',
+        },
+        content_type='application/json'
+    )
+
+    assert response.status_code == 201
+    assert django_user_model.objects.filter(username='john.doe').exists()
@@ -0,0 +1,44 @@
+import pytest
+from django.test import override_settings
+
+from benchmarks.bench_auth import DEFAULT_BUDGETS, Result, check_budgets, load_budgets, populate, run_scenarios
+from benchmarks.bench_register import run_scenarios as run_register_scenarios
+
+
+def query_budgets(auto_refresh):
+    # Latency depends on the machine running the tests, query counts do not.
+    return {
+        scenario: {'queries': budget['queries']}
+        for scenario, budget in load_budgets(DEFAULT_BUDGETS, auto_refresh).items()
+    }
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('auto_refresh', [False, True])
+def test_auth_hot_path_stays_within_query_budgets(auto_refresh):
+    knight_auth = {'AUTO_REFRESH': auto_refresh, 'MIN_REFRESH_INTERVAL': 0}
+
+    with override_settings(KNIGHT_AUTH=knight_auth, PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher']):
+        user = populate(users=5, tokens_per_user=5)
+        results = run_scenarios(user, iterations=5, tokens_per_user=5)
+
+    assert [result.scenario for result in results] == ['login', 'test', 'logout', 'logoutall']
+    assert check_budgets(results, query_budgets(auto_refresh)) == []
+
+
+def test_check_budgets_reports_every_exceeded_limit():
+    results = [Result('test', p50_ms=1.0, p99_ms=30.0, queries=3)]
+
+    violations = check_budgets(results, {'test': {'queries': 1, 'p50_ms': 5, 'p99_ms': 25}})
+
+    assert len(violations) == 2
+    assert violations[0].startswith('test: queries 3')
+
+
+@pytest.mark.django_db
+def test_register_benchmark_runs_every_scenario():
+    with override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher']):
+        results = run_register_scenarios(iterations=3)
+
+    assert [result.scenario for result in results] == ['validate', 'validate-uncached', 'register']
+    assert all(result.ops_per_s > 0 for result in results)
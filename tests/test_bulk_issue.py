@@ -0,0 +1,59 @@
+import pytest
+from django.core.management import call_command
+from django.test import override_settings
+
+from knightauth.models import AuthToken, UserTokenState
+from tests.helpers import authenticate
+
+
+@pytest.fixture
+def users(django_user_model):
+    return [
+        django_user_model.objects.create_user(username='john.doe', email='john.doe@example.com', password='qwerty1200'),
+        django_user_model.objects.create_user(username='jane.doe', email='jane.doe@example.com', password='qwerty1200'),
+    ]
+
+
+@pytest.mark.django_db
+def test_bulk_issue_inserts_in_chunks(users, django_assert_num_queries):
+    # The user's token generation, then three inserts.
+    with django_assert_num_queries(4):
+        issued = list(AuthToken.objects.bulk_issue(users[0], 25, prefix='svc_', batch_size=10))
+
+    tokens = [token for _, token in issued]
+    assert len(set(tokens)) == 25
+    assert all(token.startswith('svc_') for token in tokens)
+    assert AuthToken.objects.filter(user=users[0]).count() == 25
+    assert authenticate(tokens[-1]) == users[0]
+
+
+@pytest.mark.django_db
+def test_bulk_issue_for_several_users(users):
+    issued = list(AuthToken.objects.bulk_issue(users, 3, expiry=None))
+
+    assert [instance.user for instance, _ in issued] == [users[0]] * 3 + [users[1]] * 3
+    assert AuthToken.objects.filter(expiry__isnull=True).count() == 6
+    assert authenticate(issued[3][1]) == users[1]
+
+
+@pytest.mark.django_db
+@override_settings(KNIGHT_AUTH={'TOKEN_LIMIT_PER_USER': 100})
+def test_bulk_issue_updates_token_counter(users):
+    UserTokenState.objects.create(user=users[0], token_count=1)
+
+    list(AuthToken.objects.bulk_issue(users[0], 5, batch_size=2))
+
+    assert UserTokenState.objects.get(user=users[0]).token_count == 6
+
+
+@pytest.mark.django_db
+def test_issue_tokens_command_writes_file(users, tmp_path):
+    output = tmp_path / 'tokens.txt'
+
+    call_command('issue_tokens', 'john.doe', 'jane.doe', count=2, output=str(output), with_username=True)
+
+    lines = output.read_text().splitlines()
+    assert len(lines) == 4
+    username, token = lines[-1].split('\t')
+    assert username == 'jane.doe'
+    assert authenticate(token) == users[1]
@@ -0,0 +1,87 @@
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import override_settings
+from django.urls import reverse_lazy
+
+from knightauth.models import AuthToken, CompactAuthToken
+from tests.helpers import authenticate
+
+COMPACT_SETTINGS = {'TOKEN_MODEL': 'knightauth.CompactAuthToken'}
+
+
+@pytest.mark.django_db
+@override_settings(KNIGHT_AUTH=COMPACT_SETTINGS)
+def test_compact_token_stores_binary_digest(user):
+    instance, token = CompactAuthToken.objects.create(user=user)
+    instance.refresh_from_db()
+
+    assert len(bytes(instance.digest)) == 32
+    assert isinstance(instance.token_key, int)
+    assert authenticate(token) == user
+    assert authenticate(token[:-1] + 'x') is None
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('knight_auth', [
+    COMPACT_SETTINGS,
+    {**COMPACT_SETTINGS, 'TOKEN_CACHE': 'knightauth.cache.TokenVerificationCache'},
+])
+def test_compact_token_login_and_logout(user, client, knight_auth):
+    with override_settings(KNIGHT_AUTH=knight_auth):
+        response = client.post(
+            reverse_lazy('api-1.0.0:token_login'),
+            data={'username': 'john.doe', 'password': 'qwerty1200'},
+            content_type='application/json'
+        )
+        token = response.json()['token']
+
+        assert client.get(reverse_lazy('api-1.0.0:test'), HTTP_AUTHORIZATION=token).status_code == 200
+        client.post(reverse_lazy('api-1.0.0:token_logout'), content_type='application/json', HTTP_AUTHORIZATION=token)
+
+        assert CompactAuthToken.objects.count() == 0
+        assert client.get(reverse_lazy('api-1.0.0:test'), HTTP_AUTHORIZATION=token).status_code == 401
+
+    assert AuthToken.objects.count() == 0
+
+
+def migrate(targets):
+    executor = MigrationExecutor(connection)
+    executor.migrate(targets or executor.loader.graph.leaf_nodes())
+
+
+@pytest.mark.django_db(transaction=True)
+def test_data_migration_copies_existing_tokens(user):
+    instance, token = AuthToken.objects.create(user=user, prefix='knight_')
+
+    # Run the migration against the schema it was written for.
+    migrate([('knightauth', '0002_digest_scheme')])
+    try:
+        with override_settings(KNIGHT_AUTH=COMPACT_SETTINGS):
+            migrate([('knightauth', '0003_compactauthtoken')])
+    finally:
+        migrate(None)
+
+    with override_settings(KNIGHT_AUTH=COMPACT_SETTINGS):
+        compact = CompactAuthToken.objects.get()
+        assert compact.created == instance.created
+        assert compact.digest_scheme == instance.digest_scheme
+        assert authenticate(token) == user
+
+
+@pytest.mark.django_db
+def test_copy_command_skips_tokens_copied_before(user):
+    instance, token = AuthToken.objects.create(user=user)
+    stdout = StringIO()
+
+    call_command('copy_tokens_to_compact', stdout=stdout)
+    call_command('copy_tokens_to_compact', stdout=stdout)
+
+    assert stdout.getvalue().splitlines() == ['Copied 1 token(s).', 'Copied 0 token(s).']
+    assert CompactAuthToken.objects.get().created == instance.created
+    assert CompactAuthToken._meta.get_field('created').auto_now_add
+    with override_settings(KNIGHT_AUTH=COMPACT_SETTINGS):
+        assert authenticate(token) == user
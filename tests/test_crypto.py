@@ -0,0 +1,71 @@
+import hashlib
+from unittest import mock
+
+import pytest
+from django.test import override_settings
+
+from knightauth import crypto
+from knightauth.models import AuthToken
+from tests.helpers import authenticate
+
+
+def test_legacy_scheme_matches_secure_hash_algorithm():
+    token = crypto.create_token_string()
+
+    assert crypto.hash_token(token, crypto.DIGEST_SCHEME_LEGACY) == hashlib.sha512(token.encode()).hexdigest()
+
+
+@pytest.mark.parametrize('scheme', [crypto.DIGEST_SCHEME_BLAKE2B, crypto.DIGEST_SCHEME_HMAC_SHA256])
+def test_keyed_schemes_depend_on_digest_key(scheme):
+    token = crypto.create_token_string()
+
+    with override_settings(KNIGHT_AUTH={'DIGEST_KEY': 'first'}):
+        first = crypto.hash_token(token, scheme)
+    with override_settings(KNIGHT_AUTH={'DIGEST_KEY': 'second'}):
+        second = crypto.hash_token(token, scheme)
+
+    assert len(first) == 64
+    assert first != second
+
+
+@pytest.mark.django_db
+def test_new_tokens_use_configured_scheme(user):
+    instance, token = AuthToken.objects.create(user=user)
+
+    assert instance.digest_scheme == crypto.DIGEST_SCHEME_BLAKE2B
+    assert instance.digest == crypto.hash_token(token, crypto.DIGEST_SCHEME_BLAKE2B)
+    assert authenticate(token) == user
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('cached', [False, True])
+def test_tokens_keep_verifying_after_scheme_change(user, cached):
+    knight_auth = {'TOKEN_CACHE': 'knightauth.cache.TokenVerificationCache'} if cached else {}
+
+    with override_settings(KNIGHT_AUTH={**knight_auth, 'DIGEST_SCHEME': 'legacy'}):
+        instance, token = AuthToken.objects.create(user=user)
+        assert authenticate(token) == user
+
+        with override_settings(KNIGHT_AUTH={**knight_auth, 'DIGEST_SCHEME': 'hmac-sha256'}):
+            assert authenticate(token) == user
+            assert authenticate(token) == user
+
+    assert instance.digest_scheme == crypto.DIGEST_SCHEME_LEGACY
+
+
+@pytest.mark.django_db
+def test_cache_lookups_only_hash_with_the_configured_scheme(user, django_assert_num_queries):
+    knight_auth = {'TOKEN_CACHE': 'knightauth.cache.TokenVerificationCache'}
+    with override_settings(KNIGHT_AUTH={**knight_auth, 'DIGEST_SCHEME': 'legacy'}):
+        _, token = AuthToken.objects.create(user=user)
+
+    with override_settings(KNIGHT_AUTH=knight_auth):
+        for _ in range(2):
+            with mock.patch('knightauth.auth.hash_token', wraps=crypto.hash_token) as hash_token:
+                with django_assert_num_queries(1):
+                    assert authenticate(token) == user
+
+            # The configured scheme for the cache, the token's own one for the database.
+            assert [call.args[1] for call in hash_token.call_args_list] == [
+                crypto.DIGEST_SCHEME_BLAKE2B, crypto.DIGEST_SCHEME_LEGACY
+            ]
@@ -0,0 +1,60 @@
+from datetime import timedelta
+
+import pytest
+from django.core.management import call_command
+from django.test import RequestFactory
+
+from knightauth.auth import TokenAuthentication
+from knightauth.expiry import delete_expired_tokens
+from knightauth.models import AuthToken
+from knightauth.signals import tokens_expired
+
+
+@pytest.mark.django_db
+def test_delete_expired_tokens_keeps_live_tokens(user):
+    for _ in range(3):
+        AuthToken.objects.create(user=user, expiry=timedelta(seconds=0))
+    AuthToken.objects.create(user=user)
+    AuthToken.objects.create(user=user, expiry=None)
+
+    assert delete_expired_tokens() == 3
+    assert AuthToken.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_delete_expired_tokens_sends_one_signal_per_batch(user):
+    batches = []
+
+    def signal_handler(sender, usernames, count, **kwargs):
+        batches.append((usernames, count))
+
+    tokens_expired.connect(signal_handler)
+    try:
+        for _ in range(5):
+            AuthToken.objects.create(user=user, expiry=timedelta(seconds=0))
+
+        assert delete_expired_tokens(batch_size=2) == 5
+    finally:
+        tokens_expired.disconnect(signal_handler)
+
+    assert [count for _, count in batches] == [2, 2, 1]
+    assert batches[0][0] == ['john.doe', 'john.doe']
+
+
+@pytest.mark.django_db
+def test_authentication_leaves_other_expired_tokens(user):
+    AuthToken.objects.create(user=user, expiry=timedelta(seconds=0))
+    _, token = AuthToken.objects.create(user=user)
+
+    assert TokenAuthentication().authenticate(RequestFactory().get('/'), token) == user
+    assert AuthToken.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_clear_expired_tokens_command(user):
+    AuthToken.objects.create(user=user, expiry=timedelta(seconds=0))
+    AuthToken.objects.create(user=user)
+
+    call_command('clear_expired_tokens', batch_size=10)
+
+    assert AuthToken.objects.count() == 1
@@ -0,0 +1,143 @@
+from io import StringIO
+
+import logging
+from unittest import mock
+
+import pytest
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, get_hasher
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse_lazy
+
+from knightauth.hashers import (
+    calibrate, calibration_key, check_hasher_settings, describe_hash, get_hasher_parameters, hash_distribution
+)
+
+TUNED_PBKDF2 = ['knightauth.hashers.TunedPBKDF2PasswordHasher']
+DJANGO_ITERATIONS = PBKDF2PasswordHasher.iterations
+
+
+def tuned(iterations):
+    return override_settings(
+        PASSWORD_HASHERS=TUNED_PBKDF2,
+        KNIGHT_AUTH={'PASSWORD_HASH_PARAMETERS': {'pbkdf2_sha256': {'iterations': iterations}}}
+    )
+
+
+@pytest.fixture(autouse=True)
+def clear_calibrations():
+    cache.clear()
+
+
+@pytest.fixture
+def user(django_user_model):
+    with tuned(20000):
+        return django_user_model.objects.create_user(
+            username='john.doe', email='john.doe@example.com', password='qwerty1200'
+        )
+
+
+def login(client):
+    return client.post(
+        reverse_lazy('api-1.0.0:token_login'),
+        data={'username': 'john.doe', 'password': 'qwerty1200'},
+        content_type='application/json'
+    )
+
+
+def iterations(user):
+    user.refresh_from_db()
+    return int(user.password.split('$')[1])
+
+
+def test_calibration_never_goes_below_django_defaults():
+    hasher = get_hasher('pbkdf2_sha256')
+
+    assert calibrate(hasher, 0.001) == {'iterations': DJANGO_ITERATIONS}
+
+
+@override_settings(PASSWORD_HASHERS=TUNED_PBKDF2, KNIGHT_AUTH={'PASSWORD_HASH_TARGET_MS': 1})
+def test_target_calibrates_once_and_stores_the_result():
+    parameters = get_hasher_parameters('pbkdf2_sha256')
+    assert parameters == {'iterations': DJANGO_ITERATIONS}
+    assert get_hasher_parameters('pbkdf2_sha256') is parameters
+    assert get_hasher().iterations == DJANGO_ITERATIONS
+    assert cache.get(calibration_key('pbkdf2_sha256')) == parameters
+
+
+@override_settings(PASSWORD_HASHERS=TUNED_PBKDF2, KNIGHT_AUTH={'PASSWORD_HASH_TARGET_MS': 1})
+def test_stored_calibration_is_used_instead_of_measuring():
+    cache.set(calibration_key('pbkdf2_sha256'), {'iterations': 1_200_000})
+
+    with mock.patch('knightauth.hashers.calibrate', side_effect=AssertionError):
+        assert get_hasher().iterations == 1_200_000
+
+
+@override_settings(PASSWORD_HASHERS=TUNED_PBKDF2, KNIGHT_AUTH={'PASSWORD_HASH_TARGET_MS': 1})
+def test_startup_check_does_not_calibrate_and_flags_per_process_cache(caplog):
+    with mock.patch('knightauth.hashers.calibrate', side_effect=AssertionError), \
+            caplog.at_level(logging.WARNING, logger='knightauth.hashers'):
+        check_hasher_settings()
+
+    assert 'calibrations are not shared between processes' in caplog.text
+
+
+def test_weak_parameters_are_reported_at_startup(caplog):
+    with tuned(20000), caplog.at_level(logging.WARNING, logger='knightauth.hashers'):
+        check_hasher_settings()
+
+    assert 'iterations is below the Django default for pbkdf2_sha256' in caplog.text
+
+
+@pytest.mark.django_db
+def test_login_rehashes_up_and_down(client, user):
+    assert iterations(user) == 20000
+
+    with tuned(30000):
+        assert login(client).status_code == 200
+    assert iterations(user) == 30000
+
+    with tuned(10000):
+        assert login(client).status_code == 200
+    assert iterations(user) == 10000
+
+    with tuned(10000):
+        assert login(client).status_code == 200
+    assert iterations(user) == 10000
+
+
+@pytest.mark.django_db
+def test_hash_distribution(django_user_model, user):
+    django_user_model.objects.create_user(username='jane.doe', password=None)
+    with tuned(30000):
+        distribution = hash_distribution()
+        assert describe_hash('bogus') == ('unknown', False)
+
+    assert distribution == {
+        ('pbkdf2_sha256 (iterations=20000)', False): 1,
+        ('unusable', True): 1,
+    }
+
+
+@pytest.mark.django_db
+def test_password_hash_report(user):
+    out = StringIO()
+    with tuned(20000):
+        call_command('password_hash_report', stdout=out)
+
+    output = out.getvalue()
+    assert 'pbkdf2_sha256 (iterations=20000)' in output
+    assert 'current' in output
+    assert '0 of 1 user(s) will be rehashed' in output
+
+
+@override_settings(PASSWORD_HASHERS=TUNED_PBKDF2, KNIGHT_AUTH={'PASSWORD_HASH_TARGET_MS': 1})
+def test_tune_password_hasher_command():
+    out = StringIO()
+    err = StringIO()
+    call_command('tune_password_hasher', target_ms=1, save=True, stdout=out, stderr=err)
+
+    assert "{'pbkdf2_sha256': {'iterations': %d}}" % DJANGO_ITERATIONS in out.getvalue()
+    assert 'takes longer than the target' in err.getvalue()
+    assert cache.get(calibration_key('pbkdf2_sha256')) == {'iterations': DJANGO_ITERATIONS}
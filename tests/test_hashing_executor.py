@@ -0,0 +1,109 @@
+import threading
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.db import transaction
+from django.test import override_settings
+from django.urls import reverse_lazy
+
+from knightauth.executor import HashingOverloaded, PasswordHashingExecutor, get_hashing_executor
+
+
+def login(client, url='api-1.0.0:token_login'):
+    return client.post(
+        reverse_lazy(url),
+        data={'username': 'john.doe', 'password': 'qwerty1200'},
+        content_type='application/json'
+    )
+
+
+def test_executor_sheds_load_beyond_queue():
+    executor = PasswordHashingExecutor(max_workers=1, max_queue=1)
+    release = threading.Event()
+    try:
+        running = executor.submit(release.wait)
+        queued = executor.submit(lambda: 'queued')
+
+        with pytest.raises(HashingOverloaded):
+            executor.submit(lambda: 'shed')
+    finally:
+        release.set()
+
+    assert queued.result() == 'queued'
+    running.result()
+    assert async_to_sync(executor.arun)(lambda: 'async') == 'async'
+    assert len(executor) == 0
+    executor.shutdown()
+
+
+def register(client):
+    return client.post(
+        reverse_lazy('api-1.0.0:register_user'),
+        data={
+            'username': 'jane.doe',
+            'email': 'jane.doe@example.com',
+            'password': 'qwerty1200',
+            'password_confirm': 'qwerty1200',
+        },
+        content_type='application/json'
+    )
+
+
+# The user only exists in the test transaction, so the lookup must stay on the request thread.
+@pytest.mark.django_db
+@override_settings(KNIGHT_AUTH={'PASSWORD_HASHING_WORKERS': 2})
+@pytest.mark.parametrize('url', ['api-1.0.0:token_login', 'async-api:token_login'])
+def test_login_hashes_on_the_pool(user, client, url):
+    response = login(client, url)
+
+    assert response.status_code == 200
+    assert response.json()['token']
+
+
+@pytest.mark.django_db
+@override_settings(
+    KNIGHT_AUTH={'PASSWORD_HASHING_WORKERS': 1},
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher']
+)
+def test_login_saves_rehashed_password_on_the_request_thread(user, client, django_user_model):
+    with override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.PBKDF2PasswordHasher']):
+        response = login(client)
+
+    assert response.status_code == 200
+    assert django_user_model.objects.get(pk=user.pk).password.startswith('pbkdf2_sha256$')
+
+
+@pytest.mark.django_db(transaction=True)
+@override_settings(KNIGHT_AUTH={'PASSWORD_HASHING_WORKERS': 1})
+def test_register_hashes_on_the_pool(client, django_user_model):
+    response = register(client)
+
+    assert response.status_code == 201
+    assert django_user_model.objects.get(username='jane.doe').check_password('qwerty1200')
+
+
+@pytest.mark.django_db(transaction=True)
+@override_settings(KNIGHT_AUTH={'PASSWORD_HASHING_WORKERS': 1})
+def test_register_takes_part_in_the_request_transaction(client, django_user_model):
+    with transaction.atomic():
+        response = register(client)
+        transaction.set_rollback(True)
+
+    assert response.status_code == 201
+    assert not django_user_model.objects.filter(username='jane.doe').exists()
+
+
+@pytest.mark.django_db
+@override_settings(KNIGHT_AUTH={'PASSWORD_HASHING_WORKERS': 1, 'PASSWORD_HASHING_QUEUE_SIZE': 0})
+@pytest.mark.parametrize('url', ['api-1.0.0:token_login', 'api-1.0.0:session_login', 'async-api:token_login'])
+def test_login_is_shed_when_pool_is_full(user, client, url):
+    release = threading.Event()
+    busy = get_hashing_executor().submit(release.wait)
+    try:
+        response = login(client, url)
+    finally:
+        release.set()
+        busy.result()
+
+    assert response.status_code == 503
+    assert response['Retry-After'] == '1'
@@ -0,0 +1,84 @@
+import pytest
+from django.db import connection
+from django.db.migrations.state import ProjectState
+from django.db.models import Index, Q
+from django.utils import timezone
+
+from knightauth.auth import TokenAuthentication
+from knightauth.indexes import AddPartialIndex, AddTokenKeyCoveringIndex
+from knightauth.models import AuthToken, CompactAuthToken
+
+pytestmark = pytest.mark.skipif(connection.vendor != 'sqlite', reason='Query plans are SQLite specific')
+
+
+def index_of(queryset):
+    plan = queryset.explain()
+    return plan.split('USING INDEX ', 1)[1].split()[0] if 'USING INDEX ' in plan else plan
+
+
+def index_name(model, fields):
+    return next(index.name for index in model._meta.indexes if index.fields == fields)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('model', [AuthToken, CompactAuthToken])
+def test_token_queries_use_indexes(user, model):
+    now = timezone.now()
+
+    # delete_expired_tokens
+    assert index_of(model.objects.filter(expiry__lt=now).values_list('pk', 'digest', 'user_id')[:1000]) == (
+        index_name(model, ['expiry'])
+    )
+    # Expired tokens of one user, for the token limit.
+    assert index_of(model.objects.filter(user=user, expiry__lt=now)) == index_name(model, ['user', 'expiry'])
+    # Token listing
+    assert index_of(model.objects.active(user.pk).order_by('-created', '-pk')[:21]) == (
+        index_name(model, ['user', 'created'])
+    )
+
+
+def test_index_names_are_derived_from_the_table():
+    names = [index.name for model in (AuthToken, CompactAuthToken) for index in model._meta.indexes]
+
+    assert len(set(names)) == len(names)
+    assert all(name.startswith('knightauth_') for name in names)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('model', [AuthToken, CompactAuthToken])
+def test_user_has_no_index_of_its_own(model):
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+
+    indexed = [constraint['columns'] for constraint in constraints.values() if constraint['index']]
+    assert ['user_id'] not in indexed
+    assert ['user_id', 'created'] in indexed
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('knight_auth_model', ['knightauth.AuthToken', 'knightauth.CompactAuthToken'])
+def test_authenticate_query_uses_token_key_index(settings, knight_auth_model):
+    settings.KNIGHT_AUTH = {'TOKEN_MODEL': knight_auth_model}
+
+    plan = TokenAuthentication().get_token_queryset('0123456789abcdef').explain()
+
+    assert 'USING INDEX' in plan and '(token_key=?)' in plan
+
+
+@pytest.mark.django_db(transaction=True)
+def test_partial_index_falls_back_to_full_index(monkeypatch):
+    state = ProjectState.from_apps(AuthToken._meta.apps)
+    operation = AddPartialIndex('authtoken', Index(fields=['expiry'], name='probe_expiry', condition=Q(expiry__isnull=False)))
+    covering = AddTokenKeyCoveringIndex()
+
+    with connection.schema_editor(collect_sql=True) as schema_editor:
+        operation.database_forwards('knightauth', schema_editor, state, state)
+        covering.database_forwards('knightauth', schema_editor, state, state)
+    assert len(schema_editor.collected_sql) == 1
+    assert 'WHERE' in schema_editor.collected_sql[0]
+
+    monkeypatch.setattr(connection.features, 'supports_partial_indexes', False)
+    with connection.schema_editor(collect_sql=True) as schema_editor:
+        operation.database_forwards('knightauth', schema_editor, state, state)
+    assert 'WHERE' not in schema_editor.collected_sql[0]
+    assert 'probe_expiry' in schema_editor.collected_sql[0]
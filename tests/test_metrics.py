@@ -0,0 +1,142 @@
+import gc
+import threading
+from datetime import timedelta
+
+import pytest
+from django.core.signals import request_finished
+from django.test import RequestFactory, override_settings
+from django.urls import reverse_lazy
+
+from knightauth import metrics
+from knightauth.metrics import Counter, Histogram
+from knightauth.models import AuthToken
+from tests.helpers import authenticate
+
+METRICS_SETTINGS = {'METRICS': True}
+
+
+@pytest.fixture
+def enabled(settings):
+    metrics.clear()
+    settings.KNIGHT_AUTH = METRICS_SETTINGS
+    yield
+    metrics.clear()
+
+
+def login(client, password):
+    return client.post(
+        reverse_lazy('api-1.0.0:token_login'),
+        data={'username': 'john.doe', 'password': password},
+        content_type='application/json'
+    )
+
+
+def test_nothing_is_recorded_by_default():
+    counter = Counter('test_total', 'Test.')
+    counter.inc()
+
+    assert counter.value() == 0
+
+
+def test_counter_sums_increments_of_every_thread(enabled):
+    counter = Counter('test_total', 'Test.', ('result',))
+
+    def work():
+        for _ in range(1000):
+            counter.inc('ok')
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert counter.value('ok') == 4000
+
+
+def test_shards_of_finished_threads_are_folded_into_the_base(enabled):
+    histogram = Histogram('test_seconds', 'Test.', buckets=(1.0,))
+    threads = [threading.Thread(target=histogram.observe, args=(0.5,)) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+        thread.join()
+    gc.collect()
+
+    assert histogram._shards._shards == []
+    assert [sample.value for sample in histogram.collect().samples] == [3, 3, 1.5, 3]
+
+
+def test_histogram_renders_cumulative_buckets(enabled):
+    histogram = Histogram('test_seconds', 'Test.', buckets=(0.1, 1.0))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(3)
+
+    assert metrics.render([histogram.collect()]) == (
+        '# HELP test_seconds Test.\n'
+        '# TYPE test_seconds histogram\n'
+        'test_seconds_bucket{le="0.1"} 1\n'
+        'test_seconds_bucket{le="1.0"} 2\n'
+        'test_seconds_bucket{le="+Inf"} 3\n'
+        'test_seconds_sum 3.55\n'
+        'test_seconds_count 3\n'
+    )
+
+
+@pytest.mark.django_db
+def test_authentication_results_are_counted_without_queries(user, enabled, django_assert_num_queries):
+    _, token = AuthToken.objects.create(user=user)
+    _, expired = AuthToken.objects.create(user=user, expiry=timedelta(seconds=-1))
+
+    with django_assert_num_queries(1):
+        authenticate(token)
+    authenticate('unknown-token')
+    authenticate(expired)
+
+    assert metrics.authentications.value('success') == 1
+    assert metrics.authentications.value('unknown') == 1
+    assert metrics.authentications.value('expired') == 1
+    assert metrics.tokens_expired.value('auth_token') == 1
+    # Two issued, two verified; no row matched the unknown token, so it was never hashed.
+    assert metrics.token_digests.value('blake2b') == 4
+
+
+@pytest.mark.django_db
+def test_refresh_writes_are_counted(user, enabled):
+    _, token = AuthToken.objects.create(user=user, expiry=timedelta(minutes=5))
+
+    with override_settings(KNIGHT_AUTH={**METRICS_SETTINGS, 'AUTO_REFRESH': True}):
+        authenticate(token)
+
+    assert metrics.token_refreshes.value('write') == 1
+
+
+@pytest.mark.django_db
+def test_logins_and_password_hash_latency_are_recorded(user, client, enabled):
+    assert login(client, 'wrong').status_code == 401
+    assert login(client, 'qwerty1200').status_code == 200
+
+    assert metrics.logins.value('invalid') == 1
+    assert metrics.logins.value('success') == 1
+    family = metrics.password_hash_seconds.collect()
+    assert [sample.value for sample in family.samples if sample.name.endswith('_count')] == [2]
+
+
+def test_metrics_view_serves_the_exposition_format(enabled):
+    metrics.logins.inc('success')
+    response = metrics.metrics_view(RequestFactory().get('/metrics'))
+
+    assert response['Content-Type'] == metrics.EXPOSITION_CONTENT_TYPE
+    assert 'knightauth_logins_total{result="success"} 1' in response.content.decode()
+
+
+@pytest.mark.django_db
+def test_exporter_is_called_after_requests(monkeypatch):
+    exported = []
+    monkeypatch.setattr(metrics, '_next_export', 0)
+    with override_settings(KNIGHT_AUTH={**METRICS_SETTINGS, 'METRICS_EXPORTER': exported.append}):
+        request_finished.send(sender=None)
+        request_finished.send(sender=None)
+
+    assert len(exported) == 1
+    assert [family.name for family in exported[0]] == [metric.name for metric in metrics.REGISTRY]
@@ -0,0 +1,93 @@
+import pytest
+from django.conf import settings
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path, reverse_lazy
+from ninja import NinjaAPI
+from ninja.security import SessionAuth
+
+from knightauth.auth import TokenAuthentication
+from knightauth.models import AuthToken
+
+MIDDLEWARE = [
+    'knightauth.middleware.ExemptAPIKeyAuthFromCSRFMiddleware' if name == 'django.middleware.csrf.CsrfViewMiddleware'
+    else name
+    for name in settings.MIDDLEWARE
+]
+# The exemption has to be decided before CsrfViewMiddleware checks the request.
+MIDDLEWARE.insert(MIDDLEWARE.index('knightauth.middleware.ExemptAPIKeyAuthFromCSRFMiddleware') + 1,
+                  'django.middleware.csrf.CsrfViewMiddleware')
+
+# A bad token falls through to the session with this configuration.
+fallthrough_api = NinjaAPI(urls_namespace='fallthrough-api', auth=[TokenAuthentication(), SessionAuth()])
+
+
+@fallthrough_api.post('/whoami', url_name='whoami')
+def whoami(request):
+    return {'user': request.auth.username}
+
+
+urlpatterns = [path('api/', fallthrough_api.urls)]
+
+
+@pytest.fixture
+def csrf_client(user):
+    client = Client(enforce_csrf_checks=True)
+    client.force_login(user)
+    return client
+
+
+@pytest.mark.django_db
+@override_settings(MIDDLEWARE=MIDDLEWARE)
+def test_token_request_skips_session_and_user(user):
+    _, token = AuthToken.objects.create(user)
+
+    with CaptureQueriesContext(connection) as captured:
+        response = Client(enforce_csrf_checks=True).get(reverse_lazy('api-1.0.0:test'), HTTP_AUTHORIZATION=token)
+
+    assert response.status_code == 200
+    # Only the token lookup, neither the session nor the session's user.
+    assert len(captured) == 1
+    assert 'django_session' not in captured[0]['sql']
+
+
+@pytest.mark.django_db
+@override_settings(MIDDLEWARE=MIDDLEWARE)
+def test_token_post_is_exempt_from_csrf(user):
+    _, token = AuthToken.objects.create(user)
+
+    response = Client(enforce_csrf_checks=True).post(reverse_lazy('api-1.0.0:token_logout'), HTTP_AUTHORIZATION=token)
+
+    assert response.status_code == 204
+
+
+@pytest.mark.django_db
+@override_settings(MIDDLEWARE=MIDDLEWARE, ROOT_URLCONF=__name__)
+def test_session_post_with_any_authorization_header_still_needs_csrf_token(csrf_client):
+    # Browsers send cached Basic credentials cross-site along with the session cookie.
+    response = csrf_client.post(reverse_lazy('fallthrough-api:whoami'), HTTP_AUTHORIZATION='Basic Ym9ndXM6Ym9ndXM=')
+
+    assert response.status_code == 403
+
+
+@pytest.mark.django_db
+@override_settings(MIDDLEWARE=MIDDLEWARE)
+def test_session_post_still_needs_csrf_token(csrf_client):
+    response = csrf_client.post(reverse_lazy('api-1.0.0:session_logout'))
+
+    assert response.status_code == 403
+
+
+@pytest.mark.django_db
+@override_settings(MIDDLEWARE=MIDDLEWARE)
+def test_anonymous_api_post_is_exempt(user):
+    client = Client(enforce_csrf_checks=True)
+
+    response = client.post(
+        reverse_lazy('api-1.0.0:session_login'),
+        data={'username': 'john.doe', 'password': 'qwerty1200'},
+        content_type='application/json'
+    )
+
+    assert response.status_code == 200
@@ -0,0 +1,112 @@
+from datetime import timedelta
+from unittest import mock
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import RequestFactory
+from django.utils import timezone
+
+from knightauth import crypto
+from knightauth.auth import AsyncTokenAuthentication
+from knightauth.cache import NegativeTokenCache, get_negative_token_cache
+from knightauth.models import AuthToken
+from knightauth.revocation import bump_token_generation
+from tests.helpers import authenticate
+
+NEGATIVE_CACHE_SETTINGS = {'NEGATIVE_TOKEN_CACHE': 'knightauth.cache.NegativeTokenCache'}
+
+
+@pytest.fixture
+def negative_cache(settings):
+    settings.KNIGHT_AUTH = NEGATIVE_CACHE_SETTINGS
+    return get_negative_token_cache()
+
+
+def test_negative_cache_is_disabled_by_default():
+    assert get_negative_token_cache() is None
+
+
+def test_stats_report_hit_rate_and_memory():
+    cache = NegativeTokenCache(max_size=2, timeout=60)
+    cache.add('a')
+    cache.contains('a')
+    cache.contains('b')
+
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['hit_rate'], stats['size']) == (1, 1, 0.5, 1)
+    assert stats['memory_bytes'] > 0
+
+
+@pytest.mark.django_db
+def test_repeated_unknown_token_makes_no_queries(negative_cache, django_assert_num_queries):
+    with django_assert_num_queries(1):
+        assert authenticate('unknown-token') is None
+
+    with django_assert_num_queries(0):
+        assert authenticate('unknown-token') is None
+
+    assert negative_cache.stats()['hits'] == 1
+
+
+@pytest.mark.django_db
+def test_wrong_secret_for_live_key_is_not_remembered(user, negative_cache):
+    _, token = AuthToken.objects.create(user=user)
+    forged = token[:-1] + ('0' if token[-1] != '0' else '1')
+
+    assert authenticate(forged) is None
+    assert authenticate(token) == user
+    assert negative_cache.stats()['size'] == 0
+
+
+@pytest.mark.django_db
+def test_expired_and_revoked_tokens_are_remembered(user, negative_cache, django_assert_num_queries):
+    _, expired = AuthToken.objects.create(user=user, expiry=timedelta(seconds=-1))
+    _, revoked = AuthToken.objects.create(user=user)
+    bump_token_generation(user.pk)
+
+    assert authenticate(expired) is None
+    assert authenticate(revoked) is None
+
+    with django_assert_num_queries(0):
+        assert authenticate(expired) is None
+        assert authenticate(revoked) is None
+
+
+@pytest.mark.django_db
+def test_expired_token_sharing_its_key_with_a_live_one_is_not_remembered(user, negative_cache):
+    _, token = AuthToken.objects.create(user=user)
+    expired = token[:15] + 'b' * (len(token) - 15)
+    AuthToken.objects.bulk_create([AuthToken(**AuthToken.objects._token_fields(
+        user, expired, crypto.get_digest_scheme(), timezone.now() - timedelta(seconds=1), 0
+    ))])
+
+    assert authenticate(expired) is None
+    assert negative_cache.stats()['size'] == 0
+    assert authenticate(token) == user
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('issue', [
+    lambda user: AuthToken.objects.create(user=user),
+    lambda user: async_to_sync(AuthToken.objects.acreate)(user=user),
+    lambda user: next(AuthToken.objects.bulk_issue(user, 1)),
+])
+def test_issuing_a_token_forgets_its_key(user, negative_cache, issue):
+    token = 'a' * 64
+    assert authenticate(token) is None
+    assert negative_cache.contains(AuthToken.get_token_key(token))
+
+    with mock.patch('knightauth.crypto.generate_bytes', side_effect=lambda size: b'\xaa' * size):
+        issue(user)
+
+    assert authenticate(token) == user
+
+
+@pytest.mark.django_db(transaction=True)
+def test_async_authentication_uses_negative_cache(negative_cache, django_assert_num_queries):
+    auth = AsyncTokenAuthentication()
+    request = RequestFactory().get('/')
+    async_to_sync(auth.authenticate)(request, 'unknown-token')
+
+    with django_assert_num_queries(0):
+        assert async_to_sync(auth.authenticate)(request, 'unknown-token') is None
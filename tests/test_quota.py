@@ -0,0 +1,143 @@
+from datetime import timedelta
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse_lazy
+
+from knightauth.expiry import delete_expired_tokens
+from knightauth.models import AuthToken, UserTokenState
+from knightauth.quota import acquire_token_slot
+
+
+def login(client, password='qwerty1200'):
+    return client.post(
+        reverse_lazy('api-1.0.0:token_login'),
+        data={'username': 'john.doe', 'password': password},
+        content_type='application/json'
+    )
+
+
+def token_count(user):
+    return UserTokenState.objects.get(user=user).token_count
+
+
+@pytest.mark.django_db
+@override_settings(KNIGHT_AUTH={'TOKEN_LIMIT_PER_USER': 2})
+def test_login_is_rejected_at_token_limit(user, client):
+    assert login(client).status_code == 200
+    assert login(client).status_code == 200
+
+    response = login(client)
+
+    assert response.status_code == 403
+    assert AuthToken.objects.count() == 2
+    assert token_count(user) == 2
+
+
+@pytest.mark.django_db
+@override_settings(KNIGHT_AUTH={'TOKEN_LIMIT_PER_USER': 2, 'TOKEN_LIMIT_EVICT_OLDEST': True})
+def test_login_evicts_oldest_token_at_token_limit(user, client):
+    oldest = login(client).json()['token']
+    login(client)
+
+    assert login(client).status_code == 200
+    assert AuthToken.objects.count() == 2
+    assert token_count(user) == 2
+    assert client.get(reverse_lazy('api-1.0.0:test'), HTTP_AUTHORIZATION=oldest).status_code == 401
+
+
+@pytest.mark.django_db
+@override_settings(KNIGHT_AUTH={'TOKEN_LIMIT_PER_USER': 2})
+def test_logout_frees_a_slot(user, client):
+    login(client)
+    token = login(client).json()['token']
+
+    client.post(reverse_lazy('api-1.0.0:token_logout'), content_type='application/json', HTTP_AUTHORIZATION=token)
+
+    assert token_count(user) == 1
+    assert login(client).status_code == 200
+
+
+@pytest.mark.django_db
+@override_settings(KNIGHT_AUTH={'TOKEN_LIMIT_PER_USER': 3})
+def test_counter_tracks_logout_all_and_expiry(user, client):
+    login(client)
+    token = login(client).json()['token']
+    client.post(reverse_lazy('api-1.0.0:token_logoutall'), content_type='application/json', HTTP_AUTHORIZATION=token)
+    assert token_count(user) == 0
+
+    login(client)
+    AuthToken.objects.update(expiry=AuthToken.objects.get().created - timedelta(seconds=1))
+    delete_expired_tokens()
+    assert token_count(user) == 0
+
+
+@pytest.mark.django_db
+@override_settings(KNIGHT_AUTH={'TOKEN_LIMIT_PER_USER': 1})
+def test_expired_tokens_are_purged_at_token_limit(user):
+    AuthToken.objects.create(user=user, expiry=timedelta(seconds=0))
+
+    assert acquire_token_slot(user)
+    assert AuthToken.objects.count() == 0
+    assert token_count(user) == 1
+
+
+@pytest.mark.django_db
+@override_settings(KNIGHT_AUTH={'TOKEN_LIMIT_PER_USER': 5})
+def test_acquire_below_limit_is_a_single_query(user, django_assert_num_queries):
+    UserTokenState.objects.create(user=user, token_count=3)
+
+    with django_assert_num_queries(1):
+        assert acquire_token_slot(user)
+
+    assert token_count(user) == 4
+
+
+@pytest.mark.django_db
+@override_settings(KNIGHT_AUTH={'TOKEN_LIMIT_PER_USER': 5})
+def test_reset_token_counts_keeps_revocations(user, client):
+    old_token = login(client).json()['token']
+    user.set_password('qwerty1300')
+    user.save()
+    AuthToken.objects.create(user=user)
+    UserTokenState.objects.filter(user=user).update(token_count=4)
+
+    call_command('reset_token_counts', stdout=StringIO())
+
+    assert token_count(user) == 1
+    assert client.get(reverse_lazy('api-1.0.0:test'), HTTP_AUTHORIZATION=old_token).status_code == 401
+
+
+@pytest.mark.django_db
+@override_settings(KNIGHT_AUTH={'TOKEN_LIMIT_PER_USER': 2})
+def test_sweeping_revoked_tokens_does_not_free_slots(user, client):
+    login(client)
+    login(client)
+    user.set_password('qwerty1300')
+    user.save()
+    AuthToken.objects.update(expiry=AuthToken.objects.first().created - timedelta(seconds=1))
+
+    assert login(client, 'qwerty1300').status_code == 200
+    delete_expired_tokens()
+
+    assert token_count(user) == 1
+    assert login(client, 'qwerty1300').status_code == 200
+    assert login(client, 'qwerty1300').status_code == 403
+    assert AuthToken.objects.count() == 2
+
+
+@pytest.mark.django_db
+@override_settings(KNIGHT_AUTH={'TOKEN_LIMIT_PER_USER': 2})
+def test_purging_revoked_tokens_does_not_free_slots(user):
+    AuthToken.objects.create(user=user, expiry=timedelta(seconds=-1))
+    user.set_password('qwerty1300')
+    user.save()
+    AuthToken.objects.create(user=user)
+    AuthToken.objects.create(user=user, expiry=timedelta(seconds=-1))
+    UserTokenState.objects.filter(user=user).update(token_count=2)
+
+    assert acquire_token_slot(user)
+    assert AuthToken.objects.count() == 1
+    assert token_count(user) == 2
@@ -0,0 +1,75 @@
+from datetime import timedelta
+
+import pytest
+from django.core.signals import request_finished
+from django.test import RequestFactory
+
+from knightauth.auth import TokenAuthentication
+from knightauth.models import AuthToken
+from knightauth.refresh import refresh_buffer
+
+WRITE_BEHIND_SETTINGS = {
+    'AUTO_REFRESH': True,
+    'REFRESH_WRITE_BEHIND': True,
+    'REFRESH_MAX_STALENESS': 0,
+}
+
+
+@pytest.fixture
+def write_behind(settings):
+    settings.KNIGHT_AUTH = WRITE_BEHIND_SETTINGS
+    yield refresh_buffer
+    refresh_buffer.flush()
+
+
+def create_stale_token(user):
+    instance, token = AuthToken.objects.create(user=user, expiry=timedelta(minutes=5))
+    return instance, token
+
+
+@pytest.mark.django_db
+def test_refresh_is_buffered_instead_of_saved(user, write_behind, django_assert_num_queries):
+    instance, token = create_stale_token(user)
+
+    with django_assert_num_queries(1):
+        TokenAuthentication().authenticate(RequestFactory().get('/'), token)
+
+    assert AuthToken.objects.get(pk=instance.pk).expiry == instance.expiry
+    assert write_behind.pending(instance.pk) > instance.expiry
+
+
+@pytest.mark.django_db
+def test_flush_writes_all_pending_refreshes_in_one_query(user, write_behind, django_assert_num_queries):
+    instances = []
+    for _ in range(3):
+        instance, token = create_stale_token(user)
+        TokenAuthentication().authenticate(RequestFactory().get('/'), token)
+        instances.append(instance)
+
+    with django_assert_num_queries(1):
+        assert write_behind.flush() == 3
+
+    for instance in instances:
+        old_expiry = instance.expiry
+        instance.refresh_from_db()
+        assert instance.expiry > old_expiry + timedelta(hours=9)
+
+
+@pytest.mark.django_db
+def test_request_finished_flushes_due_refreshes(user, write_behind):
+    instance, token = create_stale_token(user)
+    TokenAuthentication().authenticate(RequestFactory().get('/'), token)
+
+    request_finished.send(sender=None)
+
+    assert len(write_behind) == 0
+    assert AuthToken.objects.get(pk=instance.pk).expiry > instance.expiry
+
+
+@pytest.mark.django_db
+def test_pending_refresh_keeps_token_alive(user, write_behind):
+    instance, token = create_stale_token(user)
+    TokenAuthentication().authenticate(RequestFactory().get('/'), token)
+    AuthToken.objects.filter(pk=instance.pk).update(expiry=instance.expiry - timedelta(hours=1))
+
+    assert TokenAuthentication().authenticate(RequestFactory().get('/'), token) == user
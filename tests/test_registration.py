@@ -0,0 +1,79 @@
+import pytest
+from django.apps import apps
+from django.db import connection
+from django.db.migrations.state import ProjectState
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse_lazy
+
+from knightauth.registration import AddUniqueEmailIndex
+
+
+@pytest.fixture
+def unique_email_index():
+    operation = AddUniqueEmailIndex()
+    state = ProjectState.from_apps(apps)
+    with connection.schema_editor() as schema_editor:
+        operation.database_forwards('knightauth', schema_editor, state, state)
+    yield
+    with connection.schema_editor() as schema_editor:
+        operation.database_backwards('knightauth', schema_editor, state, state)
+
+
+def register(client, username='jane.doe', email='jane.doe@example.com', url='api-1.0.0:register_user'):
+    return client.post(
+        reverse_lazy(url),
+        data={
+            'username': username,
+            'email': email,
+            'password': 'Correct-Horse-42',
+            'password_confirm': 'Correct-Horse-42',
+        },
+        content_type='application/json'
+    )
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('url', ['api-1.0.0:register_user', 'async-api:register_user'])
+def test_register_maps_duplicate_username(user, client, django_user_model, url):
+    response = register(client, username='john.doe', url=url)
+
+    assert response.status_code == 400
+    assert response.json() == {'message': 'Username already exist'}
+    assert django_user_model.objects.count() == 1
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('url', ['api-1.0.0:register_user', 'async-api:register_user'])
+def test_register_rejects_duplicate_email(user, client, url):
+    response = register(client, email='john.doe@example.com', url=url)
+
+    assert response.status_code == 400
+    assert response.json() == {'message': 'Email already exist'}
+
+
+@pytest.mark.django_db
+def test_register_checks_email_and_inserts(client, django_user_model):
+    with CaptureQueriesContext(connection) as captured:
+        assert register(client).status_code == 201
+
+    statements = [query['sql'].split()[0] for query in captured]
+    assert statements.count('INSERT') == 1
+    assert statements.count('SELECT') == 1
+
+
+@pytest.mark.django_db(transaction=True)
+@override_settings(KNIGHT_AUTH={'UNIQUE_EMAIL_CONSTRAINT': True})
+@pytest.mark.parametrize('url', ['api-1.0.0:register_user', 'async-api:register_user'])
+def test_unique_email_constraint(user, client, django_user_model, unique_email_index, url):
+    with CaptureQueriesContext(connection) as captured:
+        assert register(client, url=url).status_code == 201
+    assert [query['sql'].split()[0] for query in captured if query['sql'].startswith(('SELECT', 'INSERT'))] == [
+        'INSERT'
+    ]
+
+    response = register(client, username='johnny', email='John.Doe@EXAMPLE.com', url=url)
+
+    assert response.status_code == 400
+    assert response.json() == {'message': 'Email already exist'}
+    assert django_user_model.objects.count() == 2
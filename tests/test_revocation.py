@@ -0,0 +1,91 @@
+import pytest
+from asgiref.sync import async_to_sync
+from django.db.models.signals import pre_delete
+from django.test import override_settings
+from django.urls import reverse_lazy
+
+from knightauth.cache import get_token_cache
+from knightauth.models import AuthToken, UserTokenState
+from knightauth.revocation import arevoke_all_tokens, revoke_all_tokens
+from knightauth.signals import tokens_revoked
+from tests.helpers import authenticate
+
+TOKEN_CACHE_SETTINGS = {'TOKEN_CACHE': 'knightauth.cache.TokenVerificationCache'}
+
+
+@pytest.fixture
+def revoked():
+    calls = []
+
+    def receiver(sender, **kwargs):
+        calls.append(kwargs)
+
+    tokens_revoked.connect(receiver)
+    yield calls
+    tokens_revoked.disconnect(receiver)
+
+
+@pytest.mark.django_db
+def test_revoke_all_is_a_single_delete_with_one_signal(user, revoked, django_assert_num_queries):
+    list(AuthToken.objects.bulk_issue(user, 50))
+    UserTokenState.objects.create(user=user)
+    deleted = []
+
+    def on_delete(sender, instance, **kwargs):
+        deleted.append(instance)
+
+    pre_delete.connect(on_delete, sender=AuthToken)
+    try:
+        # Bump the generation, then delete.
+        with django_assert_num_queries(2):
+            assert revoke_all_tokens(user) == 50
+    finally:
+        pre_delete.disconnect(on_delete, sender=AuthToken)
+
+    assert deleted == []
+    assert revoked == [{'signal': tokens_revoked, 'user_id': user.pk, 'count': 50}]
+    assert not AuthToken.objects.exists()
+
+
+@pytest.mark.django_db
+@override_settings(KNIGHT_AUTH=TOKEN_CACHE_SETTINGS)
+def test_revoke_all_invalidates_cached_tokens_by_generation(user, django_user_model):
+    other = django_user_model.objects.create_user(username='jane.doe', password='qwerty1200')
+    tokens = [AuthToken.objects.create(user=user)[1] for _ in range(3)]
+    _, other_token = AuthToken.objects.create(user=other)
+    for token in tokens + [other_token]:
+        assert authenticate(token) is not None
+    assert len(get_token_cache().local) == 4
+
+    revoke_all_tokens(user)
+
+    assert all(authenticate(token) is None for token in tokens)
+    assert authenticate(other_token) == other
+
+
+@pytest.mark.django_db
+@override_settings(KNIGHT_AUTH=TOKEN_CACHE_SETTINGS)
+def test_tokens_cached_after_revocation_stay_valid(user):
+    revoke_all_tokens(user)
+    _, token = AuthToken.objects.create(user=user)
+
+    assert authenticate(token) == user
+    assert authenticate(token) == user
+
+
+@pytest.mark.django_db
+def test_logout_all_without_tokens_is_rejected(user, client):
+    client.force_login(user)
+
+    response = client.post(reverse_lazy('api-1.0.0:token_logoutall'))
+
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_async_revoke_all(user, revoked):
+    list(AuthToken.objects.bulk_issue(user, 3))
+
+    assert async_to_sync(arevoke_all_tokens)(user.pk) == 3
+    assert revoked[0]['count'] == 3
+    assert not AuthToken.objects.exists()
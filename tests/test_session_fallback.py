@@ -0,0 +1,63 @@
+import pytest
+from django.conf import settings
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse_lazy
+
+from knightauth.models import AuthToken
+
+
+@pytest.fixture
+def session_client(client, user):
+    client.force_login(user)
+    return client
+
+
+def session_queries(captured):
+    return [query for query in captured if 'django_session' in query['sql']]
+
+
+@pytest.mark.django_db
+def test_invalid_token_fails_fast_without_session(session_client):
+    with CaptureQueriesContext(connection) as captured:
+        response = session_client.get(reverse_lazy('api-1.0.0:test'), HTTP_AUTHORIZATION='bogus-token')
+
+    assert response.status_code == 401
+    assert len(captured) == 1
+    assert not session_queries(captured)
+
+
+@pytest.mark.django_db
+def test_session_authenticates_without_token(session_client):
+    response = session_client.get(reverse_lazy('api-1.0.0:test'))
+
+    assert response.status_code == 200
+    assert response.json()['user'] == 'john.doe'
+
+
+@pytest.mark.django_db
+def test_token_logout_does_not_read_session(user, session_client):
+    _, token = AuthToken.objects.create(user)
+
+    with CaptureQueriesContext(connection) as captured:
+        response = session_client.post(reverse_lazy('api-1.0.0:token_logout'), HTTP_AUTHORIZATION=token)
+
+    assert response.status_code == 204
+    assert not session_queries(captured)
+
+
+@pytest.mark.django_db
+@override_settings(MIDDLEWARE=['knightauth.middleware.ServerTimingMiddleware'] + settings.MIDDLEWARE)
+def test_server_timing_shows_saved_session_read(user, session_client):
+    _, token = AuthToken.objects.create(user)
+
+    token_timing = session_client.get(reverse_lazy('api-1.0.0:test'), HTTP_AUTHORIZATION=token)['Server-Timing']
+    session_timing = session_client.get(reverse_lazy('api-1.0.0:test'))['Server-Timing']
+
+    assert token_timing.startswith('db;dur=')
+    assert '"1 queries"' in token_timing
+    assert 'session' not in token_timing
+    assert '"2 queries"' in session_timing
+    assert 'session;desc="read"' in session_timing
+    assert 'total;dur=' in session_timing
@@ -0,0 +1,176 @@
+from datetime import timedelta
+from unittest import mock
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import override_settings
+from django.urls import reverse_lazy
+
+from knightauth.auth import AsyncTokenAuthentication, TokenAuthentication
+from knightauth.expiry import delete_expired_tokens
+from knightauth.models import AuthToken, CompactAuthToken, DeniedToken
+from knightauth.revocation import revoke_all_tokens
+from knightauth.signing import denylist, is_signed_token, load_signed_token, unsign_token
+from tests.helpers import authenticate
+
+SIGNED = {'SIGNED_TOKENS': True}
+
+
+def login(client):
+    return client.post(
+        reverse_lazy('api-1.0.0:token_login'),
+        data={'username': 'john.doe', 'password': 'qwerty1200'},
+        content_type='application/json'
+    ).json()['token']
+
+
+@pytest.mark.django_db
+@override_settings(KNIGHT_AUTH=SIGNED)
+def test_signed_token_verifies_without_queries(user, client, django_assert_num_queries):
+    token = login(client)
+    assert is_signed_token(token)
+    assert AuthToken.objects.filter(user=user).count() == 1
+
+    authenticate(token)
+    with django_assert_num_queries(0):
+        request_user, auth_token = TokenAuthentication().authenticate_credentials(token)
+    assert auth_token.is_signed
+
+    assert request_user == user
+
+
+@pytest.mark.django_db
+@override_settings(KNIGHT_AUTH=SIGNED)
+def test_tampered_and_expired_signed_tokens_are_rejected(user):
+    _, token = AuthToken.objects.create(user=user)
+    _, expired = AuthToken.objects.create(user=user, expiry=timedelta(seconds=-1))
+
+    assert authenticate(token[:-1] + ('0' if token[-1] != '0' else '1')) is None
+    assert authenticate(expired) is None
+
+
+@pytest.mark.django_db
+def test_both_formats_are_accepted(user):
+    _, stateful = AuthToken.objects.create(user=user)
+
+    with override_settings(KNIGHT_AUTH=SIGNED):
+        _, signed = AuthToken.objects.create(user=user)
+
+        assert authenticate(stateful) == user
+        assert authenticate(signed) == user
+
+    # Signed tokens are only honoured while SIGNED_TOKENS is enabled.
+    assert authenticate(signed) is None
+
+
+@pytest.mark.django_db
+@override_settings(KNIGHT_AUTH=SIGNED)
+def test_logout_denies_the_signed_token(user, client):
+    token = login(client)
+    other = login(client)
+
+    response = client.post(reverse_lazy('api-1.0.0:token_logout'), HTTP_AUTHORIZATION=token)
+
+    assert response.status_code == 204
+    assert authenticate(token) is None
+    assert authenticate(other) == user
+    assert AuthToken.objects.filter(user=user).count() == 1
+    assert DeniedToken.objects.count() == 1
+
+
+@pytest.mark.django_db
+@override_settings(KNIGHT_AUTH=SIGNED)
+def test_logout_all_and_deactivation_deny_signed_tokens(user, client):
+    token = login(client)
+    client.post(reverse_lazy('api-1.0.0:token_logoutall'), HTTP_AUTHORIZATION=token)
+    assert authenticate(token) is None
+
+    token = login(client)
+    user.is_active = False
+    user.save()
+    assert authenticate(token) is None
+
+
+@pytest.mark.django_db
+@override_settings(KNIGHT_AUTH={**SIGNED, 'SIGNED_TOKEN_DENYLIST_TTL': 0})
+def test_denylist_is_shared_through_the_database(user):
+    instance, token = AuthToken.objects.create(user=user)
+    assert authenticate(token) == user
+
+    # Denied by another process.
+    DeniedToken.objects.create(jti=instance.jti, expiry=instance.expiry)
+
+    assert authenticate(token) is None
+
+
+@pytest.mark.django_db
+@override_settings(KNIGHT_AUTH=SIGNED)
+def test_expired_denylist_entries_are_purged(user):
+    instance, _ = AuthToken.objects.create(user=user, expiry=timedelta(seconds=-1))
+    denylist.deny([(instance.jti, instance.expiry)])
+
+    delete_expired_tokens()
+
+    assert not DeniedToken.objects.exists()
+
+
+@pytest.mark.django_db
+@override_settings(KNIGHT_AUTH={**SIGNED, 'SIGNED_TOKEN_MAX_AGE': timedelta(days=1)})
+def test_payload_carries_an_opaque_id_and_a_bounded_expiry(user):
+    instance, token = AuthToken.objects.create(user=user, expiry=None)
+
+    payload = unsign_token(token)
+    assert payload['j'] == instance.jti
+    assert instance.pk not in token
+    assert payload['e'] == int((instance.created + timedelta(days=1)).timestamp())
+
+
+@pytest.mark.django_db
+@override_settings(KNIGHT_AUTH={**SIGNED, 'SIGNED_TOKEN_MAX_AGE': timedelta(days=1)})
+def test_denylist_entries_of_tokens_without_expiry_are_purged(user):
+    AuthToken.objects.create(user=user, expiry=None)
+    revoke_all_tokens(user)
+    denied = DeniedToken.objects.get()
+    assert denied.expiry is not None
+
+    with mock.patch('django.utils.timezone.now', return_value=denied.expiry + timedelta(seconds=1)):
+        delete_expired_tokens()
+
+    assert not DeniedToken.objects.exists()
+
+
+@pytest.mark.django_db
+@override_settings(KNIGHT_AUTH=SIGNED)
+def test_introspection_and_listing_find_the_signed_token(user, client):
+    token = login(client)
+    login(client)
+
+    introspected = client.get(reverse_lazy('api-1.0.0:token_introspect'), HTTP_AUTHORIZATION=token)
+    listed = client.get(reverse_lazy('api-1.0.0:token_list'), HTTP_AUTHORIZATION=token)
+
+    assert introspected.status_code == 200
+    assert introspected.json()['current'] is True
+    assert [item['current'] for item in listed.json()['items']].count(True) == 1
+
+
+@pytest.mark.django_db
+@override_settings(KNIGHT_AUTH={**SIGNED, 'TOKEN_MODEL': 'knightauth.CompactAuthToken'})
+def test_signed_compact_tokens(user):
+    instance, token = CompactAuthToken.objects.create(user=user)
+
+    assert authenticate(token) == user
+    auth_token = TokenAuthentication().authenticate_credentials(token)[1]
+    assert auth_token.jti == instance.jti
+    assert load_signed_token(auth_token)
+    assert auth_token.pk == instance.pk
+
+
+@pytest.mark.django_db
+@override_settings(KNIGHT_AUTH=SIGNED)
+def test_async_signed_token(user):
+    _, token = AuthToken.objects.create(user=user)
+
+    request_user, auth_token = async_to_sync(AsyncTokenAuthentication().authenticate_credentials)(token)
+
+    assert request_user == user
+    assert auth_token.is_signed
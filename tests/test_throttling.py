@@ -0,0 +1,97 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+from django.test import RequestFactory, override_settings
+from django.urls import reverse_lazy
+
+from knightauth import api
+from knightauth.throttling import CacheThrottleStore, LoginThrottle, parse_rate
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # The start of a one minute window.
+    clock = SimpleNamespace(now=960_000.0)
+    monkeypatch.setattr(
+        'knightauth.throttling.time',
+        SimpleNamespace(time=lambda: clock.now, monotonic=time.monotonic)
+    )
+    return clock
+
+
+def login(client, url='api-1.0.0:token_login', password='wrong', **extra):
+    return client.post(
+        reverse_lazy(url),
+        data={'username': 'john.doe', 'password': password},
+        content_type='application/json',
+        **extra
+    )
+
+
+def test_parse_rate():
+    assert parse_rate('5/min') == (5, 60)
+    assert parse_rate('100/10s') == (100, 10)
+    assert parse_rate('1000/day') == (1000, 86400)
+    with pytest.raises(ValueError):
+        parse_rate('5 per minute')
+
+
+@pytest.mark.django_db
+@override_settings(KNIGHT_AUTH={'LOGIN_THROTTLE_RATES': {'username': '2/min'}})
+def test_token_login_is_throttled_before_authenticating(user, client, monkeypatch):
+    calls = []
+    authenticate = api.authenticate
+    monkeypatch.setattr(api, 'authenticate', lambda *args, **kwargs: calls.append(1) or authenticate(*args, **kwargs))
+
+    assert login(client).status_code == 401
+    assert login(client).status_code == 401
+    response = login(client, password='qwerty1200')
+
+    assert response.status_code == 429
+    assert int(response['Retry-After']) > 0
+    assert len(calls) == 2
+
+
+@pytest.mark.django_db
+@override_settings(KNIGHT_AUTH={'LOGIN_THROTTLE_RATES': {'ip': '1/min'}})
+def test_ip_limit_applies_across_endpoints(user, client):
+    assert login(client, REMOTE_ADDR='10.0.0.1').status_code == 401
+
+    assert login(client, url='api-1.0.0:session_login', REMOTE_ADDR='10.0.0.1').status_code == 429
+    assert login(client, url='async-api:token_login', REMOTE_ADDR='10.0.0.1').status_code == 429
+    assert login(client, REMOTE_ADDR='10.0.0.2').status_code == 401
+
+
+@pytest.mark.django_db
+@override_settings(KNIGHT_AUTH={
+    'LOGIN_THROTTLE_RATES': {'ip': '1/min'},
+    'LOGIN_THROTTLE_IP_META': 'HTTP_X_FORWARDED_FOR',
+    'LOGIN_THROTTLE_TRUSTED_PROXIES': 2,
+})
+def test_forged_forwarded_for_entries_do_not_evade_the_ip_limit(user, client):
+    # The client sends the first entry, the two proxies append the others.
+    assert login(client, HTTP_X_FORWARDED_FOR='1.1.1.1, 10.0.0.1, 192.168.0.1').status_code == 401
+
+    assert login(client, HTTP_X_FORWARDED_FOR='2.2.2.2, 10.0.0.1, 192.168.0.1').status_code == 429
+    assert login(client, HTTP_X_FORWARDED_FOR='10.0.0.2, 192.168.0.1').status_code == 401
+
+
+@pytest.mark.parametrize('store', [None, CacheThrottleStore('default')])
+def test_sliding_window(clock, store):
+    throttle = LoginThrottle({'global': '4/min'}, store=store)
+    request = RequestFactory().post('/')
+    throttle.store.clear()
+
+    for _ in range(4):
+        assert throttle.allow(request, 'john.doe') is None
+    assert throttle.allow(request, 'john.doe') == 60
+
+    # 50 of the previous window's 60 seconds still overlap: 4 * 5/6 attempts.
+    clock.now += 70
+    assert throttle.allow(request, 'john.doe') is None
+    assert throttle.allow(request, 'john.doe') == 5
+
+
+def test_throttling_is_disabled_without_rates():
+    assert LoginThrottle({}).allow(RequestFactory().post('/'), 'john.doe') is None
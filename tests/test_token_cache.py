@@ -0,0 +1,84 @@
+import time
+from datetime import timedelta
+
+import pytest
+from django.urls import reverse_lazy
+
+from knightauth.cache import LocalTokenCache, get_token_cache
+from knightauth.crypto import hash_token
+from knightauth.models import AuthToken
+from tests.helpers import authenticate
+
+TOKEN_CACHE_SETTINGS = {'TOKEN_CACHE': 'knightauth.cache.TokenVerificationCache'}
+
+
+@pytest.fixture
+def token_cache(settings):
+    settings.KNIGHT_AUTH = TOKEN_CACHE_SETTINGS
+    return get_token_cache()
+
+
+def test_local_cache_evicts_least_recently_used():
+    cache = LocalTokenCache(max_size=2, timeout=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+
+
+def test_local_cache_entries_expire():
+    cache = LocalTokenCache(max_size=2, timeout=0.01)
+    cache.set('a', 1)
+    time.sleep(0.02)
+
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+@pytest.mark.django_db
+def test_cached_authentication_makes_no_queries(user, token_cache, django_assert_num_queries):
+    _, token = AuthToken.objects.create(user=user)
+    authenticate(token)
+
+    with django_assert_num_queries(0):
+        auth_user = authenticate(token)
+
+    assert auth_user == user
+
+
+@pytest.mark.django_db
+def test_logout_invalidates_cached_token(user, token_cache, client):
+    _, token = AuthToken.objects.create(user=user)
+    authenticate(token)
+
+    client.post(reverse_lazy('api-1.0.0:token_logout'), content_type='application/json', HTTP_AUTHORIZATION=token)
+
+    assert token_cache.get(hash_token(token)) is None
+    assert authenticate(token) is None
+
+
+@pytest.mark.django_db
+def test_deactivating_user_invalidates_cached_tokens(user, token_cache):
+    _, token = AuthToken.objects.create(user=user)
+    authenticate(token)
+
+    user.is_active = False
+    user.save()
+
+    assert authenticate(token) is None
+
+
+@pytest.mark.django_db
+def test_cached_token_expiry_is_enforced(user, token_cache):
+    instance, token = AuthToken.objects.create(user=user)
+    authenticate(token)
+
+    AuthToken.objects.filter(pk=instance.pk).update(expiry=instance.expiry - timedelta(days=1))
+    token_cache.set(hash_token(token), token_cache.get(hash_token(token))._replace(expiry=instance.expiry - timedelta(days=1)))
+
+    assert authenticate(token) is None
+    assert AuthToken.objects.count() == 0
@@ -0,0 +1,167 @@
+from io import StringIO
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.test import RequestFactory, override_settings
+
+from knightauth import crypto
+from knightauth.auth import AsyncTokenAuthentication
+from knightauth.models import AuthToken
+from knightauth.revocation import bump_token_generation
+from knightauth.token_filter import BloomFilter, LiveTokenFilter, get_token_filter, warm_up_token_filter
+from tests.helpers import authenticate
+
+TOKEN_FILTER_SETTINGS = {
+    'NEGATIVE_TOKEN_CACHE': 'knightauth.cache.NegativeTokenCache',
+    'TOKEN_FILTER': True,
+    'TOKEN_FILTER_CAPACITY': 1000,
+    'TOKEN_FILTER_SYNC_INTERVAL': 60,
+}
+
+
+@pytest.fixture
+def token_filter(settings):
+    settings.KNIGHT_AUTH = TOKEN_FILTER_SETTINGS
+    return get_token_filter()
+
+
+def insert_token(user, token=None):
+    """Store a token the way another process would, without signals reaching this one."""
+    token = token or crypto.create_token_string()
+    AuthToken.objects.bulk_create([
+        AuthToken(**AuthToken.objects._token_fields(user, token, crypto.get_digest_scheme(), None, 0))
+    ])
+    return token
+
+
+def test_bloom_filter_has_no_false_negatives_and_bounded_false_positives():
+    bloom = BloomFilter.for_capacity(5000, 0.01)
+    for index in range(5000):
+        bloom.add('key-%d' % index)
+
+    assert all('key-%d' % index in bloom for index in range(5000))
+    false_positives = sum('other-%d' % index in bloom for index in range(20000))
+    assert false_positives / 20000 < 0.02
+
+
+def test_snapshot_is_mapped_copy_on_write(tmp_path):
+    path = str(tmp_path / 'tokens.filter')
+    bloom = BloomFilter.for_capacity(100, 0.01)
+    bloom.add('a')
+    bloom.save(path, synced_at=1.5)
+
+    loaded, synced_at = BloomFilter.load(path)
+    loaded.add('b')
+
+    assert ('a' in loaded, 'b' in loaded, synced_at) == (True, True, 1.5)
+    assert 'b' not in BloomFilter.load(path)[0]
+
+
+def test_loading_something_else_fails(tmp_path):
+    path = tmp_path / 'tokens.filter'
+    path.write_bytes(b'not a filter')
+
+    with pytest.raises(ValueError):
+        BloomFilter.load(str(path))
+
+
+def test_filter_requires_the_negative_cache():
+    with override_settings(KNIGHT_AUTH={'TOKEN_FILTER': True}):
+        with pytest.raises(ImproperlyConfigured):
+            get_token_filter()
+
+
+@pytest.mark.django_db
+def test_repeated_unknown_token_makes_no_queries(token_filter, django_assert_num_queries):
+    with django_assert_num_queries(1):
+        assert authenticate('unknown-token') is None
+
+    with django_assert_num_queries(0):
+        assert authenticate('unknown-token') is None
+
+
+@pytest.mark.django_db
+def test_tokens_issued_in_process_are_added(user, token_filter):
+    _, token = AuthToken.objects.create(user=user)
+    _, issued = next(AuthToken.objects.bulk_issue(user, 1))
+
+    assert authenticate(token) == user
+    assert authenticate(issued) == user
+
+
+@pytest.mark.django_db
+def test_build_scans_live_tokens(user):
+    revoked = insert_token(user)
+    bump_token_generation(user.pk)
+    _, token = AuthToken.objects.create(user=user)
+    token_filter = LiveTokenFilter(capacity=100, error_rate=0.01)
+    token_filter.build(chunk_size=1)
+
+    assert token_filter.might_exist(AuthToken.get_token_key(token))
+    assert AuthToken.get_token_key(revoked) not in token_filter.filter
+
+
+@pytest.mark.django_db
+def test_tokens_of_other_processes_authenticate_right_away(user, token_filter):
+    token = insert_token(user)
+
+    assert authenticate(token) == user
+
+
+@pytest.mark.django_db
+def test_tokens_of_other_processes_override_remembered_keys(user, token_filter):
+    token = 'a' * 64
+    assert authenticate(token) is None
+    insert_token(user, token)
+
+    token_filter._next_sync = 0
+    assert authenticate(token) == user
+
+
+@pytest.mark.django_db
+def test_workers_load_the_snapshot_and_catch_up(user, tmp_path, django_assert_num_queries):
+    path = str(tmp_path / 'tokens.filter')
+    old_token = insert_token(user)
+    call_command('build_token_filter', output=path, stdout=StringIO())
+    new_token = insert_token(user)
+
+    with override_settings(KNIGHT_AUTH={**TOKEN_FILTER_SETTINGS, 'TOKEN_FILTER_SNAPSHOT': path}):
+        # Mapping the snapshot takes only the catch-up query.
+        with django_assert_num_queries(1):
+            token_filter = get_token_filter()
+
+        assert token_filter.might_exist(AuthToken.get_token_key(old_token))
+        assert token_filter.might_exist(AuthToken.get_token_key(new_token))
+
+
+@pytest.mark.django_db
+def test_warm_up_builds_the_filter_before_the_first_request(user, django_assert_num_queries):
+    token = insert_token(user)
+
+    with override_settings(KNIGHT_AUTH=TOKEN_FILTER_SETTINGS):
+        token_filter = warm_up_token_filter()
+
+        with django_assert_num_queries(0):
+            assert get_token_filter() is token_filter
+        assert token_filter.might_exist(AuthToken.get_token_key(token))
+
+
+def test_warm_up_does_nothing_when_the_filter_is_disabled():
+    assert warm_up_token_filter() is None
+
+
+@pytest.mark.django_db(transaction=True)
+def test_async_authentication_consults_the_filter(user, token_filter, django_assert_num_queries):
+    auth = AsyncTokenAuthentication()
+    request = RequestFactory().get('/')
+    token = 'a' * 64
+    async_to_sync(auth.authenticate)(request, token)
+
+    with django_assert_num_queries(0):
+        assert async_to_sync(auth.authenticate)(request, token) is None
+
+    insert_token(user, token)
+    token_filter._next_sync = 0
+    assert async_to_sync(auth.authenticate)(request, token) == user
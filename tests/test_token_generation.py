@@ -0,0 +1,63 @@
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import override_settings
+
+from knightauth.auth import AsyncTokenAuthentication
+from knightauth.expiry import delete_expired_tokens
+from knightauth.models import AuthToken, UserTokenState
+from knightauth.revocation import invalidate_all_tokens
+from tests.helpers import authenticate
+
+
+@pytest.mark.django_db
+def test_creating_a_user_does_not_bump_the_generation(user):
+    assert not UserTokenState.objects.exists()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('knight_auth', [{}, {'TOKEN_CACHE': 'knightauth.cache.TokenVerificationCache'}])
+def test_password_change_revokes_existing_tokens(user, knight_auth):
+    with override_settings(KNIGHT_AUTH=knight_auth):
+        _, old_token = AuthToken.objects.create(user=user)
+        assert authenticate(old_token) == user
+
+        user.set_password('new-password-1200')
+        user.save()
+
+        _, new_token = AuthToken.objects.create(user=user)
+        assert authenticate(old_token) is None
+        assert authenticate(new_token) == user
+
+
+@pytest.mark.django_db
+def test_revoked_rows_are_deleted_lazily(user, django_user_model):
+    other = django_user_model.objects.create_user(username='jane.doe', password='qwerty1200')
+    list(AuthToken.objects.bulk_issue(user, 3))
+    AuthToken.objects.create(user=other)
+
+    invalidate_all_tokens(user)
+    assert AuthToken.objects.count() == 4
+
+    _, token = AuthToken.objects.create(user=user)
+    delete_expired_tokens()
+
+    assert AuthToken.objects.count() == 2
+    assert authenticate(token) == user
+
+
+@pytest.mark.django_db
+@override_settings(KNIGHT_AUTH={'TOKEN_LIMIT_PER_USER': 2})
+def test_revoked_tokens_free_their_slots(user):
+    UserTokenState.objects.create(user=user, token_count=2)
+
+    invalidate_all_tokens(user)
+
+    assert UserTokenState.objects.get(user=user).token_count == 0
+
+
+@pytest.mark.django_db
+def test_async_authentication_rejects_revoked_tokens(user):
+    _, token = AuthToken.objects.create(user=user)
+    invalidate_all_tokens(user)
+
+    assert async_to_sync(AsyncTokenAuthentication().authenticate_credentials)(token) == (None, None)
@@ -0,0 +1,132 @@
+from datetime import timedelta
+
+import pytest
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse, reverse_lazy
+
+from knightauth.admin import AuthTokenAdmin
+from knightauth.models import AuthToken
+from knightauth.pagination import InvalidCursor, KeysetPaginator
+from knightauth.revocation import invalidate_all_tokens
+
+
+def issue(user, count):
+    return [token for _, token in AuthToken.objects.bulk_issue(user, count)]
+
+
+def list_tokens(client, token, url='api-1.0.0:token_list', **params):
+    return client.get(reverse_lazy(url), params, HTTP_AUTHORIZATION=token)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('url', ['api-1.0.0:token_list', 'async-api:token_list'])
+def test_list_tokens_pages_with_cursor(user, client, django_user_model, url):
+    tokens = issue(user, 5)
+    other = django_user_model.objects.create_user(username='jane.doe', password='qwerty1200')
+    issue(other, 2)
+
+    seen = []
+    cursor = None
+    while True:
+        params = {'limit': 2}
+        if cursor:
+            params['cursor'] = cursor
+        response = list_tokens(client, tokens[0], url, **params)
+        assert response.status_code == 200
+        page = response.json()
+        seen.extend(page['items'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+
+    assert len(seen) == 5
+    assert sorted(item['token_key'] for item in seen) == sorted(AuthToken.get_token_key(token) for token in tokens)
+    assert [item['created'] for item in seen] == sorted((item['created'] for item in seen), reverse=True)
+    assert sum(item['current'] for item in seen) == 1
+
+
+@pytest.mark.django_db
+def test_list_tokens_skips_expired_and_revoked(user, client):
+    token = issue(user, 1)[0]
+    AuthToken.objects.create(user, expiry=timedelta(seconds=-1))
+
+    assert len(list_tokens(client, token).json()['items']) == 1
+
+    invalidate_all_tokens(user)
+    fresh = issue(user, 1)[0]
+    items = list_tokens(client, fresh).json()['items']
+    assert [item['token_key'] for item in items] == [AuthToken.get_token_key(fresh)]
+
+
+@pytest.mark.django_db
+def test_list_tokens_page_is_one_query(user, client):
+    token = issue(user, 3)[0]
+    cursor = list_tokens(client, token, limit=1).json()['next_cursor']
+
+    with CaptureQueriesContext(connection) as captured:
+        assert list_tokens(client, token, limit=1, cursor=cursor).status_code == 200
+
+    # Authentication, then the page itself.
+    assert len(captured) == 2
+    assert 'OFFSET' not in captured[-1]['sql']
+    assert 'COUNT' not in captured[-1]['sql']
+
+
+@pytest.mark.django_db
+def test_list_tokens_rejects_bad_cursor(user, client):
+    token = issue(user, 1)[0]
+
+    response = list_tokens(client, token, cursor='not-a-cursor')
+
+    assert response.status_code == 400
+    assert list_tokens(client, token, limit=1000).status_code == 422
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('url', ['api-1.0.0:token_introspect', 'async-api:token_introspect'])
+@pytest.mark.parametrize('knight_auth', [{}, {'TOKEN_CACHE': 'knightauth.cache.TokenVerificationCache'}])
+def test_introspect_current_token(user, client, url, knight_auth):
+    with override_settings(KNIGHT_AUTH=knight_auth):
+        token = issue(user, 1)[0]
+        client.get(reverse_lazy(url), HTTP_AUTHORIZATION=token)
+        response = client.get(reverse_lazy(url), HTTP_AUTHORIZATION=token)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body['token_key'] == AuthToken.get_token_key(token)
+    assert body['current'] is True
+    assert body['created'] is not None
+
+
+@pytest.mark.django_db
+def test_keyset_paginator_decodes_cursor(user):
+    issue(user, 3)
+    paginator = KeysetPaginator(AuthToken.objects.all(), per_page=2)
+
+    rows, cursor = paginator.page()
+    assert paginator.decode_cursor(cursor) == [rows[-1].created, rows[-1].pk]
+    with pytest.raises(InvalidCursor):
+        paginator.decode_cursor('W10')
+
+
+@pytest.mark.django_db
+def test_admin_changelist_uses_cursor_without_count(user, admin_client, monkeypatch):
+    issue(user, 5)
+    monkeypatch.setattr(AuthTokenAdmin, 'list_per_page', 2)
+    url = reverse('admin:knightauth_authtoken_changelist')
+
+    listed = []
+    next_url = url
+    while next_url:
+        with CaptureQueriesContext(connection) as captured:
+            response = admin_client.get(next_url)
+        assert response.status_code == 200
+        assert not [query for query in captured if 'COUNT(' in query['sql'] and 'knightauth_authtoken' in query['sql']]
+        changelist = response.context['cl']
+        listed.extend(token.pk for token in changelist.result_list)
+        next_url = url + changelist.next_page_url if changelist.next_page_url else None
+
+    assert listed == list(AuthToken.objects.order_by('-created', '-pk').values_list('pk', flat=True))
+    assert admin_client.get(url + '?cursor=bogus').status_code == 302
@@ -0,0 +1,51 @@
+import pytest
+from django.test import override_settings
+from django.urls import reverse_lazy
+
+from knightauth.auth import TokenAuthentication
+from knightauth.models import AuthToken
+
+
+@pytest.mark.django_db
+def test_authenticate_credentials_uses_one_query(user, django_assert_num_queries):
+    for _ in range(3):
+        AuthToken.objects.create(user=user)
+    _, token = AuthToken.objects.create(user=user)
+
+    with django_assert_num_queries(1):
+        auth_user, auth_token = TokenAuthentication().authenticate_credentials(token)
+        assert auth_user.get_username() == 'john.doe'
+        assert auth_token.user is auth_user
+
+
+@pytest.mark.django_db
+def test_authenticated_request_uses_one_query(user, client, django_assert_num_queries):
+    _, token = AuthToken.objects.create(user=user)
+
+    with django_assert_num_queries(1):
+        response = client.get(reverse_lazy('api-1.0.0:test'), HTTP_AUTHORIZATION=token)
+
+    assert response.json()['user'] == 'john.doe'
+
+
+@pytest.mark.django_db
+@override_settings(KNIGHT_AUTH={'DEFER_USER': True})
+def test_deferred_user_is_loaded_on_access(user, django_assert_num_queries):
+    _, token = AuthToken.objects.create(user=user)
+
+    with django_assert_num_queries(1):
+        auth_user, auth_token = TokenAuthentication().authenticate_credentials(token)
+        assert auth_token.user_id == user.pk
+
+    with django_assert_num_queries(1):
+        assert auth_user.get_username() == 'john.doe'
+
+
+@pytest.mark.django_db
+@override_settings(KNIGHT_AUTH={'DEFER_USER': True})
+def test_deferred_user_rejects_inactive_user(user):
+    _, token = AuthToken.objects.create(user=user)
+    user.is_active = False
+    user.save()
+
+    assert TokenAuthentication().authenticate_credentials(token) == (None, None)
@@ -0,0 +1,92 @@
+import pytest
+from django.contrib.auth.password_validation import CommonPasswordValidator, MinimumLengthValidator
+from django.test import override_settings
+from django.urls import reverse_lazy
+
+from knightauth.schemas import UserRegisterSchema
+from knightauth.validation import (
+    CompactCommonPasswordValidator,
+    MappedPasswordList,
+    RegistrationValidator,
+    get_registration_validator,
+    write_password_list,
+)
+
+VALIDATORS = [
+    {'NAME': 'django.contrib.auth.password_validation.CommonPasswordValidator'},
+    {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
+]
+
+
+def payload(password='Correct-Horse-42', password_confirm=None, email='jane.doe@example.com'):
+    return UserRegisterSchema(
+        username='jane.doe',
+        email=email,
+        password=password,
+        password_confirm=password if password_confirm is None else password_confirm,
+    )
+
+
+def test_mapped_password_list(tmp_path):
+    path = tmp_path / 'passwords.txt'
+    write_password_list(['password', 'qwerty', 'abc123', 'zzzzzz', 'password'], path)
+    passwords = MappedPasswordList(path)
+
+    assert len(passwords) == 4
+    for password in ('abc123', 'password', 'qwerty', 'zzzzzz'):
+        assert password in passwords
+    for password in ('', 'aaa', 'passwor', 'password1', 'zzzzzzz'):
+        assert password not in passwords
+
+    write_password_list([], path)
+    assert 'password' not in MappedPasswordList(path)
+
+
+def test_compact_validator_writes_and_reuses_snapshot(tmp_path):
+    path = tmp_path / 'common-passwords.txt'
+    validator = CompactCommonPasswordValidator(mmap_path=path)
+
+    assert path.exists()
+    assert isinstance(validator.passwords, MappedPasswordList)
+    assert len(validator.passwords) == len(CommonPasswordValidator().passwords)
+    assert 'password' in CompactCommonPasswordValidator(mmap_path=path).passwords
+    assert isinstance(CompactCommonPasswordValidator().passwords, frozenset)
+
+
+@override_settings(AUTH_PASSWORD_VALIDATORS=VALIDATORS)
+def test_pipeline_runs_cheap_checks_first():
+    validator = get_registration_validator()
+
+    assert [type(v) for v in validator.password_validators] == [MinimumLengthValidator, CommonPasswordValidator]
+    assert validator.validate(payload(password='password', password_confirm='other')) == "Password does not match"
+    assert validator.validate(payload(password='password', email='not-an-email')) == ['Enter a valid email address.']
+    assert len(validator.validate(payload(password='qwerty'))) == 2
+    assert validator.validate(payload()) is None
+
+
+def test_pipeline_is_rebuilt_when_validators_change():
+    validator = get_registration_validator()
+    assert get_registration_validator() is validator
+
+    with override_settings(AUTH_PASSWORD_VALIDATORS=[]):
+        assert get_registration_validator() is not validator
+        assert RegistrationValidator().validate(payload(password='1')) is None
+
+
+@pytest.mark.django_db
+@override_settings(AUTH_PASSWORD_VALIDATORS=VALIDATORS)
+def test_register_reports_mismatch_before_weak_password(client, django_user_model):
+    response = client.post(
+        reverse_lazy('api-1.0.0:register_user'),
+        data={
+            'username': 'jane.doe',
+            'email': 'jane.doe@example.com',
+            'password': 'password',
+            'password_confirm': 'qwerty',
+        },
+        content_type='application/json'
+    )
+
+    assert response.status_code == 400
+    assert response.json() == {'message': 'Password does not match'}
+    assert not django_user_model.objects.exists()